@@ -67,6 +67,12 @@ class Runner:
         parser.add_argument("--simple", action='store_true', help="optionally simplify UI")
         parser.add_argument("--debug", action='store_true', help="option to run in debug mode")
         parser.add_argument("--suggest", help="optional row to turn into suggestions")
+        parser.add_argument("--fast-render", action='store_true',
+                            help="option to render documents without the token templates (same output, faster)")
+        parser.add_argument("--window", type=int, default=0,
+                            help="optional number of sentences to render at a time for long documents")
+        parser.add_argument("-w", "--workers", type=int, default=1,
+                            help="optional number of processes for building the search index (default is 1)")
         return parser.parse_args()
 
     def _process_args(self, args):
@@ -110,6 +116,9 @@ class Runner:
         app.config['dragonfly.output'] = args.output
         app.config['dragonfly.tags'] = args.tags
         app.config['dragonfly.suggest'] = args.suggest
+        app.config['dragonfly.fast_render'] = args.fast_render
+        app.config['dragonfly.window'] = max(0, args.window)
+        app.config['dragonfly.index_workers'] = max(1, args.workers)
 
         modes = set()
         if args.rtl:
@@ -144,7 +153,7 @@ class Runner:
             app.config['dragonfly.cmd'] = 'annotate'
 
         app.locator = ResourceLocator(app.config)
-        app.locator.local_search.load_index(bg=True, build=True)
+        app.locator.warm_up()
 
         self.suppress_dict_labels = app.locator.settings['Suppress Dictionary Labels']
         app.jinja_env.filters['preprocess_text'] = self._preprocess_text
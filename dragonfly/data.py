@@ -2,9 +2,11 @@
 # All rights reserved.
 # Distributed under the terms of the Apache 2.0 License.
 
+import collections
 import csv
 import glob
 import os
+import threading
 
 
 class FileLister:
@@ -125,6 +127,36 @@ class Document:
     def attach_markers(self, markers):
         self.markers = markers
 
+    def copy(self):
+        """Copy that can have annotations and suggestions attached without changing this document"""
+        return Document(self.filename, [sentence.copy() for sentence in self.sentences], self.terminal_blank_line)
+
+    def annotation_tokens(self, sentences=None):
+        """
+        Tokens and tags in the format that the page saves with an empty dictionary between sentences
+        :param sentences: optional dictionary of sentence index -> token dictionaries that replace the attached tags
+        :return: list of dictionaries with token and tag
+        """
+        sentences = sentences or {}
+        tokens = []
+        for index, sentence in enumerate(self.sentences):
+            row = sentence.rows[Sentence.TOKEN]
+            if index in sentences:
+                if [token['token'] for token in sentences[index]] != row.strings:
+                    raise ValueError("Sentence {} does not match the document".format(index))
+                tokens.extend(sentences[index])
+            else:
+                tags = row.annotations if row.annotations else ['O'] * len(row.strings)
+                tokens.extend({'token': token, 'tag': tag} for token, tag in zip(row.strings, tags))
+            tokens.append({})
+        if not self.terminal_blank_line:
+            tokens.pop()
+        return tokens
+
+    def types(self):
+        """Set of the distinct lower cased tokens"""
+        return {token.lower() for sentence in self.sentences for token in sentence.rows[Sentence.TOKEN].strings}
+
     def convert_row_to_suggestions(self, label):
         for sentence in self.sentences:
             sentence.convert_row_to_suggestions(label)
@@ -177,6 +209,11 @@ class Sentence:
     def add(self, row):
         self.rows.append(row)
 
+    def copy(self):
+        sentence = Sentence(self.index)
+        sentence.rows = [row.copy() for row in self.rows]
+        return sentence
+
     def append(self, index, string):
         """append a new string to a particular row"""
         self.rows[index].append(string)
@@ -220,10 +257,15 @@ class SentenceRow:
         self.annotations = []
         self.adjudicate = False
         self.suggestions = []
+        self.glosses = []
 
     def append(self, string):
         self.strings.append(string)
 
+    def copy(self):
+        """Copy without annotations, suggestions or glosses (the strings are shared)"""
+        return SentenceRow(self.index, self.label, self.strings)
+
     def attach(self, annotations):
         self.annotations = annotations
 
@@ -233,6 +275,15 @@ class SentenceRow:
     def has_suggestions(self):
         return bool(self.suggestions)
 
+    def set_glosses(self, matches):
+        """
+        :param matches: list of (start, end, (translation, entity type, source)) of dictionary entries
+        """
+        self.glosses = [None] * len(self.strings)
+        for start, end, value in matches:
+            for i in range(start, end):
+                self.glosses[i] = value
+
     @property
     def length(self):
         return len(self.strings)
@@ -316,6 +367,53 @@ class InputReader:
         return sentence
 
 
+class DocumentCache:
+    """
+    LRU cache of parsed source documents.
+
+    A document is parsed again when its file changes. The least recently used documents
+    are dropped once the source files of the cached documents pass max_size bytes.
+    Callers get a copy to attach annotations, translations and markers to.
+    """
+    MAX_SIZE = 64 * 1024 * 1024
+
+    def __init__(self, max_size=MAX_SIZE):
+        self.max_size = max_size
+        self.size = 0
+        self._documents = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, filename):
+        """
+        :param filename: path of the source tsv file
+        :return: Document
+        """
+        stat = os.stat(filename)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            if filename in self._documents and self._documents[filename][0] == stamp:
+                self._documents.move_to_end(filename)
+                return self._documents[filename][1].copy()
+        reader = InputReader(filename)
+        document = Document(filename, reader.sentences, reader.terminal_blank_line)
+        with self._lock:
+            self._remove(filename)
+            if stat.st_size <= self.max_size:
+                self._documents[filename] = (stamp, document)
+                self.size += stat.st_size
+                while self.size > self.max_size:
+                    self._remove(next(iter(self._documents)))
+        return document.copy()
+
+    def __len__(self):
+        return len(self._documents)
+
+    def _remove(self, filename):
+        if filename in self._documents:
+            stamp, _ = self._documents.pop(filename)
+            self.size -= stamp[1]
+
+
 class OutputWriter:
     """
     Write the annotations
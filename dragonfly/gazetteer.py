@@ -0,0 +1,256 @@
+# Copyright 2017-2019, The Johns Hopkins University Applied Physics Laboratory LLC
+# All rights reserved.
+# Distributed under the terms of the Apache 2.0 License.
+
+# This module does not use relative imports so that scripts/geonames.py can import it directly.
+
+import contextlib
+import io
+import logging
+import math
+import os
+import sqlite3
+import zipfile
+
+logger = logging.getLogger(__name__)
+
+
+class Gazetteer:
+    """
+    Offline place name search over a geonames dump for sites without network access.
+
+    Names and alternate names are indexed by their character trigrams. A fuzzy
+    search only reads the trigram lists needed to find every name that could be
+    similar enough and then scores those names. Results have the same shape as
+    the geonames search api.
+    """
+    FILENAME = 'gazetteer.sqlite'
+    MAX_ROWS = 20
+    # trigram similarity required for the fuzziest (fuzzy=0) and the least fuzzy searches
+    MIN_SIMILARITY = 0.2
+    MAX_SIMILARITY = 0.7
+    # sqlite has a limit on the number of parameters of a statement
+    MAX_PARAMETERS = 500
+    FEATURE_CLASSES = {
+        'A': 'country, state, region,...',
+        'H': 'stream, lake, ...',
+        'L': 'parks,area, ...',
+        'P': 'city, village,...',
+        'R': 'road, railroad ',
+        'S': 'spot, building, farm',
+        'T': 'mountain,hill,rock,... ',
+        'U': 'undersea',
+        'V': 'forest,heath,...',
+    }
+
+    def __init__(self, metadata_dir, countries=None):
+        """
+        :param metadata_dir: directory with the gazetteer database
+        :param countries: list of country codes to restrict results to
+        """
+        self.filename = os.path.join(metadata_dir, self.FILENAME)
+        self.countries = countries or []
+
+    @property
+    def available(self):
+        return os.path.exists(self.filename)
+
+    def retrieve(self, term, fuzzy=0.8):
+        """
+        Search for places by name
+        :param term: search term
+        :param fuzzy: Fuzzy threshold between 0 and 1 (exact match)
+        :return: Geonames results object
+        """
+        term = term.strip().lower()
+        if not term:
+            return {'totalResultsCount': 0, 'geonames': []}
+        try:
+            with contextlib.closing(sqlite3.connect(self.filename)) as conn:
+                if fuzzy >= 1:
+                    similarities = {row[0]: 1.0 for row in conn.execute('SELECT id FROM terms WHERE term = ?', (term,))}
+                else:
+                    threshold = self.MIN_SIMILARITY + (self.MAX_SIMILARITY - self.MIN_SIMILARITY) * max(fuzzy, 0)
+                    similarities = self._similar_terms(conn, term, threshold)
+                places = self._places(conn, similarities)
+        except sqlite3.Error:
+            logger.exception('Cannot search the gazetteer')
+            return None
+        places.sort(key=lambda place: (-place[0], -place[1]['population'], place[1]['geonameId']))
+        return {
+            'totalResultsCount': len(places),
+            'geonames': [place for _, place in places[:self.MAX_ROWS]],
+        }
+
+    def _similar_terms(self, conn, term, threshold):
+        """
+        Find the names with a trigram jaccard similarity to the term of at least the threshold.
+
+        A name that similar shares at least ceil(threshold * n) of the n trigrams of the
+        term, so it must contain one of the n - ceil(threshold * n) + 1 rarest trigrams.
+        Only those trigram lists are read and the names found are then scored.
+
+        :return: dictionary of term id -> similarity
+        """
+        grams = trigrams(term)
+        needed = max(1, math.ceil(threshold * len(grams)))
+        counts = dict(self._select_in(conn, 'SELECT trigram, count FROM trigram_counts WHERE trigram IN ({})', grams))
+        probe = sorted((gram for gram in grams if gram in counts), key=counts.get)[:len(grams) - needed + 1]
+        similarities = {}
+        query = 'SELECT DISTINCT terms.id, terms.term FROM trigrams JOIN terms ON terms.id = trigrams.term_id ' \
+                'WHERE terms.size BETWEEN {} AND {} AND trigrams.trigram IN ({{}})'
+        query = query.format(math.ceil(threshold * len(grams)), math.floor(len(grams) / threshold))
+        for term_id, candidate in self._select_in(conn, query, probe):
+            other = trigrams(candidate)
+            shared = len(grams & other)
+            similarity = shared / (len(grams) + len(other) - shared)
+            if similarity >= threshold:
+                similarities[term_id] = similarity
+        return similarities
+
+    def _places(self, conn, similarities):
+        """
+        :param similarities: dictionary of term id -> similarity
+        :return: list of (similarity, place) with the best similarity of each place
+        """
+        query = 'SELECT names.term_id, places.id, places.name, places.country_code, countries.name, admin1.name, ' \
+                'places.fcl, places.fcode, places.population, places.lat, places.lng FROM names ' \
+                'JOIN places ON places.id = names.place_id ' \
+                'LEFT JOIN countries ON countries.code = places.country_code ' \
+                "LEFT JOIN admin1 ON admin1.code = places.country_code || '.' || places.admin1_code " \
+                'WHERE names.term_id IN ({})'
+        if self.countries:
+            query += ' AND places.country_code IN ({})'.format(', '.join('?' * len(self.countries)))
+        places = {}
+        for row in self._select_in(conn, query, list(similarities), self.countries):
+            term_id, place_id, name, country_code, country_name, admin_name, fcl, fcode, population, lat, lng = row
+            similarity = similarities[term_id]
+            if place_id in places and places[place_id][0] >= similarity:
+                continue
+            places[place_id] = (similarity, {
+                'geonameId': place_id,
+                'name': name,
+                'countryCode': country_code,
+                'countryName': country_name or country_code,
+                'adminName1': admin_name or '',
+                'fcl': fcl,
+                'fclName': self.FEATURE_CLASSES.get(fcl, ''),
+                'fcode': fcode,
+                'population': population,
+                'lat': str(lat),
+                'lng': str(lng),
+            })
+        return list(places.values())
+
+    def _select_in(self, conn, query, values, extra=()):
+        # run a query with an IN clause in batches of values
+        values = list(values)
+        for start in range(0, len(values), self.MAX_PARAMETERS):
+            batch = values[start:start + self.MAX_PARAMETERS]
+            yield from conn.execute(query.format(', '.join('?' * len(batch))), batch + list(extra))
+
+
+class GazetteerBuilder:
+    """
+    Import a geonames dump into a gazetteer.
+
+    The dump (allCountries, cities500, a country file or their zip archives) is
+    read a line at a time so that multi-GB files are never in memory. The
+    database is written to a temporary file and moved into place at the end so
+    a running server keeps using the old gazetteer until the import is done.
+    """
+    # columns of the geonames table
+    ID, NAME, ASCII_NAME, ALTERNATE_NAMES, LAT, LNG, FCL, FCODE, COUNTRY, CC2, ADMIN1 = range(11)
+    POPULATION = 14
+    BATCH_SIZE = 10000
+
+    def __init__(self, metadata_dir):
+        self.filename = os.path.join(metadata_dir, Gazetteer.FILENAME)
+
+    def build(self, dump, countries_file=None, admin1_file=None, countries=None):
+        """
+        :param dump: filename of the geonames table (.txt or .zip)
+        :param countries_file: optional countryInfo.txt for country names
+        :param admin1_file: optional admin1CodesASCII.txt for division names
+        :param countries: optional list of country codes to import
+        :return: number of places imported
+        """
+        tmp_filename = self.filename + '.tmp'
+        if os.path.exists(tmp_filename):
+            os.remove(tmp_filename)
+        countries = {code.upper() for code in countries} if countries else None
+        with contextlib.closing(sqlite3.connect(tmp_filename)) as conn:
+            conn.execute('PRAGMA journal_mode = OFF')
+            conn.execute('PRAGMA synchronous = OFF')
+            self._create_tables(conn)
+            if countries_file:
+                conn.executemany('INSERT OR REPLACE INTO countries VALUES (?, ?)',
+                                 ((row[0], row[4]) for row in self._rows(countries_file) if len(row) > 4))
+            if admin1_file:
+                conn.executemany('INSERT OR REPLACE INTO admin1 VALUES (?, ?)',
+                                 ((row[0], row[1]) for row in self._rows(admin1_file) if len(row) > 1))
+            count = 0
+            for row in self._rows(dump):
+                if len(row) <= self.POPULATION or (countries and row[self.COUNTRY] not in countries):
+                    continue
+                self._add(conn, row)
+                count += 1
+                if count % self.BATCH_SIZE == 0:
+                    conn.commit()
+                    logger.info('Imported %d places', count)
+            conn.execute('INSERT INTO trigram_counts SELECT trigram, COUNT(*) FROM trigrams GROUP BY trigram')
+            conn.commit()
+        os.replace(tmp_filename, self.filename)
+        return count
+
+    @staticmethod
+    def _create_tables(conn):
+        conn.execute('CREATE TABLE places (id INTEGER PRIMARY KEY, name TEXT, country_code TEXT, admin1_code TEXT, '
+                     'fcl TEXT, fcode TEXT, population INTEGER, lat REAL, lng REAL)')
+        conn.execute('CREATE TABLE countries (code TEXT PRIMARY KEY, name TEXT)')
+        conn.execute('CREATE TABLE admin1 (code TEXT PRIMARY KEY, name TEXT)')
+        # distinct lower cased names with their number of trigrams
+        conn.execute('CREATE TABLE terms (id INTEGER PRIMARY KEY, term TEXT UNIQUE, size INTEGER)')
+        conn.execute('CREATE TABLE names (term_id INTEGER, place_id INTEGER, PRIMARY KEY (term_id, place_id)) '
+                     'WITHOUT ROWID')
+        conn.execute('CREATE TABLE trigrams (trigram TEXT, term_id INTEGER, PRIMARY KEY (trigram, term_id)) '
+                     'WITHOUT ROWID')
+        conn.execute('CREATE TABLE trigram_counts (trigram TEXT PRIMARY KEY, count INTEGER)')
+
+    def _add(self, conn, row):
+        place_id = int(row[self.ID])
+        conn.execute('INSERT OR REPLACE INTO places VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', (
+            place_id, row[self.NAME], row[self.COUNTRY], row[self.ADMIN1], row[self.FCL], row[self.FCODE],
+            int(row[self.POPULATION] or 0), float(row[self.LAT]), float(row[self.LNG])))
+        names = {row[self.NAME], row[self.ASCII_NAME]}
+        names.update(row[self.ALTERNATE_NAMES].split(','))
+        for name in {name.strip().lower() for name in names} - {''}:
+            grams = trigrams(name)
+            cursor = conn.execute('INSERT OR IGNORE INTO terms (term, size) VALUES (?, ?)', (name, len(grams)))
+            if cursor.rowcount:
+                term_id = cursor.lastrowid
+                conn.executemany('INSERT INTO trigrams VALUES (?, ?)', ((gram, term_id) for gram in grams))
+            else:
+                term_id = conn.execute('SELECT id FROM terms WHERE term = ?', (name,)).fetchone()[0]
+            conn.execute('INSERT OR IGNORE INTO names VALUES (?, ?)', (term_id, place_id))
+
+    @staticmethod
+    def _rows(filename):
+        """Tab separated rows of a geonames file (or the first file in a zip archive) skipping comments"""
+        with contextlib.ExitStack() as stack:
+            if zipfile.is_zipfile(filename):
+                archive = stack.enter_context(zipfile.ZipFile(filename))
+                member = [name for name in archive.namelist() if not name.lower().startswith('readme')][0]
+                fp = stack.enter_context(io.TextIOWrapper(archive.open(member), encoding='utf8'))
+            else:
+                fp = stack.enter_context(open(filename, 'r', encoding='utf8'))
+            for line in fp:
+                if line.startswith('#'):
+                    continue
+                yield line.rstrip('\n').split('\t')
+
+
+def trigrams(term):
+    """Set of the character trigrams of a term padded with spaces"""
+    padded = ' ' + term + ' '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
@@ -0,0 +1,106 @@
+# Copyright 2017-2019, The Johns Hopkins University Applied Physics Laboratory LLC
+# All rights reserved.
+# Distributed under the terms of the Apache 2.0 License.
+
+# This module does not use relative imports so that scripts/missing.py can import it directly.
+
+
+class AhoCorasick:
+    """
+    Aho-Corasick automaton over tokens for finding dictionary entries of one or more words.
+
+    Every occurrence of every entry in a token sequence is found in a single pass,
+    however many entries there are. Tokens are compared case insensitively.
+
+    Transitions are held in dictionaries keyed by (state, token) rather than a
+    dictionary per state because most entries are a single word.
+    """
+    ROOT = 0
+
+    def __init__(self):
+        self.root = {}
+        self.goto = {}
+        self.values = {}
+        self.depth = [0]
+        self.fail = [self.ROOT]
+        # next state on the fail chain that ends an entry
+        self.output = [self.ROOT]
+        self._parents = [(None, None)]
+
+    def __len__(self):
+        return len(self.values)
+
+    def add(self, tokens, value):
+        """
+        Add an entry (call build() before searching)
+        :param tokens: list of strings
+        :param value: returned with the matches of the entry (replaces the value of a duplicate entry)
+        """
+        if not tokens:
+            return
+        state = self.ROOT
+        for token in tokens:
+            token = token.lower()
+            next_state = self._next(state, token)
+            if next_state is None:
+                next_state = len(self.depth)
+                if state == self.ROOT:
+                    self.root[token] = next_state
+                else:
+                    self.goto[state, token] = next_state
+                self.depth.append(self.depth[state] + 1)
+                self._parents.append((state, token))
+            state = next_state
+        self.values[state] = value
+
+    def build(self):
+        """Compute the failure links once all of the entries have been added"""
+        self.fail = [self.ROOT] * len(self.depth)
+        self.output = [self.ROOT] * len(self.depth)
+        # states are numbered in order of creation so sort them by depth for a breadth first traversal
+        for state in sorted(range(1, len(self.depth)), key=self.depth.__getitem__):
+            parent, token = self._parents[state]
+            if parent != self.ROOT:
+                fallback = self.fail[parent]
+                while self._next(fallback, token) is None and fallback != self.ROOT:
+                    fallback = self.fail[fallback]
+                self.fail[state] = self._next(fallback, token) or self.ROOT
+            fail = self.fail[state]
+            self.output[state] = fail if fail in self.values else self.output[fail]
+
+    def find(self, tokens):
+        """
+        Find every occurrence of the entries
+        :param tokens: list of strings
+        :return: generator of (start, end, value) ordered by end
+        """
+        state = self.ROOT
+        for i, token in enumerate(tokens):
+            token = token.lower()
+            while state != self.ROOT and self._next(state, token) is None:
+                state = self.fail[state]
+            state = self._next(state, token) or self.ROOT
+            match = state if state in self.values else self.output[state]
+            while match != self.ROOT:
+                yield i + 1 - self.depth[match], i + 1, self.values[match]
+                match = self.output[match]
+
+    def _next(self, state, token):
+        if state == self.ROOT:
+            return self.root.get(token)
+        return self.goto.get((state, token))
+
+
+def longest_matches(matches):
+    """
+    Select the leftmost longest matches that do not overlap
+    :param matches: iterable of (start, end, value)
+    :return: list of (start, end, value) ordered by start
+    """
+    selected = []
+    end = 0
+    for match in sorted(matches, key=lambda match: (match[0], match[0] - match[1])):
+        if match[0] >= end:
+            selected.append(match)
+            end = match[1]
+    return selected
@@ -0,0 +1,376 @@
+# Copyright 2017-2019, The Johns Hopkins University Applied Physics Laboratory LLC
+# All rights reserved.
+# Distributed under the terms of the Apache 2.0 License.
+
+import bisect
+import heapq
+import re
+
+from .vocabulary import DeletionIndex, Vocabulary
+
+
+class QuerySyntaxError(ValueError):
+    pass
+
+
+def parse(text):
+    """
+    Parse a local search query.
+
+    Grammar (operators are upper case so that lower case words are still searchable):
+        query  := and ('OR' and)*
+        and    := not (['AND'] not)*
+        not    := 'NOT' not | '(' query ')' | '"phrase"' | '/regex/' | 'doc:' pattern | term['~'[distance]]
+
+    A single word that is not a valid query, like ( or ", is searched for literally
+    so that punctuation tokens can still be found.
+
+    :param text: query string
+    :return: root node of the query
+    """
+    parser = _Parser(text)
+    try:
+        node = parser.parse_or()
+        if parser.peek() is not None:
+            raise QuerySyntaxError('Unexpected {}'.format(parser.peek()))
+    except QuerySyntaxError:
+        word = text.strip()
+        if not word or len(word.split()) > 1 or (len(word) > 2 and word[0] == word[-1] == '/'):
+            raise
+        return Term(word.lower())
+    return node
+
+
+class _Parser:
+    TOKENS = re.compile(r'/(?:[^/\\]|\\.)+/|\(|\)|"[^"]*"?|[^\s()"]+')
+    OPERATORS = {'AND', 'OR', 'NOT', '(', ')'}
+    FUZZY = re.compile(r'(.+)~(\d)?$')
+
+    def __init__(self, text):
+        self.tokens = self.TOKENS.findall(text)
+        self.position = 0
+
+    def peek(self):
+        if self.position < len(self.tokens):
+            return self.tokens[self.position]
+
+    def next(self):
+        token = self.peek()
+        self.position += 1
+        return token
+
+    def parse_or(self):
+        children = [self.parse_and()]
+        while self.peek() == 'OR':
+            self.next()
+            children.append(self.parse_and())
+        return children[0] if len(children) == 1 else Or(children)
+
+    def parse_and(self):
+        children = [self.parse_not()]
+        while self.peek() is not None and self.peek() not in ('OR', ')'):
+            if self.peek() == 'AND':
+                self.next()
+            children.append(self.parse_not())
+        return children[0] if len(children) == 1 else And(children)
+
+    def parse_not(self):
+        token = self.next()
+        if token is None:
+            raise QuerySyntaxError('Incomplete query')
+        if token == 'NOT':
+            return Not(self.parse_not())
+        if token == '(':
+            node = self.parse_or()
+            if self.next() != ')':
+                raise QuerySyntaxError('Missing )')
+            return node
+        if token in self.OPERATORS:
+            raise QuerySyntaxError('Unexpected {}'.format(token))
+        if token.startswith('"'):
+            words = token.strip('"').lower().split()
+            if not words:
+                raise QuerySyntaxError('Empty phrase')
+            return Phrase(words)
+        if len(token) > 2 and token[0] == token[-1] == '/':
+            return Regex(token[1:-1])
+        if token.startswith('doc:') and len(token) > 4:
+            return DocFilter(token[4:])
+        match = self.FUZZY.match(token)
+        if match:
+            distance = match.group(2)
+            return Fuzzy(match.group(1).lower(), int(distance) if distance else DeletionIndex.MAX_DISTANCE)
+        return Term(token.lower())
+
+
+class Term:
+    def __init__(self, word):
+        self.word = word
+
+    @property
+    def wildcards(self):
+        return any(char in self.word for char in Vocabulary.WILDCARDS)
+
+    def evaluate(self, index, terms):
+        words = index.vocabulary.match(self.word) if self.wildcards else [self.word]
+        matches = []
+        for word in words:
+            refs = index.postings(word)
+            if refs is not None:
+                terms.add(word)
+                matches.append(PostingMatches(refs))
+        return union(matches)
+
+
+class Fuzzy:
+    """Spelling variants of a word within an edit distance"""
+    def __init__(self, word, max_distance):
+        self.word = word
+        self.max_distance = max_distance
+
+    def evaluate(self, index, terms):
+        matches = []
+        for word in index.vocabulary.similar(self.word, self.max_distance):
+            terms.add(word)
+            matches.append(PostingMatches(index.postings(word)))
+        return union(matches)
+
+
+class Phrase:
+    def __init__(self, words):
+        self.words = words
+
+    def evaluate(self, index, terms):
+        posting_lists = [index.postings(word) for word in self.words]
+        if any(refs is None for refs in posting_lists):
+            return SentenceMatches([], [])
+        terms.update(self.words)
+        keys = []
+        positions = []
+        for doc_id, sent_id, start in phrase_positions(posting_lists):
+            key = sentence_key(doc_id, sent_id)
+            span = tuple(range(start, start + len(self.words)))
+            if keys and keys[-1] == key:
+                positions[-1] = tuple(sorted(set(positions[-1] + span)))
+            else:
+                keys.append(key)
+                positions.append(span)
+        return SentenceMatches(keys, positions)
+
+
+class Regex:
+    """Words that contain a match for a case insensitive regular expression"""
+    def __init__(self, pattern):
+        try:
+            self.regex = re.compile(pattern, re.IGNORECASE)
+        except re.error as err:
+            raise QuerySyntaxError('Bad regular expression: {}'.format(err))
+
+    def evaluate(self, index, terms):
+        matches = []
+        for word in index.vocabulary.search(self.regex):
+            terms.add(word)
+            matches.append(PostingMatches(index.postings(word)))
+        return union(matches)
+
+
+class DocFilter:
+    """Every sentence of the documents with names matching a shell-style pattern"""
+    def __init__(self, pattern):
+        self.pattern = pattern
+
+    def evaluate(self, index, terms):
+        keys = []
+        for doc_id, num_sentences in index.documents(self.pattern):
+            keys.extend(sentence_key(doc_id, sent_id) for sent_id in range(num_sentences))
+        return SentenceMatches(keys, [()] * len(keys))
+
+
+class And:
+    def __init__(self, children):
+        self.children = children
+
+    def evaluate(self, index, terms):
+        positives = [child.evaluate(index, terms) for child in self.children if not isinstance(child, Not)]
+        negatives = [child.child.evaluate(index, set()) for child in self.children if isinstance(child, Not)]
+        if not positives:
+            raise QuerySyntaxError('NOT needs a term to exclude results from')
+        return intersect(positives, negatives)
+
+
+class Or:
+    def __init__(self, children):
+        self.children = children
+
+    def evaluate(self, index, terms):
+        return union([child.evaluate(index, terms) for child in self.children])
+
+
+class Not:
+    def __init__(self, child):
+        self.child = child
+
+    def evaluate(self, index, terms):
+        raise QuerySyntaxError('NOT needs a term to exclude results from')
+
+
+def sentence_key(doc_id, sent_id):
+    """Sentences sort by doc id and then sentence id"""
+    return doc_id << 32 | sent_id
+
+
+def split_sentence_key(key):
+    return key >> 32, key & 0xFFFFFFFF
+
+
+def gallop(sequence, key, start):
+    """
+    Exponential search for the first item >= key at or after start
+    :return: index of the item (len(sequence) if none)
+    """
+    size = len(sequence)
+    bound = 1
+    while start + bound < size and sequence[start + bound] < key:
+        bound *= 2
+    return bisect.bisect_left(sequence, key, start + bound // 2, min(start + bound + 1, size))
+
+
+class PostingMatches:
+    """
+    Sentences in a posting list of (doc id, sentence id, position) queried in place.
+
+    seek() moves a cursor forward so a list is intersected without being copied.
+    """
+    def __init__(self, refs):
+        self.refs = refs
+        self.keys = _PostingKeys(refs)
+        self.cursor = 0
+
+    def seek(self, key):
+        """Positions of the sentence or None, for keys in increasing order"""
+        index = gallop(self.keys, key, self.cursor)
+        start = index
+        while index < len(self.keys) and self.keys[index] == key:
+            index += 1
+        self.cursor = index
+        if index == start:
+            return None
+        return tuple(self.refs[3 * start + 2:3 * index:3])
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __iter__(self):
+        refs = self.refs
+        key = None
+        positions = []
+        for i in range(0, len(refs), 3):
+            current = sentence_key(refs[i], refs[i + 1])
+            if current != key:
+                if positions:
+                    yield key, tuple(positions)
+                key = current
+                positions = []
+            positions.append(refs[i + 2])
+        if positions:
+            yield key, tuple(positions)
+
+
+class SentenceMatches:
+    """Sorted sentence keys with the matched token positions"""
+    def __init__(self, keys, positions):
+        self.keys = keys
+        self.positions = positions
+        self.cursor = 0
+
+    def seek(self, key):
+        """Positions of the sentence or None, for keys in increasing order"""
+        index = gallop(self.keys, key, self.cursor)
+        if index < len(self.keys) and self.keys[index] == key:
+            self.cursor = index + 1
+            return self.positions[index]
+        self.cursor = index
+        return None
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __iter__(self):
+        return zip(self.keys, self.positions)
+
+
+class _PostingKeys:
+    # sequence view of the sentence key of each posting for bisect
+    def __init__(self, refs):
+        self.refs = refs
+
+    def __len__(self):
+        return len(self.refs) // 3
+
+    def __getitem__(self, index):
+        return sentence_key(self.refs[3 * index], self.refs[3 * index + 1])
+
+
+def intersect(positives, negatives):
+    """
+    Sentences in all of the positive matches and none of the negative matches.
+
+    The smallest list drives the intersection and the others are galloped through.
+    """
+    positives = sorted(positives, key=len)
+    keys = []
+    positions = []
+    for key, found in positives[0]:
+        for other in positives[1:]:
+            other_positions = other.seek(key)
+            if other_positions is None:
+                break
+            found += other_positions
+        else:
+            if not any(negative.seek(key) is not None for negative in negatives):
+                keys.append(key)
+                positions.append(tuple(sorted(set(found))))
+    return SentenceMatches(keys, positions)
+
+
+def union(matches):
+    """Sentences in any of the matches"""
+    if len(matches) == 1:
+        return matches[0]
+    keys = []
+    positions = []
+    for key, found in heapq.merge(*matches, key=lambda item: item[0]):
+        if keys and keys[-1] == key:
+            positions[-1] = tuple(sorted(set(positions[-1] + found)))
+        else:
+            keys.append(key)
+            positions.append(found)
+    return SentenceMatches(keys, positions)
+
+
+def phrase_positions(posting_lists):
+    """
+    Find where the words of a phrase occur at consecutive positions by intersecting their posting lists
+    :param posting_lists: flat (doc id, sentence id, position) arrays for each word of the phrase in order
+    :return: sorted list of (doc id, sentence id, start position)
+    """
+    # start with the rarest word and shift positions to the start of the phrase
+    order = sorted(range(len(posting_lists)), key=lambda i: len(posting_lists[i]))
+    first = order[0]
+    refs = posting_lists[first]
+    matches = [(refs[i], refs[i + 1], refs[i + 2] - first)
+               for i in range(0, len(refs), 3) if refs[i + 2] >= first]
+    for shift in order[1:]:
+        refs = posting_lists[shift]
+        intersection = []
+        j = 0
+        for match in matches:
+            key = (match[0], match[1], match[2] + shift)
+            while j < len(refs) and (refs[j], refs[j + 1], refs[j + 2]) < key:
+                j += 3
+            if j < len(refs) and (refs[j], refs[j + 1], refs[j + 2]) == key:
+                intersection.append(match)
+        matches = intersection
+        if not matches:
+            break
+    return matches
@@ -0,0 +1,151 @@
+# Copyright 2017-2019, The Johns Hopkins University Applied Physics Laboratory LLC
+# All rights reserved.
+# Distributed under the terms of the Apache 2.0 License.
+
+import array
+import bisect
+import heapq
+import math
+
+from .query import sentence_key
+
+
+class BM25:
+    """
+    Okapi BM25 with sentences as the retrieval unit.
+
+    The idf comes from the document statistics of the index. The rest of the
+    score of a term in a sentence is its impact, which only depends on the term
+    frequency and the sentence length so it can be computed when the index is built.
+    """
+    K1 = 1.2
+    B = 0.75
+
+    @staticmethod
+    def idf(num_documents, doc_count):
+        return math.log(1 + (num_documents - doc_count + 0.5) / (doc_count + 0.5))
+
+    @classmethod
+    def impact(cls, tf, length, avg_length):
+        return tf * (cls.K1 + 1) / (tf + cls.K1 * (1 - cls.B + cls.B * length / avg_length))
+
+    @classmethod
+    def impacts(cls, refs, sentence_length, avg_length):
+        """
+        Impact ordered list of the sentences in a posting list
+        :param refs: flat (doc id, sentence id, position) posting list
+        :param sentence_length: function of (doc id, sentence id) returning the number of tokens
+        :param avg_length: average sentence length of the index
+        :return: (flat (doc id, sentence id) array, impacts array) ordered by decreasing impact
+        """
+        entries = []
+        for (doc_id, sent_id), group in _group_sentences(refs):
+            tf = len(group)
+            entries.append((-cls.impact(tf, sentence_length(doc_id, sent_id), avg_length), doc_id, sent_id))
+        entries.sort()
+        sentences = array.array('I')
+        impacts = array.array('f')
+        for impact, doc_id, sent_id in entries:
+            sentences.extend((doc_id, sent_id))
+            impacts.append(-impact)
+        return sentences, impacts
+
+
+class RankedTerm:
+    """Statistics of a query term for ranking"""
+    def __init__(self, idf, refs, sentences, impacts):
+        """
+        :param idf: inverse document frequency
+        :param refs: flat (doc id, sentence id, position) posting list
+        :param sentences: flat (doc id, sentence id) array in impact order
+        :param impacts: impacts in decreasing order
+        """
+        self.idf = idf
+        self.refs = refs
+        self.sentences = sentences
+        self.impacts = impacts
+
+    def positions(self, doc_id, sent_id):
+        """Positions of the term in a sentence found by binary search of the posting list"""
+        keys = _PostingSentences(self.refs)
+        start = bisect.bisect_left(keys, (doc_id, sent_id))
+        end = bisect.bisect_right(keys, (doc_id, sent_id), start)
+        return tuple(self.refs[3 * start + 2:3 * end:3])
+
+
+def top_k(terms, k, sentence_length, avg_length):
+    """
+    Find the sentences with the highest BM25 scores with the threshold algorithm.
+
+    The impact ordered lists are read in parallel. Each new sentence is fully scored
+    by looking it up in the other posting lists and kept in a heap of the best k.
+    Reading stops once the k-th score is at least the best score an unseen sentence
+    could have, so common words only have the top of their lists read.
+
+    :param terms: list of RankedTerm
+    :param k: number of sentences or None for all
+    :param sentence_length: function of (doc id, sentence id) returning the number of tokens
+    :param avg_length: average sentence length of the index
+    :return: list of (score, doc id, sentence id, positions) with the best first
+    """
+    heap = []
+    seen = set()
+    depth = 0
+    while True:
+        threshold = 0
+        exhausted = True
+        for term in terms:
+            if depth >= len(term.impacts):
+                continue
+            exhausted = False
+            threshold += term.idf * term.impacts[depth]
+            doc_id, sent_id = term.sentences[2 * depth], term.sentences[2 * depth + 1]
+            if (doc_id, sent_id) in seen:
+                continue
+            seen.add((doc_id, sent_id))
+            score = 0
+            positions = ()
+            length = sentence_length(doc_id, sent_id)
+            for other in terms:
+                other_positions = other.positions(doc_id, sent_id)
+                if other_positions:
+                    score += other.idf * BM25.impact(len(other_positions), length, avg_length)
+                    positions += other_positions
+            # ties go to the earlier sentence
+            item = (score, -sentence_key(doc_id, sent_id), doc_id, sent_id, tuple(sorted(positions)))
+            if k is None or len(heap) < k:
+                heapq.heappush(heap, item)
+            elif item > heap[0]:
+                heapq.heapreplace(heap, item)
+        if exhausted or (k is not None and len(heap) >= k and heap[0][0] >= threshold):
+            break
+        depth += 1
+    return [(score, doc_id, sent_id, positions)
+            for score, _, doc_id, sent_id, positions in sorted(heap, reverse=True)]
+
+
+def _group_sentences(refs):
+    group = []
+    key = None
+    for i in range(0, len(refs), 3):
+        current = (refs[i], refs[i + 1])
+        if current != key:
+            if group:
+                yield key, group
+            key = current
+            group = []
+        group.append(refs[i + 2])
+    if group:
+        yield key, group
+
+
+class _PostingSentences:
+    # sequence view of the (doc id, sentence id) of each posting for bisect
+    def __init__(self, refs):
+        self.refs = refs
+
+    def __len__(self):
+        return len(self.refs) // 3
+
+    def __getitem__(self, index):
+        return self.refs[3 * index], self.refs[3 * index + 1]
@@ -231,6 +231,7 @@ class TaggedTokenFrequencies:
             os.mkdir(self.dir)
         self.corpus_filename = self._get_path(self.CORPUS_FILE)
         self.corpus_data = None
+        self._version = 0
 
     def update(self, annotation):
         filename = annotation['filename']
@@ -256,9 +257,14 @@ class TaggedTokenFrequencies:
         self._save_corpus_data(corpus_data)
         return corpus_data
 
+    @property
+    def version(self):
+        """Value that changes when the counts used for the percentages change"""
+        self._get_corpus_data()
+        return self._version
+
     def get_percentage(self, word):
-        if self.corpus_data is None:
-            self.corpus_data = self._load_corpus_data()
+        self._get_corpus_data()
         word = word.lower()
         if word in self.corpus_data.counts and word in self.corpus_data.tagged_counts:
             try:
@@ -268,6 +274,12 @@ class TaggedTokenFrequencies:
         else:
             return 0
 
+    def _get_corpus_data(self):
+        if self.corpus_data is None:
+            self.corpus_data = self._load_corpus_data()
+            self._version += 1
+        return self.corpus_data
+
     def _load_corpus_data(self):
         if os.path.exists(self.corpus_filename):
             with open(self.corpus_filename, 'rb') as fp:
@@ -2,11 +2,15 @@
 # All rights reserved.
 # Distributed under the terms of the Apache 2.0 License.
 
+import collections
 import flask
+import json
+import markupsafe
 import os
+import threading
 import timeit
 from .components import SentenceMarkerManager
-from .data import InputReader, Document, AnnotationLoader, EnglishTranslationLoader
+from .data import InputReader, AnnotationLoader, EnglishTranslationLoader
 from .search import DocumentStats
 
 
@@ -14,6 +18,10 @@ class AnnotateAttacher:
     """
     Attach a single set of annotations when annotating
     """
+    def sources(self, output_path, filename):
+        """Annotation files that attach() may read"""
+        return [os.path.join(output_path, os.path.basename(filename) + '.anno')]
+
     def attach(self, document, output_path, filename):
         loader = AnnotationLoader(output_path)
         annotations_filename = loader.get(filename)
@@ -28,6 +36,11 @@ class AdjudicateAttacher:
     def __init__(self, annotations_dirs):
         self.annotations_dirs = annotations_dirs
 
+    def sources(self, output_path, filename):
+        """Annotation files that attach() may read"""
+        filename = os.path.basename(filename) + '.anno'
+        return [os.path.join(path, filename) for path in [output_path] + list(self.annotations_dirs)]
+
     def attach(self, document, output_path, filename):
         # todo How to handle partially complete dir of adjudicated files
         loader = AnnotationLoader(output_path)
@@ -41,8 +54,8 @@ class AdjudicateAttacher:
             if annotations_filename:
                 document.attach_annotations(InputReader(annotations_filename).sentences)
 
-        self.annotations_dirs.reverse()
-        for annotations_dir in self.annotations_dirs:
+        # each row is inserted below the tokens so go in reverse to keep the order of the directories
+        for annotations_dir in reversed(self.annotations_dirs):
             loader = AnnotationLoader(annotations_dir)
             annotations_filename = loader.get(filename)
             if annotations_filename:
@@ -59,8 +72,6 @@ class DocumentRenderer:
         start_time = timeit.default_timer()
         lang = app.config.get('dragonfly.lang')
         lister = app.config.get('dragonfly.input')
-        output_path = app.config.get('dragonfly.output')
-        suggest = app.config.get('dragonfly.suggest')
         single_file = True if filename else False
 
         settings = app.locator.settings
@@ -79,41 +90,130 @@ class DocumentRenderer:
         # remove any path information
         local_filename = os.path.basename(filename)
 
-        reader = InputReader(filename)
-        document = Document(filename, reader.sentences, reader.terminal_blank_line)
+        marker_manager = SentenceMarkerManager(app.config.get('dragonfly.local_md_dir'))
+        markers = marker_manager.get(local_filename)
+
+        page_cache = app.locator.page_cache
+        key = self._page_key(app, filename, lister.path, markers, settings)
+        page = page_cache.get(local_filename, key)
+        if page is None:
+            try:
+                page = self._render_document(app, filename, lister.path, markers)
+            except RuntimeError as e:
+                return str(e)
+            page_cache.put(local_filename, key, page)
+
+        content = flask.render_template('annotate.html', title=local_filename, document=page,
+                                        index=index, next_index=next_index, lang=lang, modes=self.modes,
+                                        filename=local_filename)
+        total_time = timeit.default_timer() - start_time
+        app.logger.info('Serving %s in %1.2fs', filename, total_time)
+        return content
+
+    def render_sentences(self, app, filename, start):
+        """
+        Render the next window of sentences of a windowed document
+        :param filename: document filename
+        :param start: index of the first sentence
+        :return: dictionary of html, start, stop and total or None if not a document
+        """
+        lister = app.config.get('dragonfly.input')
+        path = lister.get_path(filename)
+        if path is None:
+            return None
+        local_filename = os.path.basename(path)
+        markers = SentenceMarkerManager(app.config.get('dragonfly.local_md_dir')).get(local_filename)
+        start = max(start, 0)
+        stop = start + self._window(app) if self._window(app) else None
+        document, doc_stats = self._prepare_document(app, path, lister.path, markers, start, stop)
+        total = len(document.sentences)
+        start = min(start, total)
+        stop = total if stop is None else min(stop, total)
+        if app.config.get('dragonfly.fast_render'):
+            writer = DocumentWriter.from_app(app)
+            html = writer.write_sentences(document, doc_stats, app.locator.settings, start, stop)
+        else:
+            html = flask.render_template('sentences.html', document=document, doc_stats=doc_stats,
+                                         start=start, stop=stop)
+        return {'html': html, 'start': start, 'stop': stop, 'total': total}
+
+    def _render_document(self, app, filename, data_path, markers):
+        """
+        Render the sentences of a document (or the first window of sentences)
+        :return: RenderedDocument
+        """
+        window = self._window(app) or None
+        document, doc_stats = self._prepare_document(app, filename, data_path, markers, 0, window)
+        stop = len(document.sentences) if window is None else min(window, len(document.sentences))
+        if app.config.get('dragonfly.fast_render'):
+            html = DocumentWriter.from_app(app).write(document, doc_stats, app.locator.settings, stop)
+        else:
+            html = flask.render_template('document.html', document=document, doc_stats=doc_stats, start=0, stop=stop)
+        return RenderedDocument(html, document.has_annotations, document.terminal_blank_line)
+
+    def _prepare_document(self, app, filename, data_path, markers, start, stop):
+        """
+        Load a document with its annotations, translation and markers
+        and the suggestions and glosses of the sentences from start to stop
+        :return: Document, DocumentStats or None
+        """
+        output_path = app.config.get('dragonfly.output')
+        suggest = app.config.get('dragonfly.suggest')
+
+        # parsed once and copied so the annotations are attached to a fresh document
+        document = app.locator.document_cache.get(filename)
 
         self.attacher.attach(document, output_path, filename)
 
-        trans_loader = EnglishTranslationLoader(lister.path)
+        trans_loader = EnglishTranslationLoader(data_path)
         translation = trans_loader.get(filename)
         if translation:
             document.attach_translation(translation)
 
-        marker_manager = SentenceMarkerManager(app.config.get('dragonfly.local_md_dir'))
-        document.attach_markers(marker_manager.get(local_filename))
+        document.attach_markers(markers)
 
+        sentences = document.sentences[start:stop]
         if suggest:
             document.convert_row_to_suggestions(suggest)
         else:
             freqs = app.locator.tag_frequencies
-            for sentence in document.sentences:
+            for sentence in sentences:
                 row = sentence.rows[0]
                 row.set_suggestions([freqs.get_percentage(x) for x in row.strings])
 
+        # highlight dictionary entries, including ones of several words
+        matcher = app.locator.dictionary_matcher
+        for sentence in sentences:
+            row = sentence.rows[0]
+            row.set_glosses(matcher.match(row.strings))
+
+        doc_stats = None
         if app.locator.local_search.loaded:
-            try:
-                doc_stats = DocumentStats(document, app.locator.local_search.index)
-            except RuntimeError as e:
-                return str(e)
-        else:
-            doc_stats = None
+            doc_stats = DocumentStats(document, app.locator.local_search.index)
+        return document, doc_stats
 
-        content = flask.render_template('annotate.html', title=local_filename, document=document,
-                                        index=index, next_index=next_index, lang=lang, modes=self.modes,
-                                        filename=local_filename, doc_stats=doc_stats)
-        total_time = timeit.default_timer() - start_time
-        app.logger.info('Serving %s in %1.2fs', filename, total_time)
-        return content
+    @staticmethod
+    def _window(app):
+        # number of sentences rendered at a time (0 for the whole document)
+        return app.config.get('dragonfly.window') or 0
+
+    def _page_key(self, app, filename, data_path, markers, settings):
+        """Everything that the rendered sentences of a document depend on"""
+        output_path = app.config.get('dragonfly.output')
+        sources = [filename, os.path.join(data_path, os.path.basename(filename) + '.eng')]
+        sources.extend(self.attacher.sources(output_path, filename))
+        local_search = app.locator.local_search
+        return (
+            tuple(_file_stamp(source) for source in sources),
+            tuple(markers),
+            json.dumps(settings, sort_keys=True),
+            tuple(self.modes),
+            app.config.get('dragonfly.suggest'),
+            self._window(app),
+            app.locator.tag_frequencies.version,
+            app.locator.dictionary_matcher.version,
+            (local_search.loaded, id(local_search.index), local_search.index.num_documents),
+        )
 
     def _get_file_indexes(self, index, lister, filename):
         # filename takes priority over index
@@ -128,3 +228,208 @@ class DocumentRenderer:
         if lister.has_next(index):
             next_index = index + 1
         return index, next_index
+
+
+class RenderedDocument:
+    """
+    Rendered sentences of a document with what the rest of the page needs from the document
+    """
+    def __init__(self, html, has_annotations, terminal_blank_line):
+        self.html = html
+        self.has_annotations = has_annotations
+        self.terminal_blank_line = terminal_blank_line
+
+
+class DocumentWriter:
+    """
+    Writes the same markup as the document.html template with string operations.
+
+    The template calls several macros and filters for every cell of the token grid.
+    This produces identical output for long documents in a fraction of the time.
+    Any change to document.html or the token macros must be made here too.
+    """
+    LONG_TEXT = 400
+    SENTENCE = '<div class="df-sentence" id="df-sentence-{0}">\n' \
+               '        <div class="df-sentence-id">\n' \
+               '            <span class="df-sentence-badge badge {1}" id="{0}" data-index="{0}">{2}</span>\n' \
+               '        </div>\n' \
+               '        <div class="df-section df-column-labels{3}">'
+
+    def __init__(self, preprocess_text, calc_column_width):
+        """
+        :param preprocess_text: the preprocess_text template filter
+        :param calc_column_width: the calc_column_width template function
+        """
+        self.preprocess_text = preprocess_text
+        self.calc_column_width = calc_column_width
+
+    @classmethod
+    def from_app(cls, app):
+        return cls(app.jinja_env.filters['preprocess_text'], app.jinja_env.globals['calc_column_width'])
+
+    def write(self, document, doc_stats, settings, stop=None):
+        """
+        Write the document.html markup
+        :param document: Document
+        :param doc_stats: DocumentStats or None
+        :param settings: dictionary of settings
+        :param stop: number of sentences to write when windowed (default is all)
+        :return: html string
+        """
+        total = len(document.sentences)
+        stop = total if stop is None else stop
+        parts = ['<div class="df-main"']
+        if stop < total:
+            parts.append(' data-sentences="{}"'.format(total))
+        parts.append('>')
+        self._write_sentences(parts, document, doc_stats, settings, 0, stop)
+        parts.append('\n</div>')
+        return ''.join(parts)
+
+    def write_sentences(self, document, doc_stats, settings, start, stop):
+        """
+        Write the sentences.html markup
+        :return: html string
+        """
+        parts = []
+        self._write_sentences(parts, document, doc_stats, settings, start, stop)
+        return ''.join(parts)
+
+    def _write_sentences(self, parts, document, doc_stats, settings, start, stop):
+        max_col_width = _to_int(settings['Column Width'])
+        hide_labels = '' if settings['Display Row Labels'] else ' df-hide'
+        for s in range(start, stop):
+            sentence = document.sentences[s]
+            if document.has_translation:
+                translation = document.translation[s] if s < len(document.translation) else ''
+                parts.append('<div class="df-translation">{}</div>'.format(_escape(translation)))
+            marker_class = 'df-marked' if s in document.markers else ''
+            parts.append(self.SENTENCE.format(sentence.index, marker_class, sentence.index + 1, hide_labels))
+            for row in sentence.rows:
+                parts.append('<div>{}</div>'.format(_escape(row.label)))
+            parts.append('</div>')
+            for tok in range(sentence.length):
+                self._write_column(parts, sentence, tok, max_col_width, document.has_annotations, doc_stats)
+            parts.append('</div>\n')
+
+    def _write_column(self, parts, sentence, tok, max_col_width, has_annotations, doc_stats):
+        parts.append('<div class="df-section df-row">')
+        rows = sentence.rows
+        parts.append(self._token(rows[0], tok, sentence.index, has_annotations, doc_stats))
+        if len(rows) > 1:
+            max_col_width = self.calc_column_width(rows, tok, max_col_width)
+            for row in rows[1:]:
+                parts.append(self._non_token(row, tok, max_col_width))
+        parts.append('</div>')
+
+    def _token(self, row, tok, sent_index, has_annotations, doc_stats):
+        string = _escape(row.strings[tok])
+        classes = []
+        if row.suggestions and row.suggestions[tok] > 0.5:
+            classes.append('df-suggest')
+        gloss = row.glosses[tok] if row.glosses else None
+        if gloss:
+            classes.append('df-in-dict' if gloss[2] == 'user' else 'df-in-combodict')
+        attributes = ''
+        if has_annotations:
+            tag = row.annotations[tok] if tok < len(row.annotations) else ''
+            attributes = ' data-tag="{}"'.format(_escape(tag))
+        attributes += ' '
+        if doc_stats is not None:
+            attributes += 'data-tfidf="{}"'.format('%0.2f' % float(doc_stats.get_idf(row.strings[tok])))
+        if gloss:
+            title = _escape(self.preprocess_text(gloss[0]))
+            if gloss[1]:
+                title = '{} : {}'.format(_escape(gloss[1]), title)
+            attributes += ' title="{}" data-toggle="tooltip"'.format(title)
+        return '<div class="df-token {}" id="df-token-{}-{}" data-token="{}"{}>{}</div>'.format(
+            ' '.join(classes), sent_index, tok, string, attributes, string)
+
+    def _non_token(self, row, tok, max_col_width):
+        extra_class = 'df-adjudicate' if row.adjudicate else ''
+        text = self.preprocess_text(row.strings[tok].replace('__', '\u3000').replace('--', '\u3000'))
+        if len(text) > max_col_width:
+            tooltip = _escape(text[:self.LONG_TEXT])
+            return '<div class="{}"  data-toggle="tooltip" title="{}" >{}</div>'.format(
+                extra_class, tooltip, _escape(text[:max_col_width] + '…'))
+        return '<div class="{}" >{}</div>'.format(extra_class, _escape(text))
+
+
+class PageCache:
+    """
+    LRU cache of the rendered sentences of documents.
+
+    Rendering the tokens is most of the cost of serving a long document. An entry
+    is only used when its key (file stamps, markers, settings, modes and the
+    versions of the suggestion and dictionary data) matches the current one.
+    The least recently used entries are dropped once the html passes max_size characters.
+    """
+    MAX_SIZE = 64 * 1024 * 1024
+
+    def __init__(self, max_size=MAX_SIZE):
+        self.max_size = max_size
+        self.size = 0
+        self._pages = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, filename, key):
+        """
+        :param filename: document filename
+        :param key: current key of the document
+        :return: RenderedDocument or None
+        """
+        with self._lock:
+            if filename in self._pages and self._pages[filename][0] == key:
+                self._pages.move_to_end(filename)
+                return self._pages[filename][1]
+
+    def put(self, filename, key, page):
+        with self._lock:
+            self._remove(filename)
+            if len(page.html) <= self.max_size:
+                self._pages[filename] = (key, page)
+                self.size += len(page.html)
+                while self.size > self.max_size:
+                    self._remove(next(iter(self._pages)))
+
+    def invalidate(self, filename=None):
+        """
+        :param filename: document filename or None for every document
+        """
+        with self._lock:
+            if filename is None:
+                self._pages.clear()
+                self.size = 0
+            else:
+                self._remove(filename)
+
+    def __len__(self):
+        return len(self._pages)
+
+    def _remove(self, filename):
+        if filename in self._pages:
+            _, page = self._pages.pop(filename)
+            self.size -= len(page.html)
+
+
+def _file_stamp(filename):
+    try:
+        stat = os.stat(filename)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _escape(value):
+    return str(markupsafe.escape(value))
+
+
+def _to_int(value):
+    # same as the int template filter
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        try:
+            return int(float(value))
+        except (TypeError, ValueError):
+            return 0
@@ -2,14 +2,22 @@
 # All rights reserved.
 # Distributed under the terms of the Apache 2.0 License.
 
+import concurrent.futures
 import copy
+import functools
+import logging
+import requests
 from .components import Hints, Notepad, SentenceMarkerManager, Stats
-from .data import OutputWriter
+from .data import DocumentCache, OutputWriter
+from .gazetteer import Gazetteer
 from .recommend import Recommender, TaggedTokenFrequencies
-from .search import DictionarySearch, GeonamesSearch, LocalSearch, PhrasesSearch
+from .renderer import PageCache
+from .search import DictionaryMatcher, DictionarySearch, GeonamesCache, GeonamesSearch, LocalSearch, PhrasesSearch
 from .settings import GlobalSettingsManager, LocalSettingsManager
 from .translations import TranslationDictManager
 
+logger = logging.getLogger(__name__)
+
 
 class ResourceLocator:
     """
@@ -18,11 +26,18 @@ class ResourceLocator:
     Understands how to create resources based on configuration.
     Understands when to create a new instance and when to use a cached instance
     """
+    LOADING = 'loading'
+    READY = 'ready'
+    UNAVAILABLE = 'unavailable'
+    FAILED = 'failed'
+
     def __init__(self, config):
         self.config = config
         self.hints = Hints(config.get('dragonfly.local_md_dir'))
         self.notepad = Notepad(config.get('dragonfly.local_md_dir'))
         self.output_writer = OutputWriter(config.get('dragonfly.output'))
+        self.document_cache = DocumentCache()
+        self.page_cache = PageCache()
         self.tag_frequencies = TaggedTokenFrequencies(config.get('dragonfly.local_md_dir'))
         self._dictionary_search = None
         self._phrases_search = None
@@ -30,6 +45,60 @@ class ResourceLocator:
         self._recommender = None
         self._translation_manager = None
         self._marker_manager = None
+        self._dictionary_matcher = None
+        self._status = {}
+        self._warm_up_executor = None
+        self._geonames_session = requests.Session()
+        self._geonames_cache = GeonamesCache(config.get('dragonfly.local_md_dir'))
+
+    def warm_up(self):
+        """
+        Load the search resources and update the search index concurrently in
+        the background so that the first request to use them does not have to wait for them.
+        """
+        # create the instances here so that requests and the warm up share them
+        dictionary_search = self.dictionary_search
+        phrases_search = self.phrases_search
+        tasks = {
+            'dictionary': dictionary_search.load,
+            'phrases': phrases_search.load,
+        }
+        self._warm_up_executor = concurrent.futures.ThreadPoolExecutor(len(tasks))
+        for name, task in tasks.items():
+            self.track(name, self._warm_up_executor.submit(task))
+        self.track('local', self.local_search.load_index(bg=True, build=True))
+
+    def build_local_index(self):
+        """Rebuild the search index of the data directory in the background"""
+        self.track('local', self.local_search.build_index(bg=True))
+
+    def track(self, name, future):
+        """
+        Report the status of a resource from the background task that loads it
+        :param name: resource name
+        :param future: future of the task
+        """
+        # a ready resource keeps serving requests while it is rebuilt
+        if self._status.get(name) != self.READY:
+            self._status[name] = self.LOADING
+        future.add_done_callback(functools.partial(self._warm_up_done, name))
+
+    def _warm_up_done(self, name, future):
+        if future.exception() is not None:
+            logger.error('Cannot load %s', name, exc_info=future.exception())
+            self._status[name] = self.FAILED
+        elif future.result() is False:
+            self._status[name] = self.UNAVAILABLE
+        else:
+            self._status[name] = self.READY
+
+    @property
+    def status(self):
+        """Dictionary of resource name -> loading, ready, unavailable or failed"""
+        status = dict(self._status)
+        if 'local' not in status:
+            status['local'] = self.READY if self.local_search.loaded else self.LOADING
+        return status
 
     @property
     def stats(self):
@@ -55,6 +124,14 @@ class ResourceLocator:
             self._dictionary_search = DictionarySearch(self.config.get('dragonfly.local_md_dir'))
         return self._dictionary_search
 
+    @property
+    def dictionary_matcher(self):
+        # cached (recompiled when the dictionaries change)
+        if self._dictionary_matcher is None:
+            self._dictionary_matcher = DictionaryMatcher(self.translation_manager, self.dictionary_search,
+                                                         self.config.get('dragonfly.lang'))
+        return self._dictionary_matcher
+
     @property
     def phrases_search(self):
         # cached
@@ -64,12 +141,17 @@ class ResourceLocator:
 
     @property
     def geonames_search(self):
-        # not cached as user may change country settings
+        # not cached as user may change country settings (connections and results are)
         settings = self.settings
         countries = []
         if settings['Geonames County Codes']:
             countries = [code.strip().upper() for code in settings['Geonames County Codes'].split(',')]
-        return GeonamesSearch(settings['Geonames Username'], countries=countries)
+        # an imported gazetteer is used instead of the geonames api for sites without network access
+        gazetteer = Gazetteer(self.config.get('dragonfly.local_md_dir'), countries=countries)
+        if gazetteer.available:
+            return gazetteer
+        return GeonamesSearch(settings['Geonames Username'], countries=countries,
+                              session=self._geonames_session, cache=self._geonames_cache)
 
     @property
     def local_search(self):
@@ -77,7 +159,8 @@ class ResourceLocator:
         if self._local_search is None:
             data_dir = self.config.get('dragonfly.data_dir')
             local_md_dir = self.config.get('dragonfly.local_md_dir')
-            self._local_search = LocalSearch(data_dir, local_md_dir)
+            workers = self.config.get('dragonfly.index_workers', 1)
+            self._local_search = LocalSearch(data_dir, local_md_dir, workers)
         return self._local_search
 
     @property
@@ -0,0 +1,143 @@
+# Copyright 2017-2019, The Johns Hopkins University Applied Physics Laboratory LLC
+# All rights reserved.
+# Distributed under the terms of the Apache 2.0 License.
+
+import collections
+import gzip
+import hashlib
+import os
+import threading
+
+try:
+    import brotli
+except ImportError:
+    # brotli is optional and gzip is used without it
+    brotli = None
+
+
+class ResponseCompressor:
+    """
+    Compress responses with brotli (when installed) or gzip.
+
+    Small responses and types that do not compress well are sent as is.
+    Compressed bodies are kept by etag, which is a hash of the content, so
+    repeat requests for a page or a static file are only compressed once.
+    """
+    MIN_SIZE = 1024
+    MIMETYPES = {'text/html', 'text/css', 'text/plain', 'text/javascript', 'application/javascript',
+                 'application/json', 'image/svg+xml'}
+    GZIP_LEVEL = 6
+    BROTLI_QUALITY = 5
+    MAX_CACHE_SIZE = 32 * 1024 * 1024
+
+    def __init__(self, max_cache_size=MAX_CACHE_SIZE):
+        self.max_cache_size = max_cache_size
+        self.cache_size = 0
+        self._cache = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def compress(self, response, request):
+        """
+        :param response: flask response which is changed in place
+        :param request: flask request
+        :return: response
+        """
+        if response.status_code != 200 or 'Content-Encoding' in response.headers:
+            return response
+        if response.mimetype not in self.MIMETYPES:
+            return response
+        response.vary.add('Accept-Encoding')
+        # byte ranges are offsets into the uncompressed file
+        if 'Range' in request.headers:
+            return response
+        encoding = self._choose_encoding(request)
+        if encoding is None:
+            return response
+        # static files are streamed from disk
+        response.direct_passthrough = False
+        data = response.get_data()
+        if len(data) < self.MIN_SIZE:
+            return response
+        etag, weak = response.get_etag()
+        key = (etag, encoding)
+        body = self._get(key) if etag else None
+        if body is None:
+            body = self._encode(data, encoding)
+            if etag:
+                self._put(key, body)
+        response.set_data(body)
+        response.headers['Content-Encoding'] = encoding
+        response.headers.pop('Accept-Ranges', None)
+        if etag:
+            # each encoding is a different representation
+            response.set_etag('{}-{}'.format(etag, encoding), weak)
+        return response
+
+    @staticmethod
+    def _choose_encoding(request):
+        if brotli is not None and request.accept_encodings['br']:
+            return 'br'
+        if request.accept_encodings['gzip']:
+            return 'gzip'
+        return None
+
+    def _encode(self, data, encoding):
+        if encoding == 'br':
+            return brotli.compress(data, quality=self.BROTLI_QUALITY)
+        return gzip.compress(data, self.GZIP_LEVEL)
+
+    def _get(self, key):
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+
+    def _put(self, key, body):
+        if len(body) > self.max_cache_size:
+            return
+        with self._lock:
+            if key in self._cache:
+                return
+            self._cache[key] = body
+            self.cache_size += len(body)
+            while self.cache_size > self.max_cache_size:
+                _, old = self._cache.popitem(last=False)
+                self.cache_size -= len(old)
+
+
+class StaticFingerprints:
+    """
+    Content hashes of static files for their urls.
+
+    A new version of a file gets a new url so browsers can cache static files
+    for a year without ever using a stale one.
+    """
+    LENGTH = 12
+
+    def __init__(self, folder):
+        """
+        :param folder: static folder of the app
+        """
+        self.folder = folder
+        self._hashes = {}
+        self._lock = threading.Lock()
+
+    def get(self, filename):
+        """
+        :param filename: path relative to the static folder
+        :return: hash string or None if the file does not exist
+        """
+        path = os.path.join(self.folder, filename)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            if filename in self._hashes and self._hashes[filename][0] == stamp:
+                return self._hashes[filename][1]
+        with open(path, 'rb') as fp:
+            digest = hashlib.sha1(fp.read()).hexdigest()[:self.LENGTH]
+        with self._lock:
+            self._hashes[filename] = (stamp, digest)
+        return digest
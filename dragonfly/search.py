@@ -2,20 +2,38 @@
 # All rights reserved.
 # Distributed under the terms of the Apache 2.0 License.
 
+import array
+import bisect
+import codecs
 import collections
 import concurrent.futures
+import contextlib
 import csv
 import fnmatch
 import glob
+import hashlib
+import heapq
+import io
+import itertools
 import json
 import logging
 import math
+import multiprocessing
 import os
 import pickle
 import re
 import requests
+import sqlite3
+import tempfile
+import threading
+import time
 
 from .data import Sentence
+from .matcher import AhoCorasick, longest_matches
+from .query import Fuzzy, Phrase, QuerySyntaxError, Regex, Term, parse, phrase_positions, split_sentence_key
+from .ranking import BM25, RankedTerm, top_k
+from .storage import SectionReader, SectionWriter, StringTable
+from .vocabulary import DeletionIndex, TrigramIndex, Vocabulary, prefix_range
 
 logger = logging.getLogger(__name__)
 
@@ -24,41 +42,377 @@ class InvertedIndex:
     """
     Case insensitive inverted index
     """
-    MAX_ENTRIES = 25
+    MAGIC = b'DFII'
+    VERSION = 10
+    # a posting is (doc id, sentence id, token position)
+    POSTING_SIZE = 3
 
     class IndexData:
-        # data structure for pickling
-        # don't need to normalize since each sentence is reference to list
-        def __init__(self, max_entries):
-            self.max_entries = max_entries
+        # data structure for building the index (and unpickling the legacy format)
+        # refs are complete posting lists of (doc id, sentence id, position) flattened into an array
+        # and sorted by doc id, sentence id and position.
+        # The ids point into a sentence table that holds each sentence once.
+        def __init__(self):
             self.num_documents = 0
             self.index = {}
+            # document -> {word: count} so that a document can be removed
+            self.doc_words = {}
+            # doc id -> name (None once removed) and doc id -> list of (tokens, transliterations)
+            self.docs = []
+            self.doc_ids = {}
+            self.sentences = {}
+            # running totals for the average sentence length used in ranking
+            self.num_sentences = 0
+            self.num_tokens = 0
 
-        def add(self, word, doc, sentence_id, sentence, trans):
+        def add_document(self, doc, sentences, transliterations):
+            """
+            Add the sentences of a document to the sentence table
+            :return: doc id
+            """
+            doc_id = len(self.docs)
+            self.docs.append(doc)
+            self.doc_ids[doc] = doc_id
+            self.sentences[doc_id] = [(sentence, transliterations[i] if transliterations else None)
+                                      for i, sentence in enumerate(sentences)]
+            self.num_sentences += len(sentences)
+            self.num_tokens += sum(len(sentence) for sentence in sentences)
+            return doc_id
+
+        def add(self, word, doc_id, sentence_id, position):
             if word not in self.index:
                 # cannot use defaultdict since lambdas cannot be pickled
-                self.index[word] = {'count': 0, 'doc_count': 0, 'refs': []}
+                self.index[word] = {'count': 0, 'doc_count': 0, 'refs': array.array('I')}
             self.index[word]['count'] += 1
-            if self.index[word]['count'] < self.max_entries:
-                self.index[word]['refs'].append({
-                    'doc': doc,
-                    'sent_id': sentence_id,
-                    'text': sentence,
-                    'trans': trans,
-                })
+            self.index[word]['refs'].extend((doc_id, sentence_id, position))
+
+        def merge(self, other):
+            """
+            Merge the data for a later set of documents into this one.
+            Merging shards in order gives the same result as adding the documents serially.
+            """
+            offset = len(self.docs)
+            self.num_documents += other.num_documents
+            self.docs.extend(other.docs)
+            for doc, doc_id in other.doc_ids.items():
+                self.doc_ids[doc] = doc_id + offset
+            for doc_id, sentences in other.sentences.items():
+                self.sentences[doc_id + offset] = sentences
+            self.num_sentences += other.num_sentences
+            self.num_tokens += other.num_tokens
+            for word, other_entry in other.index.items():
+                if word not in self.index:
+                    self.index[word] = {'count': 0, 'doc_count': 0, 'refs': array.array('I')}
+                entry = self.index[word]
+                entry['count'] += other_entry['count']
+                entry['doc_count'] += other_entry['doc_count']
+                refs = array.array('I', other_entry['refs'])
+                refs[0::3] = array.array('I', [doc_id + offset for doc_id in refs[0::3]])
+                entry['refs'].extend(refs)
+            self.doc_words.update(other.doc_words)
+
+        def remove(self, doc):
+            """Remove the counts, refs and sentences for a document"""
+            self.num_documents -= 1
+            doc_id = self.doc_ids.pop(doc)
+            self.docs[doc_id] = None
+            self.num_sentences -= len(self.sentences[doc_id])
+            self.num_tokens -= sum(len(tokens) for tokens, trans in self.sentences[doc_id])
+            del self.sentences[doc_id]
+            for word, count in self.doc_words.pop(doc).items():
+                entry = self.index[word]
+                entry['count'] -= count
+                entry['doc_count'] -= 1
+                if entry['count'] <= 0:
+                    del self.index[word]
+                else:
+                    refs = entry['refs']
+                    entry['refs'] = array.array('I', itertools.chain.from_iterable(
+                        refs[i:i + 3] for i in range(0, len(refs), 3) if refs[i] != doc_id))
 
         def clear(self):
             self.index.clear()
+            self.doc_words.clear()
+            self.docs.clear()
+            self.doc_ids.clear()
+            self.sentences.clear()
+            self.num_sentences = 0
+            self.num_tokens = 0
 
         def words(self):
             return self.index.keys()
 
+        def vocabulary(self):
+            return Vocabulary(sorted(self.index))
+
         def get(self, word):
             if word in self.index:
                 return self.index[word]
 
+        def doc_name(self, doc_id):
+            return self.docs[doc_id]
+
+        def documents(self):
+            """(doc id, name, number of sentences) of each document"""
+            for doc_id, doc in enumerate(self.docs):
+                if doc is not None:
+                    yield doc_id, doc, len(self.sentences[doc_id])
+
+        def sentence(self, doc_id, sentence_id):
+            """(tokens, transliterations) of a sentence"""
+            return self.sentences[doc_id][sentence_id]
+
+        def sentence_length(self, doc_id, sentence_id):
+            return len(self.sentences[doc_id][sentence_id][0])
+
+        def avg_sentence_length(self):
+            return self.num_tokens / self.num_sentences if self.num_sentences else 0
+
+        def count_sentences(self):
+            """Set the totals for a sentence table that was filled in directly"""
+            self.num_sentences = sum(len(sentences) for sentences in self.sentences.values())
+            self.num_tokens = sum(len(tokens) for sentences in self.sentences.values() for tokens, trans in sentences)
+
+        def impacts(self, word):
+            """Impact ordered sentences of a word for ranking (computed on each call)"""
+            return BM25.impacts(self.index[word]['refs'], self.sentence_length, self.avg_sentence_length())
+
+        @classmethod
+        def upgrade(cls, legacy):
+            """Convert unpickled data from the format that stored the sentences in each ref"""
+            data = cls()
+            data.num_documents = legacy.num_documents
+            for word, legacy_entry in legacy.index.items():
+                refs = []
+                for ref in legacy_entry['refs']:
+                    if ref['doc'] not in data.doc_ids:
+                        data.add_document(ref['doc'], [], None)
+                    doc_id = data.doc_ids[ref['doc']]
+                    sentences = data.sentences[doc_id]
+                    while len(sentences) <= ref['sent_id']:
+                        # the legacy format only has the sentences that were referenced
+                        sentences.append(([], None))
+                    sentences[ref['sent_id']] = (ref['text'], ref['trans'])
+                    refs.append((doc_id, ref['sent_id']))
+                # the legacy format has a ref per occurrence but no positions so they are recovered from the text
+                postings = []
+                for doc_id, sentence_id in sorted(set(refs)):
+                    tokens = data.sentences[doc_id][sentence_id][0]
+                    postings.extend((doc_id, sentence_id, position) for position, token in enumerate(tokens)
+                                    if token.lower() == word)
+                data.index[word] = {'count': legacy_entry['count'], 'doc_count': legacy_entry.get('doc_count', 0),
+                                    'refs': array.array('I', itertools.chain.from_iterable(postings))}
+            data.count_sentences()
+            return data
+
+    class MappedData:
+        """
+        Read-only index data that is queried in place through a memory map.
+
+        Layout: a sorted term dictionary with per term counts, positional posting lists of
+        (doc id, sentence id, position), a document table, a sentence store holding
+        each sentence once, the suffix order, trigram index and deletion index of the vocabulary and
+        impact ordered sentence lists for BM25 ranking. Loading is O(1) and processes serving the same dataset
+        share the page cache.
+        """
+        META, TERM_OFFSETS, TERM_BLOB, TERM_COUNTS, TERM_DOC_COUNTS, POSTING_OFFSETS, POSTINGS, \
+            DOC_OFFSETS, DOC_BLOB, DOC_TERM_OFFSETS, DOC_TERMS, DOC_SENTENCES, SENTENCE_OFFSETS, \
+            SENTENCE_BLOB, SUFFIX_ORDER, TRIGRAM_OFFSETS, TRIGRAM_BLOB, TRIGRAM_TERM_OFFSETS, \
+            TRIGRAM_TERMS, DELETE_OFFSETS, DELETE_BLOB, DELETE_TERM_OFFSETS, DELETE_TERMS, SENTENCE_LENGTHS, \
+            IMPACT_OFFSETS, IMPACT_SENTENCES, IMPACTS = range(27)
+
+        def __init__(self, filename):
+            self.reader = SectionReader(filename, InvertedIndex.MAGIC, InvertedIndex.VERSION)
+            self.num_documents, num_tokens = self.reader.array(self.META, 'Q')
+            self.terms = StringTable(self.reader.array(self.TERM_OFFSETS, 'Q'), self.reader.bytes(self.TERM_BLOB))
+            self.counts = self.reader.array(self.TERM_COUNTS, 'I')
+            self.doc_counts = self.reader.array(self.TERM_DOC_COUNTS, 'I')
+            self.posting_offsets = self.reader.array(self.POSTING_OFFSETS, 'Q')
+            self.postings = self.reader.array(self.POSTINGS, 'I')
+            self.docs = StringTable(self.reader.array(self.DOC_OFFSETS, 'Q'), self.reader.bytes(self.DOC_BLOB))
+            self.doc_term_offsets = self.reader.array(self.DOC_TERM_OFFSETS, 'Q')
+            self.doc_terms = self.reader.array(self.DOC_TERMS, 'I')
+            self.doc_sentences = self.reader.array(self.DOC_SENTENCES, 'Q')
+            self.sentences = StringTable(self.reader.array(self.SENTENCE_OFFSETS, 'Q'),
+                                         self.reader.bytes(self.SENTENCE_BLOB))
+            self.suffix_order = self.reader.array(self.SUFFIX_ORDER, 'I')
+            self.trigrams = TrigramIndex(
+                StringTable(self.reader.array(self.TRIGRAM_OFFSETS, 'Q'), self.reader.bytes(self.TRIGRAM_BLOB)),
+                self.reader.array(self.TRIGRAM_TERM_OFFSETS, 'Q'), self.reader.array(self.TRIGRAM_TERMS, 'I'))
+            self.deletions = DeletionIndex(
+                StringTable(self.reader.array(self.DELETE_OFFSETS, 'Q'), self.reader.bytes(self.DELETE_BLOB)),
+                self.reader.array(self.DELETE_TERM_OFFSETS, 'Q'), self.reader.array(self.DELETE_TERMS, 'I'))
+            self.sentence_lengths = self.reader.array(self.SENTENCE_LENGTHS, 'I')
+            self._avg_sentence_length = num_tokens / len(self.sentence_lengths) if self.sentence_lengths else 0
+            self.impact_offsets = self.reader.array(self.IMPACT_OFFSETS, 'Q')
+            self.impact_sentences = self.reader.array(self.IMPACT_SENTENCES, 'I')
+            self.impact_values = self.reader.array(self.IMPACTS, 'f')
+
+        def words(self):
+            return self.terms
+
+        def vocabulary(self):
+            return Vocabulary(self.terms, self.suffix_order, self.trigrams, self.deletions)
+
+        def get(self, word):
+            term_id = self.terms.find(word)
+            if term_id is None:
+                return None
+            start, end = self.posting_offsets[term_id], self.posting_offsets[term_id + 1]
+            refs = self.postings[3 * start:3 * end]
+            return {'count': self.counts[term_id], 'doc_count': self.doc_counts[term_id], 'refs': refs}
+
+        def doc_name(self, doc_id):
+            return self.docs[doc_id]
+
+        def documents(self):
+            """(doc id, name, number of sentences) of each document"""
+            for doc_id, doc in enumerate(self.docs):
+                yield doc_id, doc, self.doc_sentences[doc_id + 1] - self.doc_sentences[doc_id]
+
+        def sentence(self, doc_id, sentence_id):
+            """(tokens, transliterations) of a sentence"""
+            return self._decode_sentence(self.sentences[self.doc_sentences[doc_id] + sentence_id])
+
+        def sentence_length(self, doc_id, sentence_id):
+            return self.sentence_lengths[self.doc_sentences[doc_id] + sentence_id]
+
+        def avg_sentence_length(self):
+            return self._avg_sentence_length
+
+        def impacts(self, word):
+            """Impact ordered sentences of a word for ranking"""
+            term_id = self.terms.find(word)
+            start, end = self.impact_offsets[term_id], self.impact_offsets[term_id + 1]
+            return self.impact_sentences[2 * start:2 * end], self.impact_values[start:end]
+
+        def is_stale(self):
+            return self.reader.is_stale()
+
+        def to_index_data(self):
+            """Copy into a mutable IndexData so documents can be added or removed"""
+            data = InvertedIndex.IndexData()
+            data.num_documents = self.num_documents
+            for term_id, word in enumerate(self.terms):
+                start, end = self.posting_offsets[term_id], self.posting_offsets[term_id + 1]
+                data.index[word] = {
+                    'count': self.counts[term_id],
+                    'doc_count': self.doc_counts[term_id],
+                    'refs': array.array('I', self.postings[3 * start:3 * end]),
+                }
+            for doc_id, doc in enumerate(self.docs):
+                start, end = self.doc_sentences[doc_id], self.doc_sentences[doc_id + 1]
+                data.docs.append(doc)
+                data.doc_ids[doc] = doc_id
+                data.sentences[doc_id] = [self._decode_sentence(self.sentences[i]) for i in range(start, end)]
+                start, end = self.doc_term_offsets[doc_id], self.doc_term_offsets[doc_id + 1]
+                terms = self.doc_terms[2 * start:2 * end]
+                data.doc_words[doc] = {self.terms[terms[i]]: terms[i + 1] for i in range(0, len(terms), 2)}
+            data.count_sentences()
+            return data
+
+        @staticmethod
+        def _encode_sentence(sentence):
+            tokens, trans = sentence
+            text = '\t'.join(tokens)
+            if trans is not None:
+                text += '\n' + '\t'.join(trans)
+            return text
+
+        @staticmethod
+        def _decode_sentence(text):
+            tokens, has_trans, trans = text.partition('\n')
+            return tokens.split('\t') if tokens else [], trans.split('\t') if has_trans else None
+
+        @classmethod
+        def write(cls, data, filename):
+            """
+            Write IndexData in the memory mapped format
+            :param data: IndexData
+            :param filename: output filename
+            """
+            # removed documents leave gaps in the doc ids so they are renumbered
+            doc_ids = {}
+            docs = []
+            doc_sentences = array.array('Q', [0])
+            sentences = []
+            sentence_lengths = array.array('I')
+            for old_doc_id, doc in enumerate(data.docs):
+                if doc is None:
+                    continue
+                doc_ids[old_doc_id] = len(docs)
+                docs.append(doc)
+                sentences.extend(cls._encode_sentence(sentence) for sentence in data.sentences[old_doc_id])
+                sentence_lengths.extend(len(tokens) for tokens, trans in data.sentences[old_doc_id])
+                doc_sentences.append(len(sentences))
+            num_tokens = sum(sentence_lengths)
+            avg_length = num_tokens / len(sentence_lengths) if sentence_lengths else 0
+
+            def sentence_length(doc_id, sentence_id):
+                return sentence_lengths[doc_sentences[doc_id] + sentence_id]
+
+            words = sorted(data.words())
+            term_ids = {word: term_id for term_id, word in enumerate(words)}
+            counts = array.array('I')
+            doc_counts = array.array('I')
+            posting_offsets = array.array('Q', [0])
+            postings = array.array('I')
+            impact_offsets = array.array('Q', [0])
+            impact_sentences = array.array('I')
+            impacts = array.array('f')
+            renumber = len(docs) != len(data.docs)
+            for word in words:
+                entry = data.get(word)
+                counts.append(entry['count'])
+                doc_counts.append(entry['doc_count'])
+                refs = entry['refs']
+                if renumber:
+                    refs = array.array('I', refs)
+                    refs[0::3] = array.array('I', [doc_ids[doc_id] for doc_id in refs[0::3]])
+                postings.extend(refs)
+                posting_offsets.append(len(postings) // 3)
+                term_sentences, term_impacts = BM25.impacts(refs, sentence_length, avg_length)
+                impact_sentences.extend(term_sentences)
+                impacts.extend(term_impacts)
+                impact_offsets.append(len(impacts))
+
+            doc_term_offsets = array.array('Q', [0])
+            doc_terms = array.array('I')
+            for doc in docs:
+                for word, count in sorted(data.doc_words.get(doc, {}).items()):
+                    doc_terms.extend((term_ids[word], count))
+                doc_term_offsets.append(len(doc_terms) // 2)
+
+            writer = SectionWriter(InvertedIndex.MAGIC, InvertedIndex.VERSION)
+            writer.add(array.array('Q', [data.num_documents, num_tokens]))
+            for section in StringTable.build(words):
+                writer.add(section)
+            writer.add(counts)
+            writer.add(doc_counts)
+            writer.add(posting_offsets)
+            writer.add(postings)
+            for section in StringTable.build(docs):
+                writer.add(section)
+            writer.add(doc_term_offsets)
+            writer.add(doc_terms)
+            writer.add(doc_sentences)
+            for section in StringTable.build(sentences):
+                writer.add(section)
+            writer.add(Vocabulary.build_suffix_order(words))
+            for table in (TrigramIndex.build(words), DeletionIndex.build(words)):
+                for section in StringTable.build(table.keys):
+                    writer.add(section)
+                writer.add(table.offsets)
+                writer.add(table.term_ids)
+            writer.add(sentence_lengths)
+            writer.add(impact_offsets)
+            writer.add(impact_sentences)
+            writer.add(impacts)
+            writer.write(filename)
+
     def __init__(self):
-        self._index = self.IndexData(self.MAX_ENTRIES)
+        self._index = self.IndexData()
+        self._vocabulary = None
 
     @property
     def num_documents(self):
@@ -66,11 +420,12 @@ class InvertedIndex:
 
     def get_doc_count(self, word):
         word = word.lower()
-        if word in self._index.index:
-            if 'doc_count' not in self._index.get(word):
+        entry = self._index.get(word)
+        if entry:
+            if 'doc_count' not in entry:
                 raise RuntimeError("Search index needs to be rebuilt. "
                                    "Delete inverted index in dataset's .dragonfly directory and restart")
-            return self._index.get(word)['doc_count']
+            return entry['doc_count']
         else:
             return 0
 
@@ -81,68 +436,282 @@ class InvertedIndex:
         :param sentences: list of sentences where each sentence is a list of words
         :param transliterations: same structure as sentences or None/empty list
         """
-        self._index.num_documents += 1
-        words = set()
         doc = os.path.basename(filename)
+        if doc in self._index.doc_words:
+            self.remove(filename)
+        self._index.num_documents += 1
+        doc_id = self._index.add_document(doc, sentences, transliterations)
+        words = collections.Counter()
         for i, sentence in enumerate(sentences):
-            for word in sentence:
+            for position, word in enumerate(sentence):
                 word = word.lower()
-                words.add(word)
-                trans = transliterations[i] if transliterations else None
-                self._index.add(word, doc, i, sentence, trans)
+                words[word] += 1
+                self._index.add(word, doc_id, i, position)
         for word in words:
             self._index.index[word]['doc_count'] += 1
+        self._index.doc_words[doc] = dict(words)
+        self._vocabulary = None
+
+    def merge(self, other):
+        """
+        Merge an index built over a later set of documents into this one
+        :param other: InvertedIndex
+        """
+        self._index.merge(other._index)
+        self._vocabulary = None
+
+    def remove(self, filename):
+        """
+        Remove a document from the index
+        :param filename: Filename of the document
+        """
+        doc = os.path.basename(filename)
+        if doc in self._index.doc_words:
+            self._index.remove(doc)
+            self._vocabulary = None
 
     def clear(self):
-        self._index.clear()
+        self._index = self.IndexData()
+        self._vocabulary = None
+
+    def is_mutable(self):
+        """Can documents be added to or removed from this index"""
+        return getattr(self._index, 'doc_words', None) is not None
+
+    def make_mutable(self):
+        """Copy a memory mapped index into memory so that it can be updated"""
+        if isinstance(self._index, self.MappedData):
+            self._index = self._index.to_index_data()
+
+    def is_stale(self):
+        """Has another process replaced the index file this index is mapped from"""
+        return isinstance(self._index, self.MappedData) and self._index.is_stale()
 
-    def retrieve(self, term, wildcards=False):
+    def retrieve(self, term, wildcards=False, offset=0, limit=None):
+        """
+        Retrieve a page of the refs for a query
+        :param term: Query term
+        :param wildcards: Whether to use shell-style wildcards
+        :param offset: Number of refs to skip
+        :param limit: Maximum number of refs to return or None for all
+        :return: dictionary with terms, count, refs and the offset of the next page (None on the last page)
+        """
         term = term.lower()
-        results = {'terms': set(), 'count': 0, 'refs': []}
-        if wildcards:
-            results = self._retrieve_with_wildcards(term)
-        else:
-            entry = self._index.get(term)
-            if entry:
-                results['terms'].add(term)
-                results['count'] = entry['count']
-                results['refs'] = entry['refs']
+        words = self.vocabulary.match(term) if wildcards else [term]
+        return self._retrieve_words(words, offset, limit)
+
+    def _retrieve_words(self, words, offset, limit):
+        results = {'terms': set(), 'count': 0, 'refs': [], 'next_offset': None}
+        skip = offset
+        remaining = limit
+        for word in words:
+            entry = self._index.get(word)
+            if not entry:
+                continue
+            results['terms'].add(word)
+            results['count'] += entry['count']
+            size = len(entry['refs']) // self.POSTING_SIZE
+            if skip >= size:
+                # whole posting lists before the page are skipped without being read
+                skip -= size
+                continue
+            if remaining is not None and remaining == 0:
+                results['next_offset'] = offset + len(results['refs'])
+                continue
+            end = size if remaining is None else min(size, skip + remaining)
+            page = entry['refs'][self.POSTING_SIZE * skip:self.POSTING_SIZE * end]
+            results['refs'].extend((doc_id, sent_id, (position,))
+                                   for doc_id, sent_id, position in zip(page[0::3], page[1::3], page[2::3]))
+            if remaining is not None:
+                remaining -= end - skip
+            if end < size:
+                results['next_offset'] = offset + len(results['refs'])
+            skip = 0
         return results
 
-    def _retrieve_with_wildcards(self, term):
-        results = {'terms': set(), 'count': 0, 'refs': []}
-        matches = fnmatch.filter(self._index.words(), term)
-        for match in matches:
-            entry = self._index.get(match)
-            results['terms'].add(match)
+    def retrieve_regex(self, pattern, offset=0, limit=None):
+        """
+        Retrieve a page of the refs for the terms that match a regular expression
+        :param pattern: case insensitive regular expression searched for in each term
+        :param offset: Number of refs to skip
+        :param limit: Maximum number of refs to return or None for all
+        :return: dictionary with terms, count, refs and the offset of the next page (None on the last page)
+        """
+        return self._retrieve_words(self.vocabulary.search(pattern), offset, limit)
+
+    def retrieve_fuzzy(self, term, max_distance=DeletionIndex.MAX_DISTANCE, offset=0, limit=None):
+        """
+        Retrieve a page of the refs for the spelling variants of a term
+        :param term: Query term
+        :param max_distance: Maximum edit distance of the variants
+        :param offset: Number of refs to skip
+        :param limit: Maximum number of refs to return or None for all
+        :return: dictionary with terms, count, refs and the offset of the next page (None on the last page)
+        """
+        return self._retrieve_words(self.vocabulary.similar(term.lower(), max_distance), offset, limit)
+
+    def retrieve_ranked(self, text, offset=0, limit=None):
+        """
+        Retrieve a page of the sentences that best match the words of a query ranked by BM25
+        :param text: Query words separated by spaces
+        :param offset: Number of refs to skip
+        :param limit: Maximum number of refs to return or None for all
+        :return: dictionary with terms, count, refs and the offset of the next page (None on the last page)
+        """
+        results = {'terms': set(), 'count': 0, 'refs': [], 'next_offset': None}
+        terms = []
+        for word in sorted(set(text.lower().split())):
+            entry = self._index.get(word)
+            if not entry:
+                continue
+            results['terms'].add(word)
             results['count'] += entry['count']
-            results['refs'].extend(entry['refs'])
+            sentences, impacts = self._index.impacts(word)
+            idf = BM25.idf(self.num_documents, entry['doc_count'])
+            terms.append(RankedTerm(idf, entry['refs'], sentences, impacts))
+        if not terms:
+            return results
+        # one more than the page to know if there is a next page
+        k = None if limit is None else offset + limit + 1
+        ranked = top_k(terms, k, self._index.sentence_length, self._index.avg_sentence_length())
+        end = len(ranked) if limit is None else min(len(ranked), offset + limit)
+        results['refs'] = [(doc_id, sent_id, positions) for score, doc_id, sent_id, positions in ranked[offset:end]]
+        if end < len(ranked):
+            results['next_offset'] = end
+        return results
+
+    def retrieve_phrase(self, tokens, offset=0, limit=None):
+        """
+        Retrieve a page of the occurrences of a phrase
+        :param tokens: list of words in the phrase
+        :param offset: Number of refs to skip
+        :param limit: Maximum number of refs to return or None for all
+        :return: dictionary with terms, count, refs and the offset of the next page (None on the last page)
+        """
+        words = [token.lower() for token in tokens]
+        results = {'terms': set(words), 'count': 0, 'refs': [], 'next_offset': None}
+        entries = [self._index.get(word) for word in words]
+        if not words or not all(entries):
+            return results
+        matches = phrase_positions([entry['refs'] for entry in entries])
+        end = len(matches) if limit is None else min(len(matches), offset + limit)
+        results['count'] = len(matches)
+        results['refs'] = [(doc_id, sent_id, tuple(range(start, start + len(words))))
+                           for doc_id, sent_id, start in matches[offset:end]]
+        if end < len(matches):
+            results['next_offset'] = end
         return results
 
+    def hydrate(self, refs):
+        """
+        Look up the text of refs returned by retrieve
+        :param refs: list of (doc id, sentence id, matched token positions)
+        :return: list of dictionaries with doc, sent_id, text, trans and the matched positions
+        """
+        hydrated = []
+        for doc_id, sent_id, positions in refs:
+            text, trans = self._index.sentence(doc_id, sent_id)
+            hydrated.append({'doc': self._index.doc_name(doc_id), 'sent_id': sent_id, 'text': text, 'trans': trans,
+                             'positions': positions})
+        return hydrated
+
+    def query(self, text, offset=0, limit=None):
+        """
+        Retrieve a page of the results of a query with AND, OR and NOT operators
+        :param text: Query parsed by query.parse
+        :param offset: Number of refs to skip
+        :param limit: Maximum number of refs to return or None for all
+        :return: dictionary with terms, count, refs and the offset of the next page (None on the last page)
+        """
+        node = parse(text)
+        if isinstance(node, Term):
+            return self.retrieve(node.word, node.wildcards, offset, limit)
+        if isinstance(node, Phrase):
+            return self.retrieve_phrase(node.words, offset, limit)
+        if isinstance(node, Regex):
+            return self.retrieve_regex(node.regex, offset, limit)
+        if isinstance(node, Fuzzy):
+            return self.retrieve_fuzzy(node.word, node.max_distance, offset, limit)
+
+        # boolean queries match sentences rather than occurrences
+        terms = set()
+        matches = list(node.evaluate(self, terms))
+        end = len(matches) if limit is None else min(len(matches), offset + limit)
+        refs = [split_sentence_key(key) + (positions,) for key, positions in matches[offset:end]]
+        return {'terms': terms, 'count': len(matches), 'refs': refs,
+                'next_offset': end if end < len(matches) else None}
+
+    def postings(self, word):
+        """Flat (doc id, sentence id, position) posting list of a word or None"""
+        entry = self._index.get(word)
+        if entry:
+            return entry['refs']
+
+    def documents(self, pattern):
+        """
+        Documents with names that match a shell-style pattern
+        :return: list of (doc id, number of sentences)
+        """
+        return [(doc_id, num_sentences) for doc_id, doc, num_sentences in self._index.documents()
+                if fnmatch.fnmatchcase(doc, pattern)]
+
+    @property
+    def vocabulary(self):
+        """Sorted vocabulary used to resolve wildcard queries (rebuilt after the index changes)"""
+        if self._vocabulary is None:
+            self._vocabulary = self._index.vocabulary()
+        return self._vocabulary
+
     def save(self, filename):
         try:
-            with open(filename, 'wb') as fp:
-                pickle.dump(self._index, fp)
+            self.MappedData.write(self._index, filename)
         except Exception:
             logger.exception('Cannot save search index')
 
     def load(self, filename):
+        """
+        Load the index from the memory mapped format or a legacy pickle
+        :return: True if the index was loaded
+        """
         try:
             with open(filename, 'rb') as fp:
-                self._index = pickle.load(fp)
+                is_mapped = fp.read(len(self.MAGIC)) == self.MAGIC
+                if not is_mapped:
+                    fp.seek(0)
+                    self._index = pickle.load(fp)
+                    if not hasattr(self._index, 'docs'):
+                        self._index = self.IndexData.upgrade(self._index)
+                    elif not hasattr(self._index, 'num_tokens'):
+                        self._index.count_sentences()
+            if is_mapped:
+                self._index = self.MappedData(filename)
+            self._vocabulary = None
+            return True
         except Exception:
             logger.exception('Cannot load search index')
+            return False
 
 
 class LocalSearch:
-    INVERTED_INDEX = "inverted_index.pkl"
+    INVERTED_INDEX = "inverted_index.dat"
+    LEGACY_INVERTED_INDEX = "inverted_index.pkl"
+    MANIFEST = "inverted_index.manifest"
     TOKEN = 0
     TRANSLIT = 1
 
-    def __init__(self, data_dir, metadata_dir):
+    SHARDS_PER_WORKER = 4
+    PAGE_SIZE = 25
+
+    def __init__(self, data_dir, metadata_dir, workers=1):
+        """
+        :param data_dir: directory of documents to index
+        :param metadata_dir: directory to store the index
+        :param workers: number of processes used to build the index
+        """
         self.loaded = False
         self.data_dir = data_dir
         self.index_dir = metadata_dir
+        self.workers = workers
         self.index = InvertedIndex()
         self.executor = concurrent.futures.ThreadPoolExecutor(1)
 
@@ -150,58 +719,234 @@ class LocalSearch:
         """
         Load the inverted index from disk
         :param bg: Whether to run this as a background task
-        :param build: Whether to build the index if it doesn't exist
+        :param build: Whether to build or update the index to match the data directory
+        :return: future of the background task
         """
-        if build and not self._index_exists():
-            self.build_index(bg)
-        else:
-            if bg:
-                self.executor.submit(self._load_index)
-            else:
-                self._load_index()
+        task = self._update_index if build else self._load_index
+        if bg:
+            return self.executor.submit(task)
+        task()
 
     def build_index(self, bg=False):
         """
         Build the index
         :param bg: Whether to run this as a background task
+        :return: future of the background task
         """
         if bg:
             logger.info('Building the search index for %s', self.data_dir)
-            self.executor.submit(self._build_index)
+            future = self.executor.submit(self._build_index)
             logger.info('Completed the search index for %s', self.data_dir)
-        else:
-            self._build_index()
+            return future
+        self._build_index()
 
-    def retrieve(self, term, wildcards=False):
+    def retrieve(self, term, wildcards=False, offset=0, limit=PAGE_SIZE):
         """
-        Retrieve results for a query
+        Retrieve a page of results for a query
         :param term: Query term
         :param wildcards: Whether to use shell-style wildcards
-        :return: dictionary of results
+        :param offset: Number of results to skip
+        :param limit: Page size or None for all results
+        :return: dictionary of results with the text of the refs and the offset of the next page
         """
-        return self.index.retrieve(term.lower(), wildcards)
+        index = self._current_index()
+        results = index.retrieve(term.lower(), wildcards, offset, limit)
+        results['refs'] = index.hydrate(results['refs'])
+        return results
+
+    def query(self, text, offset=0, limit=PAGE_SIZE):
+        """
+        Retrieve a page of results for a query with AND, OR and NOT operators, phrases and doc: filters
+        :param text: Query string
+        :param offset: Number of results to skip
+        :param limit: Page size or None for all results
+        :return: dictionary of results with the text of the refs and the offset of the next page
+        """
+        index = self._current_index()
+        results = index.query(text, offset, limit)
+        results['refs'] = index.hydrate(results['refs'])
+        return results
+
+    def retrieve_ranked(self, text, offset=0, limit=PAGE_SIZE):
+        """
+        Retrieve a page of the sentences that best match the words of a query
+        :param text: Query words separated by spaces
+        :param offset: Number of results to skip
+        :param limit: Page size or None for all results
+        :return: dictionary of results with the text of the refs and the offset of the next page
+        """
+        index = self._current_index()
+        results = index.retrieve_ranked(text, offset, limit)
+        results['refs'] = index.hydrate(results['refs'])
+        return results
+
+    def retrieve_phrase(self, tokens, offset=0, limit=PAGE_SIZE):
+        """
+        Retrieve a page of the occurrences of a phrase
+        :param tokens: list of words in the phrase
+        :param offset: Number of results to skip
+        :param limit: Page size or None for all results
+        :return: dictionary of results with the text of the refs and the offset of the next page
+        """
+        index = self._current_index()
+        results = index.retrieve_phrase(tokens, offset, limit)
+        results['refs'] = index.hydrate(results['refs'])
+        return results
 
-    def _index_exists(self):
-        return os.path.exists(self._get_path(self.INVERTED_INDEX))
+    def _current_index(self):
+        if self.index.is_stale():
+            # another annotation server sharing this dataset rebuilt the index
+            self._load_index()
+        return self.index
+
+    def update_index(self, bg=False):
+        """
+        Re-index the documents that were added, changed or removed since the last build
+        :param bg: Whether to run this as a background task
+        :return: future of the background task
+        """
+        if bg:
+            return self.executor.submit(self._update_index)
+        self._update_index()
 
     def _load_index(self):
-        try:
-            self.index.load(self._get_path(self.INVERTED_INDEX))
-            self.loaded = True
-        except FileNotFoundError:
+        path = self._get_path(self.INVERTED_INDEX)
+        legacy_path = self._get_path(self.LEGACY_INVERTED_INDEX)
+        if not os.path.exists(path) and os.path.exists(legacy_path):
+            self._migrate_index(legacy_path, path)
+        if not os.path.exists(path):
             # index is not created
             logger.info('No search index created yet')
             self.loaded = False
+            return
+        index = InvertedIndex()
+        self.loaded = index.load(path)
+        if self.loaded:
+            self.index = index
+
+    @staticmethod
+    def _migrate_index(legacy_path, path):
+        logger.info('Converting search index %s to the memory mapped format', legacy_path)
+        index = InvertedIndex()
+        if index.load(legacy_path):
+            index.save(path)
 
     def _build_index(self):
-        self.index.clear()
-        filenames = sorted([x for x in glob.glob(os.path.join(self.data_dir, "*.*")) if os.path.isfile(x)])
+        # build into a new index so that searches continue against the current one
+        index = InvertedIndex()
+        manifest = self._index_documents(index, self._get_filenames())
+        index.save(self._get_path(self.INVERTED_INDEX))
+        self._save_manifest(manifest)
+        self._load_index()
+
+    def _update_index(self):
+        # searches can use the existing index while the changes are found
+        self._load_index()
+        manifest = self._load_manifest()
+        if not self.loaded or manifest is None:
+            logger.info('Building the search index for %s', self.data_dir)
+            self._build_index()
+            return
+
+        filenames = self._get_filenames()
+        docs = {os.path.basename(filename) for filename in filenames}
+        removed = [doc for doc in manifest if doc not in docs]
+        changed = []
+        touched = False
         for filename in filenames:
-            self._add_doc_to_index(filename)
-        self.index.save(self._get_path(self.INVERTED_INDEX))
+            doc = os.path.basename(filename)
+            stat = os.stat(filename)
+            entry = manifest.get(doc)
+            if entry and entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime_ns:
+                continue
+            if entry and entry['hash'] == self._hash_file(filename):
+                # modified time changed but not the content
+                entry['mtime'] = stat.st_mtime_ns
+                touched = True
+                continue
+            changed.append(filename)
+
+        if removed or changed:
+            logger.info('Updating the search index for %s: %d changed and %d removed documents',
+                        self.data_dir, len(changed), len(removed))
+            index = InvertedIndex()
+            if not index.load(self._get_path(self.INVERTED_INDEX)):
+                # a corrupt index cannot be updated
+                self._build_index()
+                return
+            index.make_mutable()
+            if not index.is_mutable():
+                # legacy index without the per document counts
+                self._build_index()
+                return
+            for doc in removed:
+                index.remove(doc)
+                del manifest[doc]
+            for filename in changed:
+                index.remove(filename)
+            manifest.update(self._index_documents(index, changed))
+            index.save(self._get_path(self.INVERTED_INDEX))
+            self._save_manifest(manifest)
+            self._load_index()
+        elif touched:
+            self._save_manifest(manifest)
+
+    def _index_documents(self, index, filenames):
+        """
+        Add documents to the index with a pool of processes if configured
+        :return: manifest entries for the documents
+        """
+        if self.workers <= 1 or len(filenames) <= 1:
+            return {os.path.basename(filename): self._add_doc_to_index(index, filename) for filename in filenames}
+
+        # contiguous shards merged in order produce the same index as a serial build
+        num_shards = min(len(filenames), self.workers * self.SHARDS_PER_WORKER)
+        shard_size = math.ceil(len(filenames) / num_shards)
+        shards = [filenames[i:i + shard_size] for i in range(0, len(filenames), shard_size)]
+        manifest = {}
+        context = multiprocessing.get_context('spawn')
+        with concurrent.futures.ProcessPoolExecutor(self.workers, mp_context=context) as executor:
+            for shard_index, shard_manifest in executor.map(_index_shard, shards):
+                index.merge(shard_index)
+                manifest.update(shard_manifest)
+        return manifest
+
+    def _get_filenames(self):
+        return sorted([x for x in glob.glob(os.path.join(self.data_dir, "*.*")) if os.path.isfile(x)])
 
-    def _add_doc_to_index(self, filename):
-        with open(filename, 'r', encoding='utf8') as ifp:
+    def _load_manifest(self):
+        """Manifest of indexed files: doc -> {path, size, mtime, hash} or None if missing"""
+        try:
+            with open(self._get_path(self.MANIFEST), 'r', encoding='utf8') as fp:
+                return json.load(fp)
+        except (OSError, ValueError):
+            return None
+
+    def _save_manifest(self, manifest):
+        with open(self._get_path(self.MANIFEST), 'w', encoding='utf8') as fp:
+            json.dump(manifest, fp)
+
+    @staticmethod
+    def _hash_file(filename):
+        with open(filename, 'rb') as fp:
+            return hashlib.sha1(fp.read()).hexdigest()
+
+    @classmethod
+    def _add_doc_to_index(cls, index, filename):
+        """
+        Parse a document and add it to the index
+        :return: manifest entry for the document
+        """
+        stat = os.stat(filename)
+        with open(filename, 'rb') as fp:
+            data = fp.read()
+        entry = {
+            'path': filename,
+            'size': stat.st_size,
+            'mtime': stat.st_mtime_ns,
+            'hash': hashlib.sha1(data).hexdigest(),
+        }
+        with io.StringIO(data.decode('utf8'), newline='') as ifp:
             reader = csv.reader(ifp, delimiter='\t', quoting=csv.QUOTE_NONE)
             sentences = []
             transliterations = []
@@ -210,7 +955,7 @@ class LocalSearch:
             translit_avail = False
             for row in reader:
                 # skip header and sentence breaks
-                if not row or not row[self.TOKEN]:
+                if not row or not row[cls.TOKEN]:
                     sentences.append(sentence)
                     if translit_avail:
                         transliterations.append(translit)
@@ -219,14 +964,14 @@ class LocalSearch:
                     continue
 
                 # header skip
-                if row[self.TOKEN] == 'TOKEN':
-                    if row[self.TRANSLIT] == 'ROMAN':
+                if row[cls.TOKEN] == 'TOKEN':
+                    if row[cls.TRANSLIT] == 'ROMAN':
                         translit_avail = True
                     continue
 
-                sentence.append(row[self.TOKEN])
+                sentence.append(row[cls.TOKEN])
                 if translit_avail:
-                    translit.append(row[self.TRANSLIT])
+                    translit.append(row[cls.TRANSLIT])
 
             # end of document sentence
             if sentence:
@@ -234,23 +979,42 @@ class LocalSearch:
                 if translit_avail:
                     transliterations.append(translit)
 
-            self.index.add(filename, sentences, transliterations)
+            index.add(filename, sentences, transliterations)
+        return entry
 
     def _get_path(self, filename):
         return os.path.join(self.index_dir, filename)
 
 
+def _index_shard(filenames):
+    """
+    Index a shard of the documents (module level so that it can run in a worker process)
+    :return: (InvertedIndex, manifest entries)
+    """
+    index = InvertedIndex()
+    manifest = {os.path.basename(filename): LocalSearch._add_doc_to_index(index, filename) for filename in filenames}
+    return index, manifest
+
+
 class GeonamesSearch:
-    def __init__(self, username, countries=None):
+    URL = 'http://api.geonames.org/search'
+    # connect and read timeouts in seconds
+    TIMEOUT = (3.05, 10)
+    MAX_ROWS = 20
+
+    def __init__(self, username, countries=None, session=None, cache=None, url=URL):
         """
         :param username: Geonames username
         :param countries: list of country codes
+        :param session: requests.Session shared between searches to reuse connections
+        :param cache: GeonamesCache or None
+        :param url: search endpoint
         """
         self.username = username
-        self.url = 'http://api.geonames.org/search?q={}&fuzzy={}&username={}&maxRows=20&type=json'
-        if countries:
-            for country in countries:
-                self.url += '&country=' + country
+        self.countries = countries or []
+        self.session = session or requests.Session()
+        self.cache = cache
+        self.url = url
 
     def retrieve(self, term, fuzzy=0.8):
         """
@@ -259,92 +1023,428 @@ class GeonamesSearch:
         :param fuzzy: Fuzzy threshold between 0 and 1 (exact match)
         :return: Geonames results object
         """
+        key = [term, fuzzy, sorted(self.countries)]
+        if self.cache is not None:
+            results = self.cache.get(key)
+            if results is not None:
+                return results
+        params = {
+            'q': term,
+            'fuzzy': fuzzy,
+            'username': self.username,
+            'maxRows': self.MAX_ROWS,
+            'type': 'json',
+            'country': self.countries,
+        }
         try:
-            response = requests.get(self.url.format(term, fuzzy, self.username))
+            response = self.session.get(self.url, params=params, timeout=self.TIMEOUT)
             response.raise_for_status()
-            return response.json()
+            results = response.json()
         except Exception as err:
             logger.warning('Error occurred: {}'.format(err))
             return None
+        # geonames reports errors like a bad username with a status object
+        if 'status' in results:
+            logger.warning('Error occurred: {}'.format(results['status'].get('message')))
+            return None
+        if self.cache is not None:
+            self.cache.put(key, results)
+        return results
+
+
+class GeonamesCache:
+    """
+    Persistent cache of geonames results shared by all annotators and server processes.
+
+    Entries expire after a time to live and the least recently used
+    entries are removed when the cache is full.
+    """
+    FILENAME = 'geonames.sqlite'
+    TTL = 30 * 24 * 60 * 60
+    MAX_ENTRIES = 10000
+
+    def __init__(self, metadata_dir, ttl=TTL, max_entries=MAX_ENTRIES):
+        """
+        :param metadata_dir: directory of the cache file
+        :param ttl: seconds before an entry expires
+        :param max_entries: number of entries to keep
+        """
+        self.filename = os.path.join(metadata_dir, self.FILENAME)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._created = False
+
+    def get(self, key):
+        """
+        :param key: json serializable key
+        :return: cached results or None
+        """
+        try:
+            with self._connect() as conn:
+                row = conn.execute('SELECT value, created FROM results WHERE key = ?', (json.dumps(key),)).fetchone()
+                if row is None:
+                    return None
+                now = time.time()
+                if row[1] < now - self.ttl:
+                    conn.execute('DELETE FROM results WHERE key = ?', (json.dumps(key),))
+                    return None
+                conn.execute('UPDATE results SET used = ? WHERE key = ?', (now, json.dumps(key)))
+                return json.loads(row[0])
+        except sqlite3.Error:
+            logger.exception('Cannot read the geonames cache')
+            return None
+
+    def put(self, key, value):
+        """
+        :param key: json serializable key
+        :param value: json serializable results
+        """
+        now = time.time()
+        try:
+            with self._connect() as conn:
+                conn.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)',
+                             (json.dumps(key), json.dumps(value), now, now))
+                conn.execute('DELETE FROM results WHERE created < ?', (now - self.ttl,))
+                conn.execute('DELETE FROM results WHERE key IN '
+                             '(SELECT key FROM results ORDER BY used DESC LIMIT -1 OFFSET ?)', (self.max_entries,))
+        except sqlite3.Error:
+            logger.exception('Cannot write to the geonames cache')
+
+    @contextlib.contextmanager
+    def _connect(self):
+        # a connection per call so that the cache can be used from any request thread
+        conn = sqlite3.connect(self.filename, timeout=10)
+        try:
+            with conn:
+                if not self._created:
+                    conn.execute('CREATE TABLE IF NOT EXISTS results '
+                                 '(key TEXT PRIMARY KEY, value TEXT, created REAL, used REAL)')
+                    conn.execute('CREATE INDEX IF NOT EXISTS results_used ON results (used)')
+                    self._created = True
+                yield conn
+        finally:
+            conn.close()
+
+
+class KeyIndex:
+    """
+    Immutable index from string keys to row ids.
+
+    Keys are held in a sorted array so exact and prefix lookups are binary searches.
+    Looking up a missing key never changes the index.
+    """
+    def __init__(self, keys, offsets, rows):
+        """
+        :param keys: sorted sequence of keys (a list or a StringTable)
+        :param offsets: start of the row ids of each key (with a final end offset)
+        :param rows: row ids grouped by key
+        """
+        self.keys = keys
+        self.offsets = offsets
+        self.rows = rows
+
+    @classmethod
+    def build(cls, pairs):
+        """
+        :param pairs: iterable of (key, row id)
+        """
+        keys = []
+        offsets = array.array('I', [0])
+        rows = array.array('I')
+        for key, row_id in sorted(pairs):
+            if not keys or keys[-1] != key:
+                if keys:
+                    offsets.append(len(rows))
+                keys.append(key)
+            rows.append(row_id)
+        if keys:
+            offsets.append(len(rows))
+        return cls(keys, offsets, rows)
+
+    def get(self, key):
+        """Row ids for the key"""
+        index = bisect.bisect_left(self.keys, key)
+        if index < len(self.keys) and self.keys[index] == key:
+            return self.rows[self.offsets[index]:self.offsets[index + 1]].tolist()
+        return []
+
+    def frequency(self, index):
+        return self.offsets[index + 1] - self.offsets[index]
+
+    def prefix(self, prefix, limit=None, by_frequency=False):
+        """
+        Keys that start with a prefix
+        :param prefix: key prefix
+        :param limit: maximum number of keys to return
+        :param by_frequency: order by number of rows rather than alphabetically
+        :return: list of keys
+        """
+        start, end = prefix_range(self.keys, prefix)
+        if by_frequency:
+            if limit is None:
+                indices = sorted(range(start, end), key=lambda i: -self.frequency(i))
+            else:
+                indices = heapq.nsmallest(limit, range(start, end), key=lambda i: -self.frequency(i))
+            return [self.keys[i] for i in indices]
+        if limit is not None:
+            end = min(end, start + limit)
+        return [self.keys[i] for i in range(start, end)]
+
+    def __len__(self):
+        return len(self.keys)
 
 
 class DictionarySearch:
     """
-    Search over a bilingual dictionary with optional transliteration column
+    Search over a bilingual dictionary with optional transliteration column.
+
+    The parsed dictionary is cached in a memory mapped file next to it so that
+    it is only parsed again when the text file changes.
     """
     FILENAME = 'combodict.txt'
+    CACHE_FILENAME = 'combodict.dat'
+    MAGIC = b'DFCD'
+    VERSION = 1
+    META, ROW_OFFSETS, ROW_BLOB = range(3)
     IL = 0
     ENG = 1
     TRANS = 2
 
     def __init__(self, metadata_dir):
         self.filename = os.path.join(metadata_dir, self.FILENAME)
+        self.cache_filename = os.path.join(metadata_dir, self.CACHE_FILENAME)
         self.loaded = False
         self.data = []
-        self.il_index = collections.defaultdict(list)
-        self.english_index = collections.defaultdict(list)
-        self.trans_index = collections.defaultdict(list)
+        self.indexes = {}
         self.trans_available = None
+        self._lock = threading.Lock()
 
     @property
     def available(self):
         return os.path.exists(self.filename)
 
+    def load(self):
+        """
+        Load the dictionary if it has not been loaded (safe to call from a background thread)
+        :return: whether the dictionary is available
+        """
+        with self._lock:
+            if not self.available:
+                return False
+            if not self.loaded:
+                self._load()
+            return True
+
     def retrieve(self, term, column):
-        if not self.loaded:
-            self._load()
-        term = term.lower()
-        if column == self.IL:
-            return self.il_index[term]
-        elif column == self.ENG:
-            return self.english_index[term]
-        elif column == self.TRANS:
-            return self.trans_index[term]
-
-    def suggest(self, term, column):
-        if not self.loaded:
-            self._load()
-        index = {}
-        if column == self.IL:
-            index = self.il_index
-        elif column == self.ENG:
-            print('english')
-            index = self.english_index
-        elif column == self.TRANS:
-            index = self.trans_index
-        matches = fnmatch.filter(index.keys(), term.lower() + '*')
-        results = []
-        for match in matches:
-            results.append(match)
-        results.sort()
-        return results
+        self.load()
+        if column not in self.indexes:
+            return []
+        return [self.data[row_id] for row_id in self.indexes[column].get(term.lower())]
+
+    def gloss(self, words, column=IL):
+        """
+        Look up a batch of words
+        :param words: iterable of lower cased words
+        :param column: Column of the dictionary to search
+        :return: dictionary of word -> english of the first entry for the words in the dictionary
+        """
+        if not self.load() or column not in self.indexes:
+            return {}
+        index = self.indexes[column]
+        glosses = {}
+        for word in words:
+            rows = index.get(word)
+            if rows:
+                glosses[word] = self.data[rows[0]][self.ENG]
+        return glosses
+
+    def entries(self, column=IL):
+        """
+        All of the keys of a column
+        :param column: Column of the dictionary
+        :return: generator of (key, english of the first entry)
+        """
+        if not self.load() or column not in self.indexes:
+            return
+        index = self.indexes[column]
+        for i, key in enumerate(index.keys):
+            yield key, self.data[index.rows[index.offsets[i]]][self.ENG]
+
+    def suggest(self, term, column, limit=None, by_frequency=False):
+        """
+        Suggest dictionary keys that start with the term
+        :param term: Prefix to complete
+        :param column: Column of the dictionary to search
+        :param limit: Maximum number of suggestions
+        :param by_frequency: Order by the number of entries for the key rather than alphabetically
+        :return: list of keys
+        """
+        self.load()
+        if column not in self.indexes:
+            return []
+        return self.indexes[column].prefix(term.lower(), limit, by_frequency)
 
     def _load(self):
+        with open(self.filename, 'rb') as fp:
+            digest = hashlib.sha1(fp.read()).digest()
+        if not self._load_cache(digest):
+            self._parse()
+            try:
+                self._save_cache(digest)
+            except OSError:
+                logger.exception('Cannot cache the dictionary')
         self.loaded = True
+
+    def _parse(self):
+        self.data = []
+        self.trans_available = None
+        keys = {self.IL: [], self.ENG: [], self.TRANS: []}
         with open(self.filename, 'r', encoding='utf8') as fp:
             reader = csv.reader(fp, delimiter='\t', quoting=csv.QUOTE_NONE)
-            for row in reader:
+            for row_id, row in enumerate(reader):
                 if self.trans_available is None:
                     self.trans_available = len(row) == 3
                 self.data.append(row)
-                self.il_index[row[self.IL].lower()].append(self.data[-1])
+                keys[self.IL].append((row[self.IL].lower(), row_id))
                 # remove prefix
                 english_words = row[self.ENG].split(' | ')
                 english_words = [re.sub(r'[A-Z]{2}_', '', w) for w in english_words]
                 for w in english_words:
-                    self.english_index[w.lower()].append(self.data[-1])
+                    keys[self.ENG].append((w.lower(), row_id))
                 if self.trans_available:
-                    self.trans_index[row[self.TRANS].lower()].append(self.data[-1])
+                    keys[self.TRANS].append((row[self.TRANS].lower(), row_id))
+        self.indexes = {column: KeyIndex.build(pairs) for column, pairs in keys.items()}
+
+    def _save_cache(self, digest):
+        writer = SectionWriter(self.MAGIC, self.VERSION)
+        writer.add(digest + bytes([bool(self.trans_available)]))
+        for section in StringTable.build('\t'.join(row) for row in self.data):
+            writer.add(section)
+        for column in (self.IL, self.ENG, self.TRANS):
+            index = self.indexes[column]
+            for section in StringTable.build(index.keys):
+                writer.add(section)
+            writer.add(index.offsets)
+            writer.add(index.rows)
+        writer.write(self.cache_filename)
+
+    def _load_cache(self, digest):
+        """Map the cached dictionary if it was compiled from the current text file"""
+        try:
+            reader = SectionReader(self.cache_filename, self.MAGIC, self.VERSION)
+        except (OSError, ValueError):
+            return False
+        meta = reader.bytes(self.META)
+        if meta[:len(digest)] != digest:
+            return False
+        self.trans_available = bool(meta[len(digest)])
+        self.data = _RowTable(reader.array(self.ROW_OFFSETS, 'Q'), reader.bytes(self.ROW_BLOB))
+        self.indexes = {}
+        for i, column in enumerate((self.IL, self.ENG, self.TRANS)):
+            section = self.ROW_BLOB + 1 + 4 * i
+            keys = StringTable(reader.array(section, 'Q'), reader.bytes(section + 1))
+            self.indexes[column] = KeyIndex(keys, reader.array(section + 2, 'I'), reader.array(section + 3, 'I'))
+        return True
 
     def copy(self, data):
-        with open(self.filename, 'w') as fp:
+        with self._lock, open(self.filename, 'w') as fp:
             fp.write(data)
             self.loaded = False
             self.trans_available = None
-            self.data.clear()
-            self.english_index.clear()
-            self.il_index.clear()
-            self.trans_index.clear()
+            self.data = []
+            self.indexes = {}
+
+
+class _RowTable(StringTable):
+    # rows of the dictionary stored as tab separated strings
+    def __getitem__(self, index):
+        return super().__getitem__(index).split('\t')
+
+
+class DictionaryMatcher:
+    """
+    Finds the entries of the user translation dictionary and the multi-word entries
+    of the bilingual dictionary in sentences with an Aho-Corasick automaton.
+
+    The automaton is compiled on first use and then only when a dictionary changes.
+    The multi-word entries of the bilingual dictionary are kept between builds so that
+    a change to the user dictionary does not scan the bilingual dictionary again.
+    """
+    USER = 'user'
+    DICTIONARY = 'dictionary'
+
+    def __init__(self, translation_manager, dictionary_search, lang):
+        self.translation_manager = translation_manager
+        self.dictionary_search = dictionary_search
+        self.lang = lang
+        self._automaton = None
+        self._stamp = None
+        self._dictionary_entries = None
+        self._dictionary_stamp = None
+        self._lock = threading.Lock()
+
+    @property
+    def version(self):
+        """Value that changes whenever either dictionary changes"""
+        return self.translation_manager.version(self.lang), self._file_stamp(self.dictionary_search.filename)
+
+    @property
+    def automaton(self):
+        stamp = self.version
+        with self._lock:
+            if self._automaton is None or stamp != self._stamp:
+                self._automaton = self._build(stamp[1])
+                self._stamp = stamp
+            return self._automaton
+
+    def match(self, tokens):
+        """
+        Find the leftmost longest entries in a sentence
+        :param tokens: list of strings
+        :return: list of (start, end, (translation, entity type, USER or DICTIONARY))
+        """
+        return longest_matches(self.automaton.find(tokens))
+
+    def user_phrases(self, document):
+        """
+        Find the multi-word entries of the user translation dictionary that occur in a document
+        :param document: Document
+        :return: set of lower cased entries
+        """
+        automaton = self.automaton
+        phrases = set()
+        for sentence in document.sentences:
+            tokens = sentence.rows[Sentence.TOKEN].strings
+            for start, end, value in automaton.find(tokens):
+                if end - start > 1 and value[2] == self.USER:
+                    phrases.add(' '.join(tokens[start:end]).lower())
+        return phrases
+
+    def _build(self, dictionary_stamp):
+        if self._dictionary_entries is None or dictionary_stamp != self._dictionary_stamp:
+            # single words of the bilingual dictionary are left to the dictionary search
+            self._dictionary_entries = []
+            for key, gloss in self.dictionary_search.entries():
+                tokens = key.split()
+                if len(tokens) > 1:
+                    self._dictionary_entries.append((tokens, gloss))
+            self._dictionary_stamp = dictionary_stamp
+        automaton = AhoCorasick()
+        for tokens, gloss in self._dictionary_entries:
+            automaton.add(tokens, (gloss, '', self.DICTIONARY))
+        # user translations replace bilingual dictionary entries
+        for source, (translation, entity_type) in self.translation_manager.get(self.lang).items():
+            automaton.add(source.split(), (translation, entity_type, self.USER))
+        automaton.build()
+        return automaton
+
+    @staticmethod
+    def _file_stamp(filename):
+        try:
+            stat = os.stat(filename)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
 
 
 class PhrasesSearch:
@@ -352,36 +1452,171 @@ class PhrasesSearch:
     Search over a bilingual phrase table.
 
     il word -> [{il -> phrase, eng -> phrase}, ...]
+
+    The table is stored as sorted words with the offsets of their json encoded
+    phrases in a memory mapped file so that a lookup only decodes one entry.
+    The store is built by streaming the json so the table is never all in memory.
     """
     FILENAME = 'phrases.json'
+    STORE_FILENAME = 'phrases.dat'
+    MAGIC = b'DFPT'
+    VERSION = 1
+    KEY_OFFSETS, KEY_BLOB, VALUE_STARTS, VALUE_ENDS, VALUES = range(5)
+    CHUNK_SIZE = 1 << 16
 
     def __init__(self, metadata_dir):
         self.filename = os.path.join(metadata_dir, self.FILENAME)
+        self.store_filename = os.path.join(metadata_dir, self.STORE_FILENAME)
         self.loaded = False
-        self.index = collections.defaultdict(list)
+        self.keys = None
+        self.starts = None
+        self.ends = None
+        self.values = None
+        self._reader = None
+        self._lock = threading.Lock()
 
     @property
     def available(self):
-        return os.path.exists(self.filename)
+        return os.path.exists(self.store_filename) or os.path.exists(self.filename)
+
+    def load(self):
+        """
+        Load the phrase table if it has not been loaded (safe to call from a background thread)
+        :return: whether the phrase table is available
+        """
+        with self._lock:
+            if not self.available:
+                return False
+            if not self.loaded or self._reader.is_stale():
+                self._load()
+            return True
 
     def retrieve(self, term):
-        if not self.loaded:
-            self._load()
-        term = term.lower()
-        return self.index[term]
+        if not self.load():
+            return []
+        index = self.keys.find(term.lower())
+        if index is None:
+            return []
+        return json.loads(str(self.values[self.starts[index]:self.ends[index]], 'utf8'))
 
     def _load(self):
+        if self._json_is_newer():
+            with open(self.filename, 'r', encoding='utf8') as fp:
+                self._build(fp)
+        self._reader = SectionReader(self.store_filename, self.MAGIC, self.VERSION)
+        self.keys = StringTable(self._reader.array(self.KEY_OFFSETS, 'Q'), self._reader.bytes(self.KEY_BLOB))
+        self.starts = self._reader.array(self.VALUE_STARTS, 'Q')
+        self.ends = self._reader.array(self.VALUE_ENDS, 'Q')
+        self.values = self._reader.bytes(self.VALUES)
         self.loaded = True
-        with open(self.filename, 'r', encoding='utf8') as fp:
-            data = json.load(fp)
-            for k, v in data.items():
-                self.index[k] = v
 
-    def copy(self, data):
-        with open(self.filename, 'w', encoding='utf-8') as fp:
-            fp.write(data)
+    def _json_is_newer(self):
+        # phrases.json copied into the metadata directory after the store was built
+        if not os.path.exists(self.filename):
+            return False
+        if not os.path.exists(self.store_filename):
+            return True
+        return os.path.getmtime(self.filename) > os.path.getmtime(self.store_filename)
+
+    def _build(self, fp):
+        """
+        Write the store from a json phrase table
+        :param fp: text file object
+        """
+        spans = {}
+        with tempfile.TemporaryFile(dir=os.path.dirname(self.store_filename)) as values:
+            for key, phrases in _iter_json_object(fp, self.CHUNK_SIZE):
+                data = json.dumps(phrases, ensure_ascii=False).encode('utf8')
+                start = values.tell()
+                values.write(data)
+                spans[key] = (start, start + len(data))
+            keys = sorted(spans)
+            writer = SectionWriter(self.MAGIC, self.VERSION)
+            for section in StringTable.build(keys):
+                writer.add(section)
+            writer.add(array.array('Q', (spans[key][0] for key in keys)))
+            writer.add(array.array('Q', (spans[key][1] for key in keys)))
+            writer.add(values)
+            writer.write(self.store_filename)
+
+    def copy(self, fp):
+        """
+        Import a phrase table
+        :param fp: binary file object with the json
+        :raises ValueError: if the file is not a json object
+        """
+        with self._lock:
+            self._build(codecs.getreader('utf8')(fp))
             self.loaded = False
-            self.index.clear()
+
+
+def _iter_json_object(fp, chunk_size):
+    """
+    Read the members of a top level json object a chunk at a time
+    :param fp: text file object
+    :param chunk_size: number of characters to read at a time
+    :return: generator of (key, value)
+    """
+    stream = _JSONStream(fp, chunk_size)
+    stream.expect('{')
+    if stream.peek() == '}':
+        return
+    while True:
+        key = stream.decode()
+        if not isinstance(key, str):
+            raise ValueError('Expected a string key')
+        stream.expect(':')
+        yield key, stream.decode()
+        if stream.expect(',}') == '}':
+            return
+
+
+class _JSONStream:
+    # buffer over a text file that json values are decoded from one at a time
+    WHITESPACE = re.compile(r'\s*')
+
+    def __init__(self, fp, chunk_size):
+        self.fp = fp
+        self.chunk_size = chunk_size
+        self.buffer = ''
+        self.position = 0
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self):
+        # read at least as much as is buffered so that large values are not decoded many times
+        data = self.fp.read(max(self.chunk_size, len(self.buffer) - self.position))
+        if not data:
+            return False
+        self.buffer = self.buffer[self.position:] + data
+        self.position = 0
+        return True
+
+    def peek(self):
+        while True:
+            self.position = self.WHITESPACE.match(self.buffer, self.position).end()
+            if self.position < len(self.buffer) or not self._fill():
+                return self.buffer[self.position:self.position + 1]
+
+    def expect(self, chars):
+        char = self.peek()
+        if not char or char not in chars:
+            raise ValueError('Expected {} but found {!r}'.format(' or '.join(chars), char))
+        self.position += 1
+        return char
+
+    def decode(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.position)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # a number at the end of the buffer may continue in the next chunk
+            if end < len(self.buffer) or not self._fill():
+                self.position = end
+                return value
 
 
 class DocumentStats:
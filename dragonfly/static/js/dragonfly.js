@@ -34,6 +34,7 @@ dragonfly.Events = {
     PREVIOUS: 'df:previous',
     CHANGE_SETTINGS: 'df:change_settings',
     LEAVE: 'df:leave',
+    LOAD_SENTENCES: 'df:load_sentences',
 };
 
 dragonfly.EventDispatcher = class EventDispatcher {
@@ -250,8 +251,13 @@ dragonfly.Hints = class Hints {
      * @param {string} row - One-based index of row to apply hints to.
      */
     constructor(row) {
+        var self = this;
         this.row = row;
         this.hints = [];
+
+        $(window).on(dragonfly.Events.LOAD_SENTENCES, function(event, elements) {
+            self.apply(elements);
+        });
     }
 
     /**
@@ -275,8 +281,7 @@ dragonfly.Hints = class Hints {
     }
 
     /**
-     * Apply the hints to the web page.
-     * If more than one hint matches a string, only the first one is applied.
+     * Compile the hints and apply them to the web page.
      */
     process() {
         var self = this;
@@ -288,11 +293,20 @@ dragonfly.Hints = class Hints {
                 this.hints[i].regex = null;
             }
         }
+        this.apply(document);
+    }
 
+    /**
+     * Apply the hints to part of the web page.
+     * If more than one hint matches a string, only the first one is applied.
+     * @param {Element} root - Element containing the sentences.
+     */
+    apply(root) {
+        var self = this;
         var span1 = '<span class="df-hint" data-toggle="tooltip" title="';
         var span2 = '">$1</span>'
         var selector = ".df-main .df-row > div:nth-child(" + this.row + ")";
-        $(selector).each(function() {
+        $(root).find(selector).each(function() {
             for (var i = 0; i < self.hints.length; i++) {
                 var text = $(this).text();
                 var newText = text.replace(self.hints[i].regex, span1 + self.hints[i].comment + span2);
@@ -304,7 +318,7 @@ dragonfly.Hints = class Hints {
             }
         });
 
-        $(".df-hint").tooltip({delay: 200, placement: 'auto top'});
+        $(root).find(".df-hint").tooltip({delay: 200, placement: 'auto top'});
     }
 };
 
@@ -317,7 +331,7 @@ dragonfly.Markers = class Markers {
         var self = this;
 
         // user can indicate which sentences have been reviewed
-        $(".df-sentence-badge").on("click", function(event) {
+        $(".df-main").on("click", ".df-sentence-badge", function(event) {
             self.toggle([this]);
         });
     }
@@ -487,7 +501,10 @@ dragonfly.Search = class Search {
         };
         this.currentMode = this.modes.local;
         this.currentQuery = null;
+        this.localQuery = null;
+        this.status = {};
         this._initializeHandlers();
+        this.checkStatus();
 
         // we load javascript libraries on demand and want to cache them
         $.ajaxSetup({cache: true});
@@ -520,6 +537,12 @@ dragonfly.Search = class Search {
             self.searchFiles($(this).find('input[name="term"]').val(), true);
         });
 
+        // load the next page of local search results
+        $('.df-results-local').on('click', '.df-search-local-more', function() {
+            var offset = parseInt($(this).attr('data-offset'));
+            self.searchFiles(self.localQuery.term, self.localQuery.manual, offset);
+        });
+
         $('#df-search-geonames-form').on('submit', function(event) {
             event.preventDefault();
             $(this).find('button').blur();
@@ -634,22 +657,39 @@ dragonfly.Search = class Search {
      * Search the local index
      * @param {string} word - Search term.
      * @param {bool} manual - Whether the user manually typed the term.
+     * @param {int} offset - Number of results to skip when loading more results.
      */
-    searchFiles(word, manual) {
+    searchFiles(word, manual, offset = 0) {
         var self = this;
-        if (!manual) {
+        if (!manual && offset == 0) {
             if (this.currentMode != this.modes.local) {
                 this.use(this.modes.local);
             }
             $('#df-search-local-form').find('input[name="term"]').val(word);
         }
+        if (this.isLoading('local')) {
+            return;
+        }
+        if (this.status['local'] == 'failed') {
+            // an earlier index may still be loaded so search it anyway
+            dragonfly.showStatus('danger', 'Building the search index failed. Results may be missing or out of date.');
+        }
+        // later pages keep the ordering of the first page
+        var ranked = offset > 0 ? this.localQuery.ranked :
+            $('#df-search-local-form').find('input[name="ranked"]').is(':checked');
+        this.localQuery = {term: word, manual: manual, ranked: ranked};
         $.ajax({
             url: 'search/local',
             type: 'POST',
-            data: {'term': word, 'manual': manual},
+            data: {'term': word, 'manual': manual, 'offset': offset, 'ranked': ranked},
             dataType: 'html',
             success: function(html) {
-                $('.df-results-local').html(html);
+                if (offset == 0) {
+                    $('.df-results-local').html(html);
+                } else {
+                    $('.df-results-local').find('.df-search-local-more').remove();
+                    $('.df-results-local').append(html);
+                }
             },
             error: function(xhr) {
                 dragonfly.showStatus('danger', 'Error contacting the server');
@@ -678,6 +718,37 @@ dragonfly.Search = class Search {
         });
     }
 
+    /**
+     * Show whether the search resources are loading or ready and poll until they have loaded
+     */
+    checkStatus() {
+        var self = this;
+        $.get('search/status', function(status) {
+            self.status = status;
+            var loading = false;
+            $('.df-search-status').each(function() {
+                var state = status[$(this).attr('data-resource')];
+                $(this).attr('data-state', state).text(state && state != 'unavailable' ? '(' + state + ')' : '');
+                loading = loading || state == 'loading';
+            });
+            if (loading) {
+                setTimeout(function() { self.checkStatus(); }, 1000);
+            }
+        });
+    }
+
+    /**
+     * Is a search resource still loading on the server
+     * @param {string} resource - Name of the resource (local, dictionary, phrases).
+     */
+    isLoading(resource) {
+        if (this.status[resource] == 'loading') {
+            dragonfly.showStatus('warning', 'Search is still loading. Try again in a moment.');
+            return true;
+        }
+        return false;
+    }
+
     /**
      * Search a bilingual dictionary
      * @param {string} word - Search term
@@ -685,6 +756,9 @@ dragonfly.Search = class Search {
      */
     searchDictionary(word, column) {
         var self = this;
+        if (this.isLoading('dictionary')) {
+            return;
+        }
         $.ajax({
             url: 'search/dict',
             type: 'POST',
@@ -705,6 +779,9 @@ dragonfly.Search = class Search {
      */
     searchPhrases(word) {
         var self = this;
+        if (this.isLoading('phrases')) {
+            return;
+        }
         $.ajax({
             url: 'search/phrases',
             type: 'POST',
@@ -847,7 +924,7 @@ dragonfly.ContextMenu = class ContextMenu {
         this.modal = $("#df-context-menu");
         this.translationManager = translationManager;
 
-        $(".df-token").on("contextmenu", function(event) {
+        $(".df-main").on("contextmenu", ".df-token", function(event) {
             self._show($(this), event);
         });
 
@@ -1023,22 +1100,29 @@ dragonfly.Translations = class Translations {
      * Create a translations manager.
      */
     constructor(lang) {
+        var self = this;
         this.lang = lang;
         this.transMap = new Map();
+
+        $(window).on(dragonfly.Events.LOAD_SENTENCES, function(event, elements) {
+            self.apply(elements);
+        });
     }
 
     /**
-     * Load the translations and apply them to the page.
+     * Load the translations of the document's tokens and multi-word entries and apply them to the page.
      */
     load() {
         var self = this;
         $.ajax({
-            url: 'translations/get/' + this.lang,
-            type: 'GET',
+            url: 'translations/gloss',
+            type: 'POST',
+            contentType: 'application/json',
+            data: JSON.stringify({'doc': dragonfly.filename}),
             dataType: 'json',
             success: function(data) {
-                self.createMap(data);
-                self.apply();
+                self.createMap(data.user);
+                self.apply(document);
             },
             error: function(xhr) {
                 dragonfly.showStatus('danger', 'Error contacting the server');
@@ -1090,10 +1174,12 @@ dragonfly.Translations = class Translations {
 
     /**
      * Apply the translations to the web page.
+     * @param {Element} root - Element containing the sentences.
      */
-    apply() {
+    apply(root) {
         var self = this;
-        $(".df-token").each(function() {
+        // the server has already marked the dictionary entries of the document (including multi-word ones)
+        $(root).find(".df-token").not('.df-in-dict, .df-in-combodict').each(function() {
             var token = $(this).attr('data-token').toLowerCase();
             if (self.transMap.has(token)) {
                 if (self.transMap.get(token).type) {
@@ -1107,7 +1193,7 @@ dragonfly.Translations = class Translations {
             }
         });
         // this does all tooltips including in non-token rows
-        $('[data-toggle=tooltip]').tooltip({delay: 200, placement: 'auto left', container: 'body'});
+        $(root).find('[data-toggle=tooltip]').tooltip({delay: 200, placement: 'auto left', container: 'body'});
     }
 
     /**
@@ -1418,10 +1504,15 @@ dragonfly.Highlighter = class Highlighter {
     _initializeHandlers() {
         var self = this;
 
-        $(".df-token").on("click", function(event) {
+        $(".df-main").on("click", ".df-token", function(event) {
             self.clickToken($(this), event);
         });
 
+        $(window).on(dragonfly.Events.LOAD_SENTENCES, function(event, elements) {
+            self.undoActive = false;
+            self.initializeHighlight(elements);
+        });
+
         $(document).on("keyup", function(event) {
             if (event.which == self.multiTokenKey) {
                 self.setControlKeyUp();
@@ -1552,11 +1643,12 @@ dragonfly.Highlighter = class Highlighter {
 
     /**
      * Apply previous annotations for visualization.
+     * @param {Element} root - Element containing the sentences (default is the whole page).
      */
-    initializeHighlight() {
+    initializeHighlight(root = document) {
         var self = this;
         var mismatchedTags = new Set();
-        $(".df-token").each(function() {
+        $(root).find(".df-token").each(function() {
             var tagValue = $(this).data("tag");
             if (tagValue != null && tagValue != "O") {
                 var tagType = self.tagTypes.getTagTypeFromString(tagValue);
@@ -1576,15 +1668,16 @@ dragonfly.Highlighter = class Highlighter {
             dragonfly.showStatus('danger', 'Incompatible saved annotations: ' + tags);
         }
 
-        this.initializeAdjudicationHighlight();
+        this.initializeAdjudicationHighlight(root);
     };
 
     /**
      * Highlight adjudication rows
+     * @param {Element} root - Element containing the sentences.
      */
-    initializeAdjudicationHighlight() {
+    initializeAdjudicationHighlight(root) {
         var map = this.tagTypes.getReversedMap();
-        $(".df-adjudicate").each(function() {
+        $(root).find(".df-adjudicate").each(function() {
             var value = $(this).text();
             if (value in map) {
                 $(this).addClass("df-tag-" + map[value]);
@@ -1816,6 +1909,79 @@ dragonfly.Highlighter = class Highlighter {
     }
 };
 
+/**
+ * Load the sentences of a long document a window at a time as the user scrolls
+ */
+dragonfly.SentenceWindow = class SentenceWindow {
+    /**
+     * Create the sentence window.
+     * @param {string} filename - The filename being edited.
+     */
+    constructor(filename) {
+        var self = this;
+        this.filename = filename;
+        this.main = $(".df-main");
+        // only set when the server rendered part of the document
+        this.total = this.main.data("sentences");
+        this.next = this.main.children(".df-sentence").length;
+        this.loading = false;
+
+        if (this.isWindowed()) {
+            this.main.on("scroll", function() {
+                self.checkScroll();
+            });
+        }
+    }
+
+    /**
+     * Is the document rendered a window of sentences at a time?
+     * @return {boolean}
+     */
+    isWindowed() {
+        return this.total !== undefined;
+    }
+
+    /**
+     * Load more sentences when the user is within a screen of the end of the loaded ones.
+     */
+    checkScroll() {
+        var element = this.main[0];
+        if (this.isWindowed() && element.scrollTop + 2 * element.clientHeight >= element.scrollHeight) {
+            this.load();
+        }
+    }
+
+    /**
+     * Load the next window of sentences.
+     */
+    load() {
+        if (this.loading || this.next >= this.total) {
+            return;
+        }
+        var self = this;
+        this.loading = true;
+        $.ajax({
+            url: 'sentences/' + encodeURIComponent(this.filename),
+            type: 'GET',
+            data: {start: this.next},
+            dataType: 'json',
+            success: function(data) {
+                var elements = $($.parseHTML(data.html));
+                self.main.append(elements);
+                self.next = data.stop;
+                self.loading = false;
+                $(window).trigger(dragonfly.Events.LOAD_SENTENCES, [elements]);
+                // positions the sentence ids and loads more if the screen is not full yet
+                self.main.trigger("scroll");
+            },
+            error: function(xhr) {
+                self.loading = false;
+                dragonfly.showStatus('danger', 'Error contacting the server');
+            }
+        });
+    }
+};
+
 dragonfly.AnnotationSaver = class AnnotationSaver {
     /**
      * Create an annotation saver.
@@ -1824,13 +1990,15 @@ dragonfly.AnnotationSaver = class AnnotationSaver {
      * @param {Highlighter} highlighter - Dragonfly highlighter.
      * @param {boolean} terminalBlankLine - Whether to write blank line to end of file.
      * @param {boolean} viewOnly - In view only mode, there is no saving.
+     * @param {SentenceWindow} sentenceWindow - Loads the sentences of long documents.
      */
-    constructor(filename, settings, highlighter, terminalBlankLine, viewOnly) {
+    constructor(filename, settings, highlighter, terminalBlankLine, viewOnly, sentenceWindow) {
         this.filename = filename;
         this.settings = settings;
         this.highlighter = highlighter;
         this.terminalBlankLine = terminalBlankLine;
         this.viewOnly = viewOnly;
+        this.sentenceWindow = sentenceWindow;
         this.saveClicked = false;
         this.timerId = null;
 
@@ -1874,10 +2042,13 @@ dragonfly.AnnotationSaver = class AnnotationSaver {
 
         var self = this;
         this.saveClicked = true;
-        var data = {
-            filename: this.filename,
-            tokens: this._collectAnnotations()
-        };
+        var data = {filename: this.filename};
+        if (this.sentenceWindow.isWindowed()) {
+            // the server merges these with the saved annotations of the sentences that are not loaded
+            data.sentences = this._collectSentences();
+        } else {
+            data.tokens = this._collectAnnotations();
+        }
         $.ajax({
             url: 'save',
             type: 'POST',
@@ -1903,19 +2074,11 @@ dragonfly.AnnotationSaver = class AnnotationSaver {
      * @return {array} An array of token tag information.
      */
     _collectAnnotations() {
+        var self = this;
         var tokens = [];
         // df-sentence only used for annotation text
         $(".df-sentence").each(function() {
-            $(this).find(".df-token").each(function() {
-                var tagValue = $(this).data('tag');
-                var tokenText = $(this).attr('data-token');
-                if (tagValue != null) {
-                    var token = {token: tokenText, tag: tagValue }
-                } else {
-                    var token = {token: tokenText, tag: 'O'}
-                }
-                tokens.push(token);
-            });
+            tokens.push(...self._collectSentence(this));
             // end of sentence gets a blank line
             tokens.push({});
         });
@@ -1925,6 +2088,41 @@ dragonfly.AnnotationSaver = class AnnotationSaver {
         return tokens;
     }
 
+    /**
+     * Collect annotations of the loaded sentences from the DOM.
+     * @return {object} Sentence index -> array of token tag information.
+     */
+    _collectSentences() {
+        var self = this;
+        var sentences = {};
+        $(".df-sentence").each(function() {
+            // df-sentence-[index]
+            var index = $(this).attr('id').split("-")[2];
+            sentences[index] = self._collectSentence(this);
+        });
+        return sentences;
+    }
+
+    /**
+     * Collect the annotations of a sentence.
+     * @param {Element} sentence - The df-sentence element.
+     * @return {array} An array of token tag information.
+     */
+    _collectSentence(sentence) {
+        var tokens = [];
+        $(sentence).find(".df-token").each(function() {
+            var tagValue = $(this).data('tag');
+            var tokenText = $(this).attr('data-token');
+            if (tagValue != null) {
+                var token = {token: tokenText, tag: tagValue }
+            } else {
+                var token = {token: tokenText, tag: 'O'}
+            }
+            tokens.push(token);
+        });
+        return tokens;
+    }
+
     _configureAutoSave() {
         if (this.settings.isAutoSave()) {
             if (this.timerId == null) {
@@ -1951,8 +2149,9 @@ $(document).ready(function() {
     dragonfly.search = new dragonfly.Search(dragonfly.settings);
     dragonfly.highlighter = new dragonfly.Highlighter(dragonfly.tagTypes, dragonfly.search, dragonfly.settings);
     dragonfly.highlighter.initializeHighlight();
+    dragonfly.sentenceWindow = new dragonfly.SentenceWindow(dragonfly.filename);
     dragonfly.annotationSaver = new dragonfly.AnnotationSaver(dragonfly.filename, dragonfly.settings,
-        dragonfly.highlighter, dragonfly_terminal_blank_line, view_only);
+        dragonfly.highlighter, dragonfly_terminal_blank_line, view_only, dragonfly.sentenceWindow);
     dragonfly.translations = new dragonfly.Translations(dragonfly.lang);
     dragonfly.translations.load();
     dragonfly.contextMenu = new dragonfly.ContextMenu(dragonfly.translations);
@@ -1960,6 +2159,8 @@ $(document).ready(function() {
     dragonfly.hints.run();
     dragonfly.markers = new dragonfly.Markers();
     dragonfly.notepad = new dragonfly.Notepad(dragonfly.filename, dragonfly.settings.areNotesDocumentSpecific());
+    // the first window of a long document may not fill the screen
+    dragonfly.sentenceWindow.checkScroll();
 
     $(window).on(dragonfly.Events.NEXT, function() {
         var url = $('#df-next-doc').attr('href');
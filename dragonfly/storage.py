@@ -0,0 +1,170 @@
+# Copyright 2017-2019, The Johns Hopkins University Applied Physics Laboratory LLC
+# All rights reserved.
+# Distributed under the terms of the Apache 2.0 License.
+
+import array
+import bisect
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+
+
+class SectionWriter:
+    """
+    Write a file made of aligned binary sections that can be memory mapped.
+
+    The header holds a magic string, a format version, a byte order marker and
+    the offset/length of each section. Sections are bytes, array.array objects
+    which are written in native byte order or binary files which are copied in.
+    """
+    HEADER = struct.Struct('<4sIII')
+    SECTION = struct.Struct('<QQ')
+    BYTE_ORDER_MARK = 0x01020304
+    ALIGNMENT = 8
+
+    def __init__(self, magic, version):
+        self.magic = magic
+        self.version = version
+        self.sections = []
+
+    def add(self, data):
+        """
+        Add a section
+        :param data: bytes, array.array or binary file object
+        :return: section index
+        """
+        self.sections.append(data)
+        return len(self.sections) - 1
+
+    def write(self, filename):
+        """
+        Write the file atomically so that processes with the old file mapped are not affected
+        """
+        header_size = self.HEADER.size + self.SECTION.size * len(self.sections)
+        offset = self._align(header_size)
+        table = []
+        for data in self.sections:
+            length = self._length(data)
+            table.append((offset, length))
+            offset = self._align(offset + length)
+
+        # a unique temporary file so that processes sharing the directory can write at the same time
+        fd, tmp_filename = tempfile.mkstemp(prefix=os.path.basename(filename) + '.', suffix='.tmp',
+                                            dir=os.path.dirname(os.path.abspath(filename)))
+        try:
+            with os.fdopen(fd, 'wb') as fp:
+                fp.write(self.HEADER.pack(self.magic, self.version, self.BYTE_ORDER_MARK, len(self.sections)))
+                for entry in table:
+                    fp.write(self.SECTION.pack(*entry))
+                for data, (offset, length) in zip(self.sections, table):
+                    fp.write(b'\0' * (offset - fp.tell()))
+                    if isinstance(data, array.array):
+                        data.tofile(fp)
+                    elif hasattr(data, 'read'):
+                        data.seek(0)
+                        shutil.copyfileobj(data, fp)
+                    else:
+                        fp.write(data)
+            # mkstemp only gives the owner access
+            os.chmod(tmp_filename, 0o644)
+            os.replace(tmp_filename, filename)
+        except BaseException:
+            os.remove(tmp_filename)
+            raise
+
+    @staticmethod
+    def _length(data):
+        if isinstance(data, array.array):
+            return data.itemsize * len(data)
+        if hasattr(data, 'read'):
+            return data.seek(0, os.SEEK_END)
+        return len(data)
+
+    def _align(self, value):
+        return (value + self.ALIGNMENT - 1) // self.ALIGNMENT * self.ALIGNMENT
+
+
+class SectionReader:
+    """
+    Read a file written by SectionWriter through a read-only memory map.
+
+    Nothing is copied: sections are returned as memoryviews into the page cache
+    so that several processes reading the same file share a single copy.
+    """
+    def __init__(self, filename, magic, version):
+        self.filename = filename
+        with open(filename, 'rb') as fp:
+            stat = os.fstat(fp.fileno())
+            self.stamp = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+            self._mmap = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mmap)
+        file_magic, file_version, bom, num_sections = SectionWriter.HEADER.unpack_from(self._view, 0)
+        if file_magic != magic:
+            raise ValueError('{} is not a recognized file'.format(filename))
+        if file_version != version or bom != SectionWriter.BYTE_ORDER_MARK:
+            raise ValueError('{} was written by an incompatible version'.format(filename))
+        self._table = []
+        for i in range(num_sections):
+            position = SectionWriter.HEADER.size + i * SectionWriter.SECTION.size
+            self._table.append(SectionWriter.SECTION.unpack_from(self._view, position))
+
+    def bytes(self, index):
+        offset, length = self._table[index]
+        return self._view[offset:offset + length]
+
+    def array(self, index, typecode):
+        return self.bytes(index).cast(typecode)
+
+    def is_stale(self):
+        """Has the file on disk been replaced since it was mapped"""
+        try:
+            stat = os.stat(self.filename)
+        except FileNotFoundError:
+            return False
+        return (stat.st_ino, stat.st_size, stat.st_mtime_ns) != self.stamp
+
+
+class StringTable:
+    """
+    Immutable table of utf8 strings stored as an offsets array and a blob.
+
+    If the strings were sorted when written, find() does a binary search in place.
+    """
+    def __init__(self, offsets, blob):
+        self.offsets = offsets
+        self.blob = blob
+
+    @staticmethod
+    def build(strings):
+        """
+        Encode strings for a SectionWriter
+        :return: (offsets array, blob bytes)
+        """
+        offsets = array.array('Q', [0])
+        parts = []
+        position = 0
+        for string in strings:
+            data = string.encode('utf8')
+            parts.append(data)
+            position += len(data)
+            offsets.append(position)
+        return offsets, b''.join(parts)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        return str(self.blob[self.offsets[index]:self.offsets[index + 1]], 'utf8')
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def find(self, string):
+        """Index of the string in a sorted table or None"""
+        index = bisect.bisect_left(self, string)
+        if index < len(self) and self[index] == string:
+            return index
+        return None
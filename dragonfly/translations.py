@@ -2,9 +2,20 @@
 # All rights reserved.
 # Distributed under the terms of the Apache 2.0 License.
 
+import contextlib
 import os
 import json
 import csv
+import logging
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    # no locking between processes on windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
 
 
 class TranslationDictManager:
@@ -15,44 +26,59 @@ class TranslationDictManager:
     The key of the dictionary is the source string.
     Each list has two entries: translation string and entity type.
     The entity type may be blank.
+
+    A dictionary is stored as a json snapshot and an append-only journal of the
+    changes since, so adding a translation appends one line rather than rewriting
+    the file. Each process keeps the dictionaries in memory and reads only the
+    journal entries other processes have appended since it last looked.
     """
 
     def __init__(self, base_dir):
         self.base_dir = base_dir
+        self._stores = {}
+        self._lock = threading.Lock()
 
     def add(self, lang, source, translation, type):
         source = source.lower()
         type = type.upper()
-        trans_dict = self.get(lang)
-        trans_dict[source] = [translation, type]
-        self.save(lang, trans_dict)
+        self._store(lang).update([(source, [translation, type])])
 
     def delete(self, lang, source):
         source = source.lower()
-        trans_dict = self.get(lang)
-        if source in trans_dict:
-            del trans_dict[source]
-            self.save(lang, trans_dict)
-            return True
-        return False
+        return self._store(lang).delete(source)
 
     def merge(self, lang, td):
-        trans_dict = self.get(lang)
-        for key in td:
-            trans_dict[key] = td[key]
+        self._store(lang).update(td.items())
 
     def get(self, lang):
-        trans_dict = {}
-        filename = self.get_filename(lang)
-        if os.path.exists(filename):
-            with open(filename, 'r', encoding='utf8') as fp:
-                trans_dict = json.load(fp)
-        return trans_dict
+        return self._store(lang).copy()
+
+    def lookup(self, lang, words):
+        """
+        Get the entries for a batch of words without copying the dictionary
+        :param lang: language code
+        :param words: iterable of lower cased words
+        :return: dictionary of word -> [translation, entity type] for the words in the dictionary
+        """
+        return self._store(lang).lookup(words)
+
+    def version(self, lang):
+        """Value that changes whenever the dictionary changes (cheap to check)"""
+        return self._store(lang).version()
+
+    def compact(self, lang):
+        """Fold the journal into the json snapshot"""
+        self._store(lang).compact()
 
     def save(self, lang, td):
-        filename = self.get_filename(lang)
-        with open(filename, 'w', encoding='utf8') as fp:
-            json.dump(td, fp)
+        self._store(lang).replace(td)
+
+    def _store(self, lang):
+        lang = lang.lower()
+        with self._lock:
+            if lang not in self._stores:
+                self._stores[lang] = JournaledDict(self.get_filename(lang))
+            return self._stores[lang]
 
     def get_filename(self, lang):
         lang = lang.lower()
@@ -79,38 +105,185 @@ class TranslationDictManager:
         return count
 
     def import_json(self, lang, data):
-        trans_dict = self.get(lang)
-        count = 0
-        for phrase in data:
-            if phrase not in trans_dict:
-                trans_dict[phrase] = data[phrase]
-                count += 1
-        self.save(lang, trans_dict)
-        return count
+        return self._store(lang).update(data.items(), only_new=True)
 
     def import_tsv(self, lang, filename, force=False):
         PHRASE, TRANS, TYPE = [0, 1, 2]
-        trans_dict = self.get(lang)
-        count = 0
+        entries = []
         with open(filename, 'r', encoding='utf8') as fp:
             reader = csv.reader(fp, delimiter='\t', quoting=csv.QUOTE_NONE)
             for row in reader:
                 if len(row) == 2:
-                    if row[PHRASE] not in trans_dict:
-                        count += 1
-                        trans_dict[row[PHRASE]] = [row[TRANS], '']
-                    elif force:
-                        count += 1
-                        trans_dict[row[PHRASE]] = [row[TRANS], '']
+                    entries.append((row[PHRASE], [row[TRANS], '']))
                 elif len(row) == 3:
-                    if row[PHRASE] not in trans_dict:
-                        count += 1
-                        trans_dict[row[PHRASE]] = [row[TRANS], row[TYPE]]
-                    elif force:
-                        count += 1
-                        trans_dict[row[PHRASE]] = [row[TRANS], row[TYPE]]
+                    entries.append((row[PHRASE], [row[TRANS], row[TYPE]]))
                 else:
                     print("Warning: row without 2 or 3 columns")
                     continue
-        self.save(lang, trans_dict)
-        return count
+        if not force:
+            # the first row of a repeated phrase wins
+            first = {}
+            for phrase, value in entries:
+                first.setdefault(phrase, value)
+            entries = first.items()
+        return self._store(lang).update(entries, only_new=not force)
+
+
+class JournaledDict:
+    """
+    Dictionary stored as a json snapshot and a journal of json lines of [key, value or null for a delete].
+
+    Writers append to the journal under an exclusive file lock, so processes sharing
+    the files do not lose each other's changes. A line is only applied once its newline
+    has been written, so a partial line from a crash is ignored. Replaying a change that
+    is already in the snapshot has no effect, so a crash during compaction is safe too.
+    """
+    JOURNAL_EXTENSION = '.journal'
+    LOCK_EXTENSION = '.lock'
+    # fold the journal into the snapshot after this many changes
+    COMPACT_AFTER = 1000
+
+    def __init__(self, filename):
+        """
+        :param filename: json snapshot
+        """
+        self.filename = filename
+        self.journal_filename = os.path.splitext(filename)[0] + self.JOURNAL_EXTENSION
+        self.lock_filename = os.path.splitext(filename)[0] + self.LOCK_EXTENSION
+        self.data = {}
+        self._snapshot_stamp = None
+        self._journal_offset = 0
+        self._journal_entries = 0
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def copy(self):
+        with self._lock, self._file_lock(exclusive=False):
+            self._refresh()
+            return dict(self.data)
+
+    def lookup(self, keys):
+        with self._lock, self._file_lock(exclusive=False):
+            self._refresh()
+            return {key: self.data[key] for key in keys if key in self.data}
+
+    def version(self):
+        """Stamps of the snapshot and the journal, which change with every write (no locks or reads)"""
+        return self._stamp(self.filename), self._stamp(self.journal_filename)
+
+    def update(self, items, only_new=False):
+        """
+        :param items: iterable of (key, value)
+        :param only_new: skip keys that are already in the dictionary
+        :return: number of keys written
+        """
+        with self._lock, self._file_lock(exclusive=True):
+            self._refresh()
+            changes = [(key, value) for key, value in items if not only_new or key not in self.data]
+            self._write(changes)
+            return len(changes)
+
+    def delete(self, key):
+        """:return: whether the key was in the dictionary"""
+        with self._lock, self._file_lock(exclusive=True):
+            self._refresh()
+            if key not in self.data:
+                return False
+            self._write([(key, None)])
+            return True
+
+    def replace(self, data):
+        with self._lock, self._file_lock(exclusive=True):
+            self.data = dict(data)
+            self._loaded = True
+            self._compact()
+
+    def compact(self):
+        with self._lock, self._file_lock(exclusive=True):
+            self._refresh()
+            self._compact()
+
+    def _refresh(self):
+        # reload if another process compacted and then apply any new journal entries
+        stamp = self._stamp(self.filename)
+        if not self._loaded or stamp != self._snapshot_stamp:
+            self.data = {}
+            if stamp is not None:
+                with open(self.filename, 'r', encoding='utf8') as fp:
+                    self.data = json.load(fp)
+            self._snapshot_stamp = stamp
+            self._journal_offset = 0
+            self._journal_entries = 0
+            self._loaded = True
+        try:
+            with open(self.journal_filename, 'rb') as fp:
+                fp.seek(self._journal_offset)
+                data = fp.read()
+        except FileNotFoundError:
+            return
+        end = data.rfind(b'\n') + 1
+        for line in data[:end].splitlines():
+            try:
+                key, value = json.loads(line.decode('utf8'))
+            except ValueError:
+                logger.warning('Skipping a bad line in %s', self.journal_filename)
+                continue
+            self._apply(key, value)
+            self._journal_entries += 1
+        self._journal_offset += end
+
+    def _write(self, changes):
+        for key, value in changes:
+            self._apply(key, value)
+        if self._journal_entries + len(changes) > self.COMPACT_AFTER:
+            self._compact()
+            return
+        data = ''.join(json.dumps([key, value]) + '\n' for key, value in changes).encode('utf8')
+        with open(self.journal_filename, 'ab') as fp:
+            # a partial line left by a crash would corrupt the next entry
+            if fp.tell() > self._journal_offset:
+                fp.truncate(self._journal_offset)
+            fp.write(data)
+            fp.flush()
+            os.fsync(fp.fileno())
+        self._journal_offset += len(data)
+        self._journal_entries += len(changes)
+
+    def _apply(self, key, value):
+        if value is None:
+            self.data.pop(key, None)
+        else:
+            self.data[key] = value
+
+    def _compact(self):
+        tmp_filename = self.filename + '.tmp'
+        with open(tmp_filename, 'w', encoding='utf8') as fp:
+            json.dump(self.data, fp)
+            fp.flush()
+            os.fsync(fp.fileno())
+        os.replace(tmp_filename, self.filename)
+        with open(self.journal_filename, 'wb'):
+            pass
+        self._snapshot_stamp = self._stamp(self.filename)
+        self._journal_offset = 0
+        self._journal_entries = 0
+
+    @contextlib.contextmanager
+    def _file_lock(self, exclusive):
+        if fcntl is None:
+            yield
+            return
+        with open(self.lock_filename, 'a') as fp:
+            fcntl.flock(fp.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(fp.fileno(), fcntl.LOCK_UN)
+
+    @staticmethod
+    def _stamp(filename):
+        try:
+            stat = os.stat(filename)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
@@ -4,29 +4,53 @@
 
 from dragonfly import app, __version__
 import flask
-import io
 import json
-import random
-import string
-import os
-from .data import Document, InputReader
+from .query import QuerySyntaxError
 from .recommend import RecommendConfig
 from .renderer import AdjudicateAttacher, AnnotateAttacher, DocumentRenderer
+from .responses import ResponseCompressor, StaticFingerprints
 from .search import DocumentStats
 from .settings import GlobalSettingsManager, LocalSettingsManager
 
 
+STATIC_MAX_AGE = 365 * 24 * 60 * 60
+
+response_compressor = ResponseCompressor()
+static_fingerprints = StaticFingerprints(app.static_folder)
+
+
+def static_url(filename):
+    """Url of a static file that changes with its content"""
+    return flask.url_for('static', filename=filename, v=static_fingerprints.get(filename))
+
+
+@app.after_request
+def prepare_response(response):
+    request = flask.request
+    if request.method not in ('GET', 'HEAD'):
+        return response_compressor.compress(response, request)
+    if request.endpoint == 'static':
+        version = request.args.get('v')
+        if version and version == static_fingerprints.get(request.view_args['filename']):
+            # a fingerprinted url never has different content
+            response.headers['Cache-Control'] = 'public, max-age={}, immutable'.format(STATIC_MAX_AGE)
+    elif response.status_code == 200 and not response.direct_passthrough:
+        # browsers revalidate pages, translations and search results with the etag and get a 304 if unchanged
+        response.add_etag()
+        response.cache_control.no_cache = True
+    response_compressor.compress(response, request)
+    return response.make_conditional(request)
+
+
 @app.context_processor
 def inject_dragonfly_context():
-    version = __version__
-    if app.debug:
-        version += '.' + ''.join(random.choice(string.ascii_uppercase) for _ in range(8))
     tags = app.config.get('dragonfly.tags')
     locator = app.locator
     dict_available = locator.dictionary_search.available
     phrases_available = locator.phrases_search.available
     return {
-        'df_version': version,
+        'df_version': __version__,
+        'df_static_url': static_url,
         'df_locator': locator,
         'df_settings': locator.settings,
         'df_tags': tags,
@@ -41,11 +65,7 @@ def view(filename):
     modes = list(app.config.get('dragonfly.modes'))
     if flask.request.args.get('view', default=False, type=bool):
         modes.append('viewer')
-    if app.config.get('dragonfly.cmd') == 'annotate':
-        attacher = AnnotateAttacher()
-    else:
-        attacher = AdjudicateAttacher(app.config.get('dragonfly.annotation_dirs'))
-    dr = DocumentRenderer(attacher, modes)
+    dr = DocumentRenderer(_get_attacher(), modes)
     file_index = flask.request.args.get('index')
     content = dr.render(app, filename, file_index)
     if not content:
@@ -53,6 +73,36 @@ def view(filename):
     return content
 
 
+@app.route('/sentences/<filename>')
+def sentences(filename):
+    """Next window of sentences of a document that is too long to render at once"""
+    start = flask.request.args.get('start', default=0, type=int)
+    dr = DocumentRenderer(_get_attacher(), list(app.config.get('dragonfly.modes')))
+    results = dr.render_sentences(app, filename, start)
+    if results is None:
+        return flask.jsonify({'success': False, 'message': 'Unknown document'}), 404
+    return flask.jsonify(results)
+
+
+def _get_attacher():
+    if app.config.get('dragonfly.cmd') == 'annotate':
+        return AnnotateAttacher()
+    else:
+        return AdjudicateAttacher(app.config.get('dragonfly.annotation_dirs'))
+
+
+def _merge_sentences(annotations):
+    """
+    A windowed page only sends the sentences it has loaded so get the rest from the annotations it was rendered with
+    """
+    lister = app.config.get('dragonfly.input')
+    filename = lister.get_path(annotations['filename'])
+    document = app.locator.document_cache.get(filename)
+    _get_attacher().attach(document, app.config.get('dragonfly.output'), filename)
+    sentences = {int(index): tokens for index, tokens in annotations.pop('sentences').items()}
+    annotations['tokens'] = document.annotation_tokens(sentences)
+
+
 @app.route('/save', methods=['POST'])
 def save():
     data = flask.request.form['json']
@@ -61,9 +111,15 @@ def save():
     else:
         annotations = json.loads(data)
         lister = app.config.get('dragonfly.input')
+        if 'sentences' in annotations and lister.in_directory(annotations['filename']):
+            try:
+                _merge_sentences(annotations)
+            except ValueError as e:
+                return flask.jsonify({'success': False, 'message': str(e)})
         if lister.in_directory(annotations['filename']):
             app.locator.tag_frequencies.update(annotations)
             app.locator.output_writer.write(annotations)
+            app.locator.page_cache.invalidate(annotations['filename'])
             app.logger.info('Saving annotations for %s', annotations['filename'])
             results = {'success': True, 'message': 'Annotations saved.'}
         else:
@@ -97,12 +153,33 @@ def get_translations(lang):
     return flask.jsonify(trans)
 
 
+@app.route('/translations/gloss', methods=['POST'])
+def gloss():
+    """Glosses of the distinct tokens and multi-word user entries of a document (or of a list of tokens)"""
+    data = flask.request.get_json(True)
+    if 'doc' in data:
+        filename = app.config.get('dragonfly.input').get_path(data['doc'])
+        if filename is None:
+            return flask.jsonify({'success': False, 'message': 'Unknown document'}), 404
+        document = app.locator.document_cache.get(filename)
+        words = document.types()
+        # multi-word translations are only returned for the user dictionary
+        phrases = app.locator.dictionary_matcher.user_phrases(document)
+    else:
+        words = {token.lower() for token in data.get('tokens', [])}
+        phrases = set()
+    user_trans = app.locator.translation_manager.lookup(app.config.get('dragonfly.lang'), words | phrases)
+    dict_glosses = app.locator.dictionary_search.gloss(words.difference(user_trans))
+    app.logger.info('Returned glosses for %d of %d words', len(user_trans) + len(dict_glosses), len(words))
+    return flask.jsonify({'user': user_trans, 'dictionary': dict_glosses})
+
+
 @app.route('/translations/export/<lang>')
 def export_translations(lang):
     filename = lang + '.json'
+    # fold the journal of recent changes into the json file
+    app.locator.translation_manager.compact(lang)
     file = app.locator.translation_manager.get_filename(lang)
-    if not os.path.exists(file):
-        file = io.BytesIO(b'{}')
     app.logger.info('Exported %s for %s', filename, lang)
     return flask.send_file(file, as_attachment=True, attachment_filename=filename, cache_timeout=0, add_etags=False)
 
@@ -124,17 +201,30 @@ def import_translations(lang):
 @app.route('/search/local', methods=['POST'])
 def search_local():
     term = flask.request.form['term']
-    use_wildcards = False
-    if flask.request.form['manual'] == 'true':
-        use_wildcards = any(ch in term for ch in ['*', '?', '[', ']'])
-    results = app.locator.local_search.retrieve(term, use_wildcards)
+    manual = flask.request.form['manual'] == 'true'
+    offset = flask.request.form.get('offset', 0, type=int)
+    if flask.request.form.get('ranked') == 'true':
+        results = app.locator.local_search.retrieve_ranked(term, offset)
+    elif manual:
+        # typed queries support wildcards, quoted phrases and AND/OR/NOT
+        try:
+            results = app.locator.local_search.query(term, offset)
+        except QuerySyntaxError as err:
+            results = {'terms': set(), 'count': 0, 'refs': [], 'next_offset': None, 'error': str(err)}
+    else:
+        results = app.locator.local_search.retrieve(term, False, offset)
     app.logger.info('Returned %d results from local search for %s', len(results['refs']), term)
-    return flask.render_template('search/inverse.html', results=results)
+    return flask.render_template('search/inverse.html', results=results, offset=offset)
+
+
+@app.route('/search/status', methods=['GET'])
+def search_status():
+    return flask.jsonify(app.locator.status)
 
 
 @app.route('/search/local/build', methods=['POST'])
 def build_index():
-    app.locator.local_search.build_index(True)
+    app.locator.build_local_index()
     results = {'success': True, 'message': 'Command queued'}
     return flask.jsonify(results)
 
@@ -163,7 +253,9 @@ def search_dict():
 def autocomplete_dict():
     term = flask.request.args.get('term')
     column = flask.request.args.get('column')
-    results = app.locator.dictionary_search.suggest(term, int(column))
+    limit = flask.request.args.get('limit', default=10, type=int)
+    by_frequency = flask.request.args.get('order') == 'frequency'
+    results = app.locator.dictionary_search.suggest(term, int(column), limit, by_frequency)
     return flask.jsonify(results)
 
 
@@ -190,10 +282,13 @@ def search_phrases():
 @app.route('/search/phrases/import', methods=['POST'])
 def import_phrases():
     file = flask.request.files['phrases']
-    data = file.read().decode('utf-8')
-    app.locator.phrases_search.copy(data)
-    results = {'success': True, 'message': 'Loaded the phrases file for search'}
-    app.logger.info('Imported phrases %s', file.filename)
+    try:
+        # streamed into the phrase store rather than read into memory
+        app.locator.phrases_search.copy(file.stream)
+        results = {'success': True, 'message': 'Loaded the phrases file for search'}
+        app.logger.info('Imported phrases %s', file.filename)
+    except ValueError:
+        results = {'success': False, 'message': 'Unrecognized format'}
     return flask.jsonify(results)
 
 
@@ -214,6 +309,7 @@ def marker():
     sentences = flask.request.form.getlist('sentence[]')
     for sentence in sentences:
         manager.toggle(document, sentence)
+    app.locator.page_cache.invalidate(document)
     results = {'success': True, 'message': 'Marker changed.'}
     return flask.jsonify(results)
 
@@ -232,6 +328,7 @@ def settings():
         new_settings = json.loads(flask.request.form['json'])
         gsm.save(new_settings)
         lsm.save(new_settings)
+        app.locator.page_cache.invalidate()
         results = {'success': True, 'message': 'Settings saved.'}
         app.logger.info('Saved settings')
         return flask.jsonify(results)
@@ -279,19 +376,17 @@ def get_recommendations():
 def word_cloud(doc):
     lister = app.config.get('dragonfly.input')
     filename = lister.get_path(doc)
-    reader = InputReader(filename)
-    document = Document(filename, reader.sentences, reader.terminal_blank_line)
+    document = app.locator.document_cache.get(filename)
     index = app.locator.local_search.index
     doc_stats = DocumentStats(document, index)
     words = []
-    user_trans = app.locator.translation_manager.get(app.config.get('dragonfly.lang'))
-    dict_search = app.locator.dictionary_search
-    for word, tfidf in doc_stats.get_top_words().items():
-        if word.lower() in user_trans:
-            word = user_trans[word.lower()][0]
-        elif dict_search.available:
-            results = dict_search.retrieve(word, 0)
-            if results:
-                word = results[0][1]
+    top_words = doc_stats.get_top_words()
+    user_trans = app.locator.translation_manager.lookup(app.config.get('dragonfly.lang'), top_words)
+    dict_glosses = app.locator.dictionary_search.gloss(set(top_words).difference(user_trans))
+    for word, tfidf in top_words.items():
+        if word in user_trans:
+            word = user_trans[word][0]
+        elif word in dict_glosses:
+            word = dict_glosses[word]
         words.append({'text': word, 'weight': tfidf})
     return flask.jsonify(words)
@@ -0,0 +1,430 @@
+# Copyright 2017-2019, The Johns Hopkins University Applied Physics Laboratory LLC
+# All rights reserved.
+# Distributed under the terms of the Apache 2.0 License.
+
+import array
+import bisect
+import fnmatch
+import itertools
+import re
+import sys
+
+
+def prefix_range(sequence, prefix):
+    """
+    Find the items of a sorted sequence of strings that start with a prefix
+    :return: (start, end) range of the items
+    """
+    start = bisect.bisect_left(sequence, prefix)
+    if not prefix or ord(prefix[-1]) == sys.maxunicode:
+        return start, len(sequence)
+    end = bisect.bisect_left(sequence, prefix[:-1] + chr(ord(prefix[-1]) + 1), start)
+    return start, end
+
+
+class Vocabulary:
+    """
+    Sorted vocabulary of an index that works as a prefix trie and a reversed suffix trie.
+
+    Each trie node is a contiguous range of a sorted array so walking the trie
+    is a binary search and nothing but a permutation of term ids is stored.
+    The prefix trie is the sorted term list itself. The suffix trie is the term ids
+    sorted by the reversed terms. Infix and regex patterns are narrowed with a
+    character trigram index before the real matcher runs, and spelling variants
+    are found with a symmetric delete index.
+    """
+    WILDCARDS = '*?['
+
+    def __init__(self, terms, suffix_order=None, trigrams=None, deletions=None):
+        """
+        :param terms: sorted sequence of strings
+        :param suffix_order: sequence of term ids sorted by reversed term
+        :param trigrams: TrigramIndex over the terms (built when first needed if None)
+        :param deletions: DeletionIndex over the terms (built when first needed if None)
+        """
+        self.terms = terms
+        if suffix_order is None:
+            suffix_order = self.build_suffix_order(terms)
+        self.suffix_order = suffix_order
+        self._trigrams = trigrams
+        self._deletions = deletions
+
+    @property
+    def trigrams(self):
+        if self._trigrams is None:
+            self._trigrams = TrigramIndex.build(self.terms)
+        return self._trigrams
+
+    @property
+    def deletions(self):
+        if self._deletions is None:
+            self._deletions = DeletionIndex.build(self.terms)
+        return self._deletions
+
+    @staticmethod
+    def build_suffix_order(terms):
+        return array.array('I', sorted(range(len(terms)), key=lambda term_id: terms[term_id][::-1]))
+
+    def with_prefix(self, prefix):
+        """Terms that start with prefix"""
+        start, end = prefix_range(self.terms, prefix)
+        for term_id in range(start, end):
+            yield self.terms[term_id]
+
+    def with_suffix(self, suffix):
+        """Terms that end with suffix"""
+        start, end = prefix_range(_ReversedTerms(self), suffix[::-1])
+        for position in range(start, end):
+            yield self.terms[self.suffix_order[position]]
+
+    def match(self, pattern):
+        """
+        Terms that match a shell-style pattern.
+
+        Patterns anchored at the start or end only test the terms under the longer
+        literal anchor. Patterns with literals of three or more characters only test
+        the terms that have all of their trigrams if that is a smaller set.
+        Otherwise every term is tested.
+        """
+        prefix = self._literal_prefix(pattern)
+        suffix = self._literal_prefix(pattern[::-1], ']')[::-1]
+        if prefix and len(prefix) >= len(suffix):
+            start, end = prefix_range(self.terms, prefix)
+            candidates = range(start, end)
+        elif suffix:
+            start, end = prefix_range(_ReversedTerms(self), suffix[::-1])
+            candidates = self.suffix_order[start:end]
+        else:
+            candidates = range(len(self.terms))
+        term_ids = self.trigrams.candidates(glob_literals(pattern), len(candidates))
+        if term_ids is not None:
+            candidates = term_ids
+        return fnmatch.filter((self.terms[term_id] for term_id in candidates), pattern)
+
+    def search(self, pattern):
+        """
+        Terms that contain a match for a case insensitive regular expression
+        :param pattern: regular expression string or compiled pattern
+        :return: list of terms
+        """
+        regex = re.compile(pattern, re.IGNORECASE) if isinstance(pattern, str) else pattern
+        literals = [] if regex.flags & re.VERBOSE else regex_literals(regex.pattern)
+        term_ids = self.trigrams.candidates(literals)
+        if term_ids is None:
+            term_ids = range(len(self.terms))
+        return [self.terms[term_id] for term_id in term_ids if regex.search(self.terms[term_id])]
+
+    def similar(self, word, max_distance):
+        """
+        Terms within an edit distance of a word
+        :return: list of terms, closest first
+        """
+        return [term for distance, term in self.deletions.lookup(self.terms, word, max_distance)]
+
+    def _literal_prefix(self, pattern, special=''):
+        for index, char in enumerate(pattern):
+            if char in self.WILDCARDS or char in special:
+                return pattern[:index]
+        return pattern
+
+    def __len__(self):
+        return len(self.terms)
+
+
+class _ReversedTerms:
+    # sequence view of the terms in suffix order with each term reversed for bisect
+    def __init__(self, vocabulary):
+        self.vocabulary = vocabulary
+
+    def __len__(self):
+        return len(self.vocabulary.suffix_order)
+
+    def __getitem__(self, index):
+        return self.vocabulary.terms[self.vocabulary.suffix_order[index]][::-1]
+
+
+class TermTable:
+    """
+    Immutable map from string keys to sorted lists of term ids.
+
+    The keys are a sorted sequence (a list or a memory mapped StringTable) and
+    the term ids of all keys are concatenated into one array.
+    """
+    def __init__(self, keys, offsets, term_ids):
+        """
+        :param keys: sorted sequence of strings
+        :param offsets: start of the term ids of each key (with a final end offset)
+        :param term_ids: term ids grouped by key
+        """
+        self.keys = keys
+        self.offsets = offsets
+        self.term_ids = term_ids
+
+    @classmethod
+    def from_dict(cls, index):
+        """
+        :param index: dictionary of key -> list of term ids in increasing order
+        """
+        keys = sorted(index)
+        offsets = array.array('Q', [0])
+        term_ids = array.array('I')
+        for key in keys:
+            term_ids.extend(index[key])
+            offsets.append(len(term_ids))
+        return cls(keys, offsets, term_ids)
+
+    def get(self, key):
+        """Sorted ids of the terms for the key"""
+        index = bisect.bisect_left(self.keys, key)
+        if index < len(self.keys) and self.keys[index] == key:
+            return self.term_ids[self.offsets[index]:self.offsets[index + 1]]
+        return self.term_ids[0:0]
+
+    def __len__(self):
+        return len(self.keys)
+
+
+class TrigramIndex(TermTable):
+    """
+    Character trigram index over a sorted vocabulary.
+
+    Each trigram maps to the sorted ids of the terms that contain it so that
+    the candidates for a set of literals is an intersection of sorted lists.
+    """
+    @classmethod
+    def build(cls, terms):
+        index = {}
+        for term_id, term in enumerate(terms):
+            for trigram in set(trigrams(term)):
+                index.setdefault(trigram, []).append(term_id)
+        return cls.from_dict(index)
+
+    def candidates(self, literals, limit=None):
+        """
+        Ids of the terms that contain every trigram of the literals
+        :param literals: strings that any match must contain
+        :param limit: return None rather than a candidate list that is not smaller than this
+        :return: sorted list of term ids or None if the literals have no trigrams
+        """
+        keys = {trigram for literal in literals for trigram in trigrams(literal)}
+        if not keys:
+            return None
+        lists = sorted((self.get(key) for key in keys), key=len)
+        if limit is not None and len(lists[0]) >= limit:
+            return None
+        result = list(lists[0])
+        for term_ids in lists[1:]:
+            intersection = []
+            position = 0
+            for term_id in result:
+                position = bisect.bisect_left(term_ids, term_id, position)
+                if position == len(term_ids):
+                    break
+                if term_ids[position] == term_id:
+                    intersection.append(term_id)
+            result = intersection
+            if not result:
+                break
+        if limit is not None and len(result) >= limit:
+            return None
+        return result
+
+
+class DeletionIndex(TermTable):
+    """
+    Symmetric delete (SymSpell) index for finding the terms within a small edit distance.
+
+    Every string made by deleting up to MAX_DISTANCE characters from the start of a
+    term maps to the term. Terms within distance k of a word share a key with one of
+    the deletes of the word, so a lookup is a few dozen binary searches followed by
+    verifying the candidates rather than comparing the word to every term.
+    """
+    MAX_DISTANCE = 2
+    # only the start of long terms is indexed to bound the number of deletes
+    PREFIX_LENGTH = 7
+
+    @classmethod
+    def build(cls, terms):
+        index = {}
+        # sorted terms that share a prefix are contiguous so the deletes of each prefix are made once
+        for prefix, group in itertools.groupby(enumerate(terms), key=lambda item: item[1][:cls.PREFIX_LENGTH]):
+            term_ids = [term_id for term_id, term in group]
+            for key in deletes(prefix, cls.MAX_DISTANCE):
+                index.setdefault(key, []).extend(term_ids)
+        return cls.from_dict(index)
+
+    def lookup(self, terms, word, max_distance):
+        """
+        Terms within an edit distance of a word
+        :param terms: the sequence of terms the index was built from
+        :param word: the word to look up
+        :param max_distance: maximum edit distance (capped at MAX_DISTANCE)
+        :return: list of (distance, term) sorted by distance and then term
+        """
+        max_distance = min(max_distance, self.MAX_DISTANCE)
+        term_ids = set()
+        for key in deletes(word[:self.PREFIX_LENGTH], max_distance):
+            term_ids.update(self.get(key))
+        results = []
+        for term_id in term_ids:
+            term = terms[term_id]
+            if abs(len(term) - len(word)) > max_distance:
+                continue
+            distance = edit_distance(word, term, max_distance)
+            if distance <= max_distance:
+                results.append((distance, term))
+        return sorted(results)
+
+
+def deletes(string, max_distance):
+    """
+    The string and the strings made by deleting up to max_distance characters from it.
+
+    Short strings delete down to the empty string, which is the key shared by every
+    word and term of up to max_distance characters.
+    """
+    results = {string}
+    edits = {string}
+    for _ in range(max_distance):
+        edits = {edit[:i] + edit[i + 1:] for edit in edits for i in range(len(edit))}
+        results.update(edits)
+    return results
+
+
+def edit_distance(first, second, max_distance):
+    """
+    Optimal string alignment distance (Levenshtein with adjacent transpositions)
+    :return: the distance or max_distance + 1 if it is larger than max_distance
+    """
+    previous2 = None
+    previous = list(range(len(second) + 1))
+    for i in range(1, len(first) + 1):
+        current = [i] + [0] * len(second)
+        for j in range(1, len(second) + 1):
+            cost = 0 if first[i - 1] == second[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and first[i - 1] == second[j - 2] and first[i - 2] == second[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > max_distance:
+            return max_distance + 1
+        previous2, previous = previous, current
+    return min(previous[-1], max_distance + 1)
+
+
+def trigrams(string):
+    return [string[i:i + 3] for i in range(len(string) - 2)]
+
+
+def glob_literals(pattern):
+    """Literal strings that every term matching a shell-style pattern contains"""
+    literals = []
+    current = ''
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        i += 1
+        if char in '*?':
+            literals.append(current)
+            current = ''
+        elif char == '[':
+            # same rules as fnmatch.translate for the end of a character class
+            j = i
+            if j < len(pattern) and pattern[j] == '!':
+                j += 1
+            if j < len(pattern) and pattern[j] == ']':
+                j += 1
+            while j < len(pattern) and pattern[j] != ']':
+                j += 1
+            if j >= len(pattern):
+                current += char
+            else:
+                literals.append(current)
+                current = ''
+                i = j + 1
+        else:
+            current += char
+    literals.append(current)
+    return [literal for literal in literals if literal]
+
+
+def regex_literals(pattern):
+    """
+    Literal strings that every match of a regular expression contains.
+
+    This is conservative: groups, character classes and escape sequences are
+    skipped and a top level alternation or verbose flag means there are no
+    required literals.
+    """
+    if re.match(r'\(\?[a-zA-Z]*x', pattern):
+        # whitespace in a verbose pattern is not matched
+        return []
+    literals = []
+    current = ''
+    depth = 0
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        i += 1
+        if depth:
+            if char == '\\':
+                i += 1
+            elif char == '(':
+                depth += 1
+            elif char == ')':
+                depth -= 1
+            continue
+        if char == '|':
+            return []
+        if char in '*?{':
+            # the previous character is optional
+            current = current[:-1]
+            literals.append(current)
+            current = ''
+            if char == '{':
+                i = pattern.find('}', i) + 1 or len(pattern)
+        elif char == '\\':
+            if i < len(pattern) and not pattern[i].isalnum():
+                current += pattern[i]
+                i += 1
+            else:
+                literals.append(current)
+                current = ''
+                i = _escape_end(pattern, i)
+        elif char == '(':
+            depth = 1
+            literals.append(current)
+            current = ''
+        elif char == '[':
+            literals.append(current)
+            current = ''
+            if i < len(pattern) and pattern[i] == '^':
+                i += 1
+            if i < len(pattern) and pattern[i] == ']':
+                i += 1
+            while i < len(pattern) and pattern[i] != ']':
+                if pattern[i] == '\\':
+                    i += 1
+                i += 1
+            i += 1
+        elif char in '.^$+)':
+            literals.append(current)
+            current = ''
+        else:
+            current += char
+    literals.append(current)
+    return [literal.lower() for literal in literals if literal]
+
+
+def _escape_end(pattern, i):
+    """End of an escape sequence like \\d, \\x61, \\u0061, \\N{name} or \\12 that starts at i"""
+    escape = pattern[i:i + 1]
+    i += 1
+    if escape in ('x', 'u', 'U'):
+        i += {'x': 2, 'u': 4, 'U': 8}[escape]
+    elif escape == 'N':
+        i = pattern.find('}', i) + 1 or len(pattern)
+    elif escape.isdigit():
+        # octal escapes and group references
+        while i < len(pattern) and pattern[i].isdigit():
+            i += 1
+    return i
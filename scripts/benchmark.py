@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+
+# Copyright 2017-2019, The Johns Hopkins University Applied Physics Laboratory LLC
+# All rights reserved.
+# Distributed under the terms of the Apache 2.0 License.
+
+#
+# Compares the template and fast renderers of the token grid on a generated document
+#
+# usage: benchmark.py [-s sentences] [-t tokens per sentence] [-r rows] [-n repeats]
+#
+
+import argparse
+import os
+import random
+import string
+import sys
+import timeit
+
+# don't assume the user has install dragonfly
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+from dragonfly import app
+from dragonfly.cli import Runner
+from dragonfly.data import Document, Sentence, SentenceRow
+from dragonfly.renderer import DocumentWriter
+
+MIN_PYTHON = (3, 0)
+if sys.version_info < MIN_PYTHON:
+    sys.exit("Python {}.{} or later is required.\n".format(*MIN_PYTHON))
+
+parser = argparse.ArgumentParser()
+parser.add_argument("-s", "--sentences", type=int, default=250, help="number of sentences (default is 250)")
+parser.add_argument("-t", "--tokens", type=int, default=20, help="tokens per sentence (default is 20)")
+parser.add_argument("-r", "--rows", type=int, default=6, help="rows per sentence including tokens (default is 6)")
+parser.add_argument("-n", "--repeats", type=int, default=5, help="number of times to render (default is 5)")
+args = parser.parse_args()
+
+
+class Stats:
+    def get_idf(self, word):
+        return len(word) / 3
+
+
+def word():
+    return ''.join(random.choice(string.ascii_lowercase) for _ in range(random.randint(2, 12)))
+
+
+def make_document():
+    random.seed(0)
+    sentences = []
+    for index in range(args.sentences):
+        sentence = Sentence(index)
+        sentence.add(SentenceRow(0, 'TOKEN', [word() for _ in range(args.tokens)]))
+        for row in range(1, args.rows):
+            sentence.add(SentenceRow(row, 'row {}'.format(row), [word() + '__' + word() for _ in range(args.tokens)]))
+        tokens = sentence.rows[0]
+        tokens.attach(['O'] * args.tokens)
+        tokens.set_suggestions([random.random() for _ in range(args.tokens)])
+        tokens.set_glosses([(0, 1, ('gloss', 'PER', 'user')), (3, 5, (word(), '', 'dictionary'))])
+        sentences.append(sentence)
+    document = Document('benchmark.txt', sentences, True)
+    document.has_annotations = True
+    document.markers = [0, 10]
+    return document
+
+
+def time_render(render):
+    render()
+    seconds = min(timeit.repeat(render, number=1, repeat=args.repeats))
+    return 1000 * seconds / (cells / 10000)
+
+
+runner = Runner()
+runner.suppress_dict_labels = True
+app.jinja_env.filters['preprocess_text'] = runner._preprocess_text
+app.jinja_env.filters['convert_to_json'] = runner._convert_to_json
+app.jinja_env.filters['regex_replace'] = runner._regex_replace
+app.jinja_env.globals.update(calc_column_width=runner._calc_column_width)
+
+document = make_document()
+doc_stats = Stats()
+settings = {'Column Width': 8, 'Display Row Labels': True}
+cells = args.sentences * args.tokens * args.rows
+template = app.jinja_env.get_template('document.html')
+writer = DocumentWriter.from_app(app)
+
+
+def render_template():
+    return template.render(document=document, doc_stats=doc_stats, df_settings=settings,
+                           start=0, stop=len(document.sentences))
+
+
+def render_fast():
+    return writer.write(document, doc_stats, settings)
+
+
+if render_template() != render_fast():
+    sys.exit("Error: the renderers produced different markup")
+
+print("{} cells".format(cells))
+print("template: {:.1f} ms per 10k cells".format(time_render(render_template)))
+print("fast:     {:.1f} ms per 10k cells".format(time_render(render_fast)))
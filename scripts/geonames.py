@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+
+# Copyright 2017-2019, The Johns Hopkins University Applied Physics Laboratory LLC
+# All rights reserved.
+# Distributed under the terms of the Apache 2.0 License.
+
+#
+# Import a geonames dump as an offline gazetteer for a dataset
+#
+# usage: geonames.py data_dir dump
+# example: ./geonames.py ~/data/som allCountries.zip -c countryInfo.txt -a admin1CodesASCII.txt --countries SO,KE
+#
+# Dumps are available from http://download.geonames.org/export/dump/
+# When the gazetteer exists, geonames searches use it instead of the geonames api.
+#
+
+import argparse
+import logging
+import os
+import sys
+
+# don't assume the user has install dragonfly
+sys.path.append(os.path.join(os.path.dirname(__file__), os.pardir, 'dragonfly'))
+import gazetteer
+
+MIN_PYTHON = (3, 0)
+if sys.version_info < MIN_PYTHON:
+    sys.exit("Python {}.{} or later is required.\n".format(*MIN_PYTHON))
+
+parser = argparse.ArgumentParser()
+parser.add_argument("data", help="directory of tsv files being annotated")
+parser.add_argument("dump", help="geonames table (allCountries, cities500, ...) as .txt or .zip")
+parser.add_argument("-c", "--country-info", help="countryInfo.txt for country names")
+parser.add_argument("-a", "--admin1", help="admin1CodesASCII.txt for division names")
+parser.add_argument("--countries", help="comma separated country codes to import (default is all)")
+args = parser.parse_args()
+
+for filename in [args.data, args.dump, args.country_info, args.admin1]:
+    if filename and not os.path.exists(filename):
+        sys.exit("Error: {} does not exist".format(filename))
+
+logging.basicConfig(level=logging.INFO, format='%(message)s')
+md_dir = os.path.join(os.path.expanduser(args.data), '.dragonfly')
+if not os.path.exists(md_dir):
+    os.makedirs(md_dir)
+countries = [code.strip() for code in args.countries.split(',')] if args.countries else None
+builder = gazetteer.GazetteerBuilder(md_dir)
+num_places = builder.build(args.dump, args.country_info, args.admin1, countries)
+print("Imported {} places".format(num_places))
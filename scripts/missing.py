@@ -14,10 +14,14 @@ import argparse
 import collections
 import csv
 import glob
-import json
 import os
 import sys
 
+# don't assume the user has install dragonfly
+sys.path.append(os.path.join(os.path.dirname(__file__), os.pardir, 'dragonfly'))
+import matcher
+import translations
+
 MIN_PYTHON = (3, 0)
 if sys.version_info < MIN_PYTHON:
     sys.exit("Python {}.{} or later is required.\n".format(*MIN_PYTHON))
@@ -43,35 +47,6 @@ else:
 args.lang = args.lang.lower()
 
 
-class DictTree(object):
-    def __init__(self):
-        self.tree = {}
-
-    def add(self, string):
-        tokens = [token.strip().lower() for token in string.split(' ')]
-        branch = self.tree
-        for token in tokens:
-            if token not in branch:
-                branch[token] = {}
-            branch = branch[token]
-        branch[None] = None  # indicates a terminal token for a path through the tree
-
-    def check(self, tokens):
-        """
-        Check if the phrase is in the dictionary
-        :param tokens:
-        :return: (path in dictionary, path has a terminal stop)
-        """
-        tokens = [token.lower() for token in tokens]
-        branch = self.tree
-        for token in tokens:
-            if token not in branch:
-                return (False, False)
-            branch = branch[token]
-        terminal = None in branch
-        return (True, terminal)
-
-
 class PhraseHistogram(object):
     def __init__(self):
         self.phrases = collections.Counter()
@@ -97,62 +72,41 @@ if args.dict:
             trans_dict[row[0].strip().lower()] = row[1].strip()
 else:
     ls_dir = os.path.join(os.path.expanduser("~"), '.dragonfly')
-    args.dict = os.path.join(ls_dir, args.lang + '.json')
-    if not os.path.exists(args.dict):
+    tdm = translations.TranslationDictManager(ls_dir)
+    args.dict = tdm.get_filename(args.lang)
+    # the dictionary may only exist as a journal of changes
+    trans_dict = tdm.get(args.lang)
+    if not trans_dict:
         sys.exit("Error: dict {} does not exist".format(args.dict))
-    with open(args.dict, 'r') as fp:
-        trans_dict = json.load(fp)
 
-tree = DictTree()
+automaton = matcher.AhoCorasick()
 for key in trans_dict:
-    tree.add(key)
+    automaton.add(key.split(), key)
+automaton.build()
+
+
+def untagged_spans(rows):
+    """Runs of tokens tagged O (ended by sentence breaks and tagged entities)"""
+    span = []
+    for row in rows:
+        if row and row[TOKEN] and len(row) > TAG and len(row[TAG]) == 1:
+            span.append(row[TOKEN])
+        elif span:
+            yield span
+            span = []
+    if span:
+        yield span
+
 
 stats = collections.defaultdict(list)
 phrases = PhraseHistogram()
 for filename in filenames:
     with open(filename, 'r', encoding='utf8') as ifp:
         reader = csv.reader(ifp, delimiter='\t', quoting=csv.QUOTE_NONE)
-        in_phrase = False
-        phrase_rows = []
-        phrase_last_index = -1
-        rows = [row for row in reader]
-        for i in range(len(rows)):
-            if in_phrase:
-                # end of sentence ends the phrase
-                if not rows[i] or not rows[i][TOKEN] or not rows[i][TAG]:
-                    in_phrase = False
-                    if phrase_last_index >= 0:
-                        stats[filename].append(phrase_rows[0:phrase_last_index+1])
-                    continue
-                # entering a tagged entity ends the phrase
-                if len(rows[i][TAG]) > 1:
-                    in_phrase = False
-                    if phrase_last_index >= 0:
-                        stats[filename].append(phrase_rows[0:phrase_last_index + 1])
-                    continue
-                phrase_rows.append(rows[i][TOKEN])
-                (in_dict, terminal) = tree.check(phrase_rows)
-                if in_dict:
-                    if terminal:
-                        phrase_last_index = len(phrase_rows) - 1
-                # no longer in dictionary ends the phrase
-                else:
-                    in_phrase = False
-                    if phrase_last_index >= 0:
-                        stats[filename].append(phrase_rows[0:phrase_last_index + 1])
-            else:
-                if not rows[i] or not rows[i][TOKEN] or not rows[i][TAG]:
-                    continue
-
-                # must be non-tag to start a phrase
-                if len(rows[i][TAG]) == 1:
-                    phrase_rows = [rows[i][TOKEN]]
-                    (in_dict, terminal) = tree.check(phrase_rows)
-                    if in_dict:
-                        in_phrase = True
-                        phrase_last_index = -1
-                        if terminal:
-                            phrase_last_index = 0
+        # a single pass of the automaton over each untagged span finds every dictionary entry in it
+        for tokens in untagged_spans(reader):
+            for start, end, _ in matcher.longest_matches(automaton.find(tokens)):
+                stats[filename].append(tokens[start:end])
 
 for doc in sorted(stats.keys()):
     print("{}\t\t{}".format(doc, ', '.join([' '.join(x) for x in stats[doc]])))
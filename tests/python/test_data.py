@@ -1,6 +1,8 @@
 import unittest
 import os
-from dragonfly.data import Document, FileLister, InputReader
+import shutil
+import tempfile
+from dragonfly.data import Document, DocumentCache, FileLister, InputReader
 
 
 def get_path(*args):
@@ -88,3 +90,62 @@ class DocumentTest(unittest.TestCase):
         annotations = InputReader(annotations_filename).sentences
         with self.assertRaises(ValueError) as context:
             document.attach_annotations(annotations)
+
+    def test_types(self):
+        filename = get_path('data', 'input_no_annotations.tsv')
+        types = Document(filename, InputReader(filename).sentences, False).types()
+        self.assertIn('the', types)
+        self.assertIn('dakar', types)
+        self.assertNotIn('The', types)
+
+    def test_annotation_tokens(self):
+        reader = InputReader(get_path('data', 'input_no_annotations.tsv'))
+        document = Document('test.tsv', reader.sentences, True)
+        tokens = document.annotation_tokens()
+        self.assertEqual({'token': 'The', 'tag': 'O'}, tokens[0])
+        self.assertEqual({}, tokens[-1])
+        self.assertEqual(document.num_tokens + 2, len(tokens))
+        strings = document.sentences[1].rows[0].strings
+        sentence = [{'token': token, 'tag': 'B-PER'} for token in strings]
+        tokens = document.annotation_tokens({1: sentence})
+        self.assertEqual(sentence, tokens[-len(strings) - 1:-1])
+        with self.assertRaises(ValueError):
+            document.annotation_tokens({0: sentence})
+
+
+class DocumentCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.test_dir, 'doc.tsv')
+        shutil.copy(get_path('data', 'input_no_annotations.tsv'), self.filename)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_copies(self):
+        cache = DocumentCache()
+        document = cache.get(self.filename)
+        document.attach_annotations(InputReader(get_path('data', 'input_with_annotations.tsv')).sentences)
+        document.sentences[0].rows[0].set_suggestions([1] * document.sentences[0].length)
+        document = cache.get(self.filename)
+        self.assertFalse(document.has_annotations)
+        self.assertEqual([], document.sentences[0].rows[0].annotations)
+        self.assertEqual([], document.sentences[0].rows[0].suggestions)
+        self.assertEqual(1, len(cache))
+
+    def test_reparse_on_change(self):
+        cache = DocumentCache()
+        self.assertEqual(2, cache.get(self.filename).num_sentences)
+        with open(self.filename, 'a', encoding='utf8') as fp:
+            fp.write('\nnew\tsentence\n')
+        self.assertEqual(3, cache.get(self.filename).num_sentences)
+        self.assertEqual(os.path.getsize(self.filename), cache.size)
+
+    def test_eviction(self):
+        other = os.path.join(self.test_dir, 'other.tsv')
+        shutil.copy(self.filename, other)
+        cache = DocumentCache(os.path.getsize(self.filename) * 3 // 2)
+        cache.get(self.filename)
+        cache.get(other)
+        self.assertEqual(1, len(cache))
+        self.assertEqual(os.path.getsize(other), cache.size)
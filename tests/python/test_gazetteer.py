@@ -0,0 +1,71 @@
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+from dragonfly.gazetteer import Gazetteer, GazetteerBuilder, trigrams
+
+
+def place(geonameid, name, alternates, fcl, fcode, country, admin1, population):
+    return '\t'.join([str(geonameid), name, name, alternates, '1.5', '36.8', fcl, fcode, country, '', admin1,
+                      '', '', '', str(population), '', '1700', 'Africa/Nairobi', '2019-01-01'])
+
+
+class GazetteerTest(unittest.TestCase):
+    DUMP = [
+        place(184745, 'Nairobi', 'Nairobi,Nairobbi,NBO', 'P', 'PPLC', 'KE', '05', 2750547),
+        place(186301, 'Mombasa', 'Mombasa,Mombassa', 'P', 'PPLA', 'KE', '19', 799668),
+        place(53654, 'Mogadishu', 'Muqdisho,Mogadiscio', 'P', 'PPLC', 'SO', '02', 2587183),
+        place(184742, 'Nairobi River', 'Nairobi', 'H', 'STM', 'KE', '05', 0),
+    ]
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.dump = os.path.join(self.test_dir, 'cities.txt')
+        with open(self.dump, 'w', encoding='utf8') as fp:
+            fp.write('\n'.join(self.DUMP) + '\n')
+        self.countries = os.path.join(self.test_dir, 'countryInfo.txt')
+        with open(self.countries, 'w', encoding='utf8') as fp:
+            fp.write('#ISO\tISO3\tISO-Numeric\tfips\tCountry\n')
+            fp.write('KE\tKEN\t404\tKE\tKenya\n')
+        self.admin1 = os.path.join(self.test_dir, 'admin1CodesASCII.txt')
+        with open(self.admin1, 'w', encoding='utf8') as fp:
+            fp.write('KE.05\tNairobi Area\tNairobi Area\t184743\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_exact(self):
+        self.assertEqual(4, GazetteerBuilder(self.test_dir).build(self.dump, self.countries, self.admin1))
+        results = Gazetteer(self.test_dir).retrieve('NAIROBI', 1)
+        self.assertEqual(2, results['totalResultsCount'])
+        city = results['geonames'][0]
+        self.assertEqual(['Nairobi', 'Nairobi River'], [result['name'] for result in results['geonames']])
+        self.assertEqual('Kenya', city['countryName'])
+        self.assertEqual('Nairobi Area', city['adminName1'])
+        self.assertEqual('city, village,...', city['fclName'])
+        self.assertEqual('SO', Gazetteer(self.test_dir).retrieve('muqdisho', 1)['geonames'][0]['countryName'])
+        self.assertEqual(0, Gazetteer(self.test_dir).retrieve('nairob', 1)['totalResultsCount'])
+
+    def test_fuzzy(self):
+        GazetteerBuilder(self.test_dir).build(self.dump)
+        gazetteer = Gazetteer(self.test_dir)
+        self.assertEqual(['Mombasa'], [result['name'] for result in gazetteer.retrieve('mombaza', 0.3)['geonames']])
+        self.assertEqual(['Mogadishu'], [result['name'] for result in gazetteer.retrieve('mogadisho', 0.8)['geonames']])
+        self.assertEqual(0, gazetteer.retrieve('mombaza', 0.8)['totalResultsCount'])
+        self.assertEqual(['Nairobi', 'Nairobi River'], [result['name'] for result in gazetteer.retrieve('nairobbi')['geonames']])
+        self.assertEqual(0, gazetteer.retrieve('kampala', 0)['totalResultsCount'])
+
+    def test_countries(self):
+        with zipfile.ZipFile(os.path.join(self.test_dir, 'cities.zip'), 'w') as archive:
+            archive.write(self.dump, 'cities.txt')
+        builder = GazetteerBuilder(self.test_dir)
+        self.assertEqual(3, builder.build(os.path.join(self.test_dir, 'cities.zip'), countries=['ke']))
+        self.assertEqual(0, Gazetteer(self.test_dir).retrieve('mogadishu', 1)['totalResultsCount'])
+        builder.build(self.dump)
+        self.assertEqual(0, Gazetteer(self.test_dir, ['KE']).retrieve('mogadishu', 1)['totalResultsCount'])
+        self.assertEqual(1, Gazetteer(self.test_dir, ['SO']).retrieve('mogadishu', 1)['totalResultsCount'])
+
+    def test_trigrams(self):
+        self.assertEqual({' ab', 'ab '}, trigrams('ab'))
+        self.assertEqual({' a '}, trigrams('a'))
@@ -0,0 +1,27 @@
+import unittest
+from dragonfly.matcher import AhoCorasick, longest_matches
+
+
+class AhoCorasickTest(unittest.TestCase):
+    def setUp(self):
+        self.automaton = AhoCorasick()
+        for entry in ['bank', 'bank of kenya', 'central bank', 'of', 'kenya', 'kenya airways', 'a b a b c']:
+            self.automaton.add(entry.split(), entry)
+        self.automaton.build()
+
+    def find(self, text):
+        return [(start, end, value) for start, end, value in self.automaton.find(text.split())]
+
+    def test_find(self):
+        self.assertEqual([(0, 2, 'central bank'), (1, 2, 'bank'), (2, 3, 'of'), (1, 4, 'bank of kenya'),
+                          (3, 4, 'kenya')], self.find('Central Bank of Kenya'))
+        self.assertEqual([], self.find('nothing here'))
+        self.assertEqual(7, len(self.automaton))
+
+    def test_failure_links(self):
+        self.assertEqual([(2, 7, 'a b a b c')], self.find('a b a b a b c'))
+        self.assertEqual([(0, 1, 'kenya'), (2, 3, 'bank')], self.find('kenya of-central bank'))
+
+    def test_longest_matches(self):
+        matches = longest_matches(self.automaton.find('the central bank of kenya airways'.split()))
+        self.assertEqual([(1, 3, 'central bank'), (3, 4, 'of'), (4, 6, 'kenya airways')], matches)
@@ -0,0 +1,62 @@
+import array
+import unittest
+from dragonfly.query import And, DocFilter, Not, Or, Phrase, PostingMatches, QuerySyntaxError, SentenceMatches, \
+    Term, gallop, intersect, parse, sentence_key, union
+
+
+class ParseTest(unittest.TestCase):
+    def test_term(self):
+        node = parse('Nairobi')
+        self.assertIsInstance(node, Term)
+        self.assertEqual('nairobi', node.word)
+        self.assertTrue(parse('nair*').wildcards)
+
+    def test_precedence(self):
+        node = parse('a OR b c NOT d')
+        self.assertIsInstance(node, Or)
+        self.assertIsInstance(node.children[1], And)
+        self.assertIsInstance(node.children[1].children[2], Not)
+
+    def test_phrase_and_doc(self):
+        node = parse('"Bank of Kenya" AND NOT doc:IL5_*')
+        self.assertEqual(['bank', 'of', 'kenya'], node.children[0].words)
+        self.assertIsInstance(node.children[0], Phrase)
+        self.assertIsInstance(node.children[1].child, DocFilter)
+        self.assertEqual('IL5_*', node.children[1].child.pattern)
+
+    def test_lower_case_operators_are_words(self):
+        node = parse('war and peace')
+        self.assertEqual(['war', 'and', 'peace'], [child.word for child in node.children])
+
+    def test_errors(self):
+        for text in ['', 'a AND', '(a OR b', 'a b)', '"" a', '/[a/']:
+            with self.assertRaises(QuerySyntaxError):
+                parse(text)
+
+    def test_punctuation_is_searched_literally(self):
+        for text in ['(', ')', '"', ' "" ', 'a)']:
+            node = parse(text)
+            self.assertIsInstance(node, Term)
+            self.assertEqual(text.strip(), node.word)
+
+
+class IntersectTest(unittest.TestCase):
+    def test_gallop(self):
+        items = list(range(0, 100, 2))
+        self.assertEqual(5, gallop(items, 10, 0))
+        self.assertEqual(6, gallop(items, 11, 3))
+        self.assertEqual(50, gallop(items, 1000, 10))
+
+    def test_intersect(self):
+        common = PostingMatches(array.array('I', [0, 0, 1, 0, 0, 4, 0, 2, 0, 3, 1, 2]))
+        rare = SentenceMatches([sentence_key(0, 2), sentence_key(3, 1)], [(5,), (0,)])
+        excluded = SentenceMatches([sentence_key(0, 0)], [()])
+        matches = intersect([common, rare], [])
+        self.assertEqual([(sentence_key(0, 2), (0, 5)), (sentence_key(3, 1), (0, 2))], list(matches))
+        matches = intersect([PostingMatches(common.refs)], [excluded])
+        self.assertEqual([sentence_key(0, 2), sentence_key(3, 1)], matches.keys)
+
+    def test_union(self):
+        first = SentenceMatches([1, 3], [(0,), (1,)])
+        second = SentenceMatches([2, 3], [(2,), (0,)])
+        self.assertEqual([(1, (0,)), (2, (2,)), (3, (0, 1))], list(union([first, second])))
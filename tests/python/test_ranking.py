@@ -0,0 +1,54 @@
+import array
+import random
+import unittest
+from dragonfly.ranking import BM25, RankedTerm, top_k
+
+
+class BM25Test(unittest.TestCase):
+    def test_impact(self):
+        self.assertAlmostEqual(1.0, BM25.impact(1, 10, 10))
+        self.assertGreater(BM25.impact(2, 10, 10), BM25.impact(1, 10, 10))
+        self.assertGreater(BM25.impact(1, 5, 10), BM25.impact(1, 20, 10))
+
+    def test_impacts(self):
+        refs = array.array('I', [0, 0, 1, 0, 1, 0, 0, 1, 3, 1, 0, 2])
+        lengths = {(0, 0): 10, (0, 1): 4, (1, 0): 4}
+        sentences, impacts = BM25.impacts(refs, lambda doc_id, sent_id: lengths[doc_id, sent_id], 6)
+        self.assertEqual([0, 1, 1, 0, 0, 0], list(sentences))
+        self.assertEqual(sorted(impacts, reverse=True), list(impacts))
+
+
+class TopKTest(unittest.TestCase):
+    def setUp(self):
+        random.seed(7)
+        self.lengths = {(doc_id, sent_id): random.randint(3, 30) for doc_id in range(20) for sent_id in range(10)}
+        self.avg_length = sum(self.lengths.values()) / len(self.lengths)
+        self.terms = []
+        for idf in [0.5, 1.5, 3.0]:
+            refs = array.array('I')
+            for doc_id, sent_id in sorted(self.lengths):
+                for position in range(random.choice([0, 0, 0, 1, 2])):
+                    refs.extend((doc_id, sent_id, position))
+            sentences, impacts = BM25.impacts(refs, self.sentence_length, self.avg_length)
+            self.terms.append(RankedTerm(idf, refs, sentences, impacts))
+
+    def sentence_length(self, doc_id, sent_id):
+        return self.lengths[doc_id, sent_id]
+
+    def test_matches_exhaustive_scoring(self):
+        everything = top_k(self.terms, None, self.sentence_length, self.avg_length)
+        for k in [1, 5, 20]:
+            ranked = top_k(self.terms, k, self.sentence_length, self.avg_length)
+            self.assertEqual(everything[:k], ranked)
+
+    def test_stops_early(self):
+        calls = []
+
+        def sentence_length(doc_id, sent_id):
+            calls.append((doc_id, sent_id))
+            return self.sentence_length(doc_id, sent_id)
+
+        term = self.terms[0]
+        ranked = top_k([term], 3, sentence_length, self.avg_length)
+        self.assertEqual(3, len(ranked))
+        self.assertLess(len(calls), len(term.impacts))
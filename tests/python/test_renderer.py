@@ -0,0 +1,110 @@
+import jinja2
+import os
+import unittest
+from dragonfly.cli import Runner
+from dragonfly.data import Document, Sentence, SentenceRow
+from dragonfly.renderer import AdjudicateAttacher, DocumentWriter, PageCache, RenderedDocument
+
+
+class PageCacheTest(unittest.TestCase):
+    @staticmethod
+    def page(html):
+        return RenderedDocument(html, False, True)
+
+    def test_key(self):
+        cache = PageCache()
+        cache.put('doc1', ('a', 1), self.page('<div></div>'))
+        self.assertEqual('<div></div>', cache.get('doc1', ('a', 1)).html)
+        self.assertIsNone(cache.get('doc1', ('a', 2)))
+        self.assertIsNone(cache.get('doc2', ('a', 1)))
+
+    def test_invalidate(self):
+        cache = PageCache()
+        cache.put('doc1', 1, self.page('a'))
+        cache.put('doc2', 1, self.page('b'))
+        cache.invalidate('doc1')
+        self.assertIsNone(cache.get('doc1', 1))
+        self.assertIsNotNone(cache.get('doc2', 1))
+        cache.invalidate()
+        self.assertEqual(0, len(cache))
+        self.assertEqual(0, cache.size)
+
+    def test_eviction(self):
+        cache = PageCache(10)
+        cache.put('doc1', 1, self.page('aaaa'))
+        cache.put('doc2', 1, self.page('bbbb'))
+        cache.get('doc1', 1)
+        cache.put('doc3', 1, self.page('cccc'))
+        self.assertIsNotNone(cache.get('doc1', 1))
+        self.assertIsNone(cache.get('doc2', 1))
+        self.assertEqual(8, cache.size)
+        cache.put('doc4', 1, self.page('d' * 11))
+        self.assertIsNone(cache.get('doc4', 1))
+
+
+class AdjudicateAttacherTest(unittest.TestCase):
+    def test_sources(self):
+        attacher = AdjudicateAttacher(['anno1', 'anno2'])
+        sources = attacher.sources('out', '/data/doc.txt')
+        expected = [os.path.join(path, 'doc.txt.anno') for path in ['out', 'anno1', 'anno2']]
+        self.assertEqual(expected, sources)
+
+
+class DocumentWriterTest(unittest.TestCase):
+    class Stats:
+        def get_idf(self, word):
+            return len(word) / 7
+
+    def setUp(self):
+        templates = os.path.join(os.path.dirname(__file__), os.pardir, os.pardir, 'dragonfly', 'templates')
+        self.env = jinja2.Environment(loader=jinja2.FileSystemLoader(templates), autoescape=True)
+        runner = Runner()
+        runner.suppress_dict_labels = True
+        self.env.filters['preprocess_text'] = runner._preprocess_text
+        self.env.globals['calc_column_width'] = runner._calc_column_width
+        self.writer = DocumentWriter(runner._preprocess_text, runner._calc_column_width)
+
+    @staticmethod
+    def make_document():
+        sentences = []
+        for index in range(3):
+            sentence = Sentence(index)
+            sentence.add(SentenceRow(0, 'TOKEN', ['<b>', 'Dakar', "l'eau", 'a&b', '"q"']))
+            sentence.add(SentenceRow(1, 'GLOSS', ['x__y', 'a--b', 'ENG_capital | |', '', 'z' * 450]))
+            sentence.add(SentenceRow(2, 'P&S', ['NN', 'NNP', 'NN', 'CC', 'NN']))
+            sentence.rows[0].set_glosses([(0, 1, ('<i>', '', 'user')), (1, 3, ('city', 'GPE', 'dictionary'))])
+            sentences.append(sentence)
+        sentences[1].rows[0].set_suggestions([0.9, 0.1, 0.5, 0.6, 0])
+        return Document('doc.txt', sentences, True)
+
+    def assert_same(self, document, doc_stats=None, settings=None, stop=None):
+        settings = settings or {'Column Width': '10', 'Display Row Labels': True}
+        template = self.env.get_template('document.html')
+        expected = template.render(document=document, doc_stats=doc_stats, df_settings=settings,
+                                   start=0, stop=len(document.sentences) if stop is None else stop)
+        self.assertEqual(expected, self.writer.write(document, doc_stats, settings, stop))
+
+    def test_plain(self):
+        self.assert_same(self.make_document())
+
+    def test_stats_and_labels(self):
+        self.assert_same(self.make_document(), self.Stats(), {'Column Width': 30, 'Display Row Labels': False})
+
+    def test_annotations(self):
+        document = self.make_document()
+        document.attach_annotations([self.make_document().sentences[i] for i in range(3)])
+        document.attach_translation(['one\n', 'two & <three>\n'])
+        document.attach_markers([1])
+        adjudication = self.make_document().sentences
+        document.attach_adj_annotations('anno1', adjudication)
+        self.assert_same(document, self.Stats())
+
+    def test_window(self):
+        document = self.make_document()
+        self.assert_same(document, stop=1)
+        settings = {'Column Width': 10, 'Display Row Labels': True}
+        template = self.env.get_template('sentences.html')
+        expected = template.render(document=document, doc_stats=None, df_settings=settings, start=1, stop=3)
+        self.assertEqual(expected, self.writer.write_sentences(document, None, settings, 1, 3))
+        self.assertTrue(expected.startswith('<div class="df-sentence" id="df-sentence-1">'))
+        self.assertIn('data-sentences="3"', self.writer.write(document, None, settings, 1))
@@ -0,0 +1,52 @@
+import json
+import os
+import tempfile
+import unittest
+from dragonfly.resources import ResourceLocator
+
+
+class ResourceLocatorTest(unittest.TestCase):
+    def setUp(self):
+        self.data_dir = tempfile.TemporaryDirectory()
+        self.md_dir = tempfile.TemporaryDirectory()
+        self.config = {
+            'dragonfly.data_dir': self.data_dir.name,
+            'dragonfly.local_md_dir': self.md_dir.name,
+        }
+
+    def tearDown(self):
+        self.data_dir.cleanup()
+        self.md_dir.cleanup()
+
+    def warm_up(self, locator):
+        locator.warm_up()
+        locator._warm_up_executor.shutdown(wait=True)
+        locator.local_search.executor.shutdown(wait=True)
+
+    def test_warm_up(self):
+        with open(os.path.join(self.md_dir.name, 'phrases.json'), 'w', encoding='utf8') as fp:
+            json.dump({'nairobi': ['Nairobi is the capital']}, fp)
+        locator = ResourceLocator(self.config)
+        self.warm_up(locator)
+        status = locator.status
+        self.assertEqual(ResourceLocator.READY, status['phrases'])
+        self.assertEqual(ResourceLocator.UNAVAILABLE, status['dictionary'])
+        self.assertEqual(ResourceLocator.READY, status['local'])
+        self.assertTrue(locator.phrases_search.loaded)
+        self.assertEqual(['Nairobi is the capital'], locator.phrases_search.retrieve('Nairobi'))
+
+    def test_failed(self):
+        with open(os.path.join(self.md_dir.name, 'phrases.json'), 'w', encoding='utf8') as fp:
+            fp.write('{')
+        locator = ResourceLocator(self.config)
+        self.warm_up(locator)
+        self.assertEqual(ResourceLocator.FAILED, locator.status['phrases'])
+
+    def test_index_failed(self):
+        locator = ResourceLocator(self.config)
+
+        def fail():
+            raise IOError('disk full')
+        locator.local_search._update_index = fail
+        self.warm_up(locator)
+        self.assertEqual(ResourceLocator.FAILED, locator.status['local'])
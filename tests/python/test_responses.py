@@ -0,0 +1,83 @@
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+import flask
+from dragonfly.responses import ResponseCompressor, StaticFingerprints
+
+
+class ResponseCompressorTest(unittest.TestCase):
+    def setUp(self):
+        self.compressor = ResponseCompressor()
+        self.app = flask.Flask(__name__)
+
+    def compress(self, data, mimetype='text/html', encodings='gzip', etag=None, headers=None):
+        headers = dict(headers or {}, **{'Accept-Encoding': encodings})
+        with self.app.test_request_context(headers=headers):
+            response = flask.Response(data, mimetype=mimetype)
+            response.headers['Accept-Ranges'] = 'bytes'
+            if etag:
+                response.set_etag(etag)
+            return self.compressor.compress(response, flask.request)
+
+    def test_gzip(self):
+        data = 'hello world ' * 1000
+        response = self.compress(data, etag='abc')
+        self.assertEqual('gzip', response.headers['Content-Encoding'])
+        self.assertIn('Accept-Encoding', response.vary)
+        self.assertEqual(data, gzip.decompress(response.get_data()).decode('utf8'))
+        self.assertEqual(('abc-gzip', False), response.get_etag())
+        self.assertEqual(len(response.get_data()), int(response.headers['Content-Length']))
+        self.assertNotIn('Accept-Ranges', response.headers)
+
+    def test_range_request(self):
+        response = self.compress('hello world ' * 1000, headers={'Range': 'bytes=0-99'})
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertEqual('bytes', response.headers['Accept-Ranges'])
+
+    def test_small_response(self):
+        response = self.compress('hello world')
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertEqual(b'hello world', response.get_data())
+
+    def test_not_accepted(self):
+        response = self.compress('hello world ' * 1000, encodings='identity')
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertIn('Accept-Encoding', response.vary)
+
+    def test_mimetype(self):
+        response = self.compress(b'\x00' * 10000, mimetype='application/octet-stream')
+        self.assertNotIn('Content-Encoding', response.headers)
+
+    def test_cache(self):
+        data = 'hello world ' * 1000
+        first = self.compress(data, etag='abc').get_data()
+        self.assertEqual(1, len(self.compressor._cache))
+        self.assertEqual(first, self.compress(data, etag='abc').get_data())
+        self.compress(data)
+        self.assertEqual(1, len(self.compressor._cache))
+        self.assertEqual(len(first), self.compressor.cache_size)
+
+
+class StaticFingerprintsTest(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.test_dir, 'test.css')
+        with open(self.filename, 'w') as fp:
+            fp.write('body {}')
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_changes_with_content(self):
+        fingerprints = StaticFingerprints(self.test_dir)
+        version = fingerprints.get('test.css')
+        self.assertEqual(StaticFingerprints.LENGTH, len(version))
+        self.assertEqual(version, fingerprints.get('test.css'))
+        with open(self.filename, 'w') as fp:
+            fp.write('body {color: red}')
+        self.assertNotEqual(version, fingerprints.get('test.css'))
+
+    def test_missing_file(self):
+        self.assertIsNone(StaticFingerprints(self.test_dir).get('missing.css'))
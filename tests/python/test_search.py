@@ -1,6 +1,29 @@
 import unittest
-from dragonfly.search import InvertedIndex, DocumentStats
+import http.server
+import io
+import json
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+import urllib.parse
+from unittest import mock
+from dragonfly.query import QuerySyntaxError
+from dragonfly.search import DictionaryMatcher, DictionarySearch, DocumentStats, GeonamesCache, GeonamesSearch, InvertedIndex, \
+    LocalSearch, PhrasesSearch
 from dragonfly.data import Document, Sentence, SentenceRow
+from dragonfly.translations import TranslationDictManager
+
+
+def make_legacy_index_data(doc, sentence):
+    # index data as pickled before refs were integer ids
+    data = InvertedIndex.IndexData.__new__(InvertedIndex.IndexData)
+    data.__dict__ = {'max_entries': 25, 'num_documents': 1, 'index': {}}
+    for word in sentence:
+        ref = {'doc': doc, 'sent_id': 0, 'text': sentence, 'trans': None}
+        data.index[word] = {'count': 1, 'doc_count': 1, 'refs': [ref]}
+    return data
 
 
 class InvertedIndexTest(unittest.TestCase):
@@ -15,7 +38,9 @@ class InvertedIndexTest(unittest.TestCase):
         trans = [['bonjour', 'world'], ['this', 'is', 'a', 'test'], ['goodbye', 'world']]
         index = InvertedIndex()
         index.add('doc1', sentences, trans)
-        self.assertEqual('bonjour', index._index.get('hello')['refs'][0]['trans'][0])
+        refs = index.hydrate(index.retrieve('hello')['refs'])
+        self.assertEqual('bonjour', refs[0]['trans'][0])
+        self.assertEqual(['hello', 'world'], refs[0]['text'])
 
     def test_doc_count(self):
         index = InvertedIndex()
@@ -35,8 +60,9 @@ class InvertedIndexTest(unittest.TestCase):
         results = index.retrieve('hello')
         self.assertEqual(2, results['count'])
         self.assertEqual({'hello'}, results['terms'])
-        self.assertEqual({'doc1', 'doc2'}, set([x['doc'] for x in results['refs']]))
-        self.assertIsNone(results['refs'][0]['trans'])
+        refs = index.hydrate(results['refs'])
+        self.assertEqual({'doc1', 'doc2'}, set([x['doc'] for x in refs]))
+        self.assertIsNone(refs[0]['trans'])
 
     def test_retrieve_with_case(self):
         index = InvertedIndex()
@@ -54,7 +80,265 @@ class InvertedIndexTest(unittest.TestCase):
         results = index.retrieve('mary*', True)
         self.assertEqual(2, results['count'])
         self.assertEqual({'mary', 'maryland'}, results['terms'])
-        self.assertEqual({'doc1', 'doc2'}, set([x['doc'] for x in results['refs']]))
+        self.assertEqual({'doc1', 'doc2'}, set([x['doc'] for x in index.hydrate(results['refs'])]))
+
+    def test_retrieve_keeps_all_refs(self):
+        index = InvertedIndex()
+        index.add('doc1', [['hello', str(i)] for i in range(40)], None)
+        results = index.retrieve('hello')
+        self.assertEqual(40, results['count'])
+        self.assertEqual([(0, i, (0,)) for i in range(40)], results['refs'])
+        self.assertIsNone(results['next_offset'])
+
+    def test_retrieve_page(self):
+        index = InvertedIndex()
+        index.add('doc1', [['mary', 'had'], ['a', 'mary']], None)
+        index.add('doc2', [['maryland', 'mary']], None)
+        index.add('doc3', [['marylou', 'maryland']], None)
+        results = index.retrieve('mary*', True, offset=1, limit=3)
+        self.assertEqual(6, results['count'])
+        self.assertEqual([(0, 1, (1,)), (1, 0, (1,)), (1, 0, (0,))], results['refs'])
+        self.assertEqual(4, results['next_offset'])
+        results = index.retrieve('mary*', True, offset=4, limit=3)
+        self.assertEqual([(2, 0, (1,)), (2, 0, (0,))], results['refs'])
+        self.assertIsNone(results['next_offset'])
+        self.assertEqual([], index.retrieve('mary', offset=10, limit=3)['refs'])
+
+    def test_retrieve_fuzzy(self):
+        index = InvertedIndex()
+        index.add('doc1', [['Muhammad', 'and', 'Mohammed'], ['Mohamed']], None)
+        index.add('doc2', [['Ahmed', 'muhammad']], None)
+        results = index.retrieve_fuzzy('mohammed')
+        self.assertEqual({'mohammed', 'mohamed', 'muhammad'}, results['terms'])
+        self.assertEqual(4, results['count'])
+        self.assertEqual([(0, 0, (2,)), (0, 1, (0,)), (0, 0, (0,)), (1, 0, (1,))], results['refs'])
+        self.assertEqual({'mohammed', 'mohamed'}, index.retrieve_fuzzy('Mohammed', 1)['terms'])
+
+    def test_retrieve_ranked(self):
+        index = InvertedIndex()
+        index.add('doc1', [['kenya', 'is', 'a', 'country', 'in', 'east', 'africa'], ['nairobi', 'kenya']], None)
+        index.add('doc2', [['nairobi', 'is', 'in', 'kenya'], ['the', 'weather']], None)
+        index.add('doc3', [['kenya', 'kenya']], None)
+        results = index.retrieve_ranked('Kenya nairobi')
+        self.assertEqual(7, results['count'])
+        self.assertEqual([(0, 1), (1, 0), (2, 0), (0, 0)], [ref[:2] for ref in results['refs']])
+        self.assertEqual((0, 1), results['refs'][0][2])
+        results = index.retrieve_ranked('kenya nairobi', offset=1, limit=2)
+        self.assertEqual([(1, 0), (2, 0)], [ref[:2] for ref in results['refs']])
+        self.assertEqual(3, results['next_offset'])
+        self.assertEqual(0, index.retrieve_ranked('france')['count'])
+
+    def test_retrieve_phrase(self):
+        index = InvertedIndex()
+        index.add('doc1', [['the', 'Bank', 'of', 'Kenya'], ['bank', 'of', 'the', 'bank', 'of', 'kenya']], None)
+        index.add('doc2', [['of', 'kenya', 'bank']], None)
+        results = index.retrieve_phrase(['bank', 'of', 'kenya'])
+        self.assertEqual(2, results['count'])
+        self.assertEqual({'bank', 'of', 'kenya'}, results['terms'])
+        self.assertEqual([(0, 0, (1, 2, 3)), (0, 1, (3, 4, 5))], results['refs'])
+        self.assertEqual([(1, 2, 3), (3, 4, 5)], [x['positions'] for x in index.hydrate(results['refs'])])
+        results = index.retrieve_phrase(['bank', 'of', 'kenya'], offset=0, limit=1)
+        self.assertEqual([(0, 0, (1, 2, 3))], results['refs'])
+        self.assertEqual(1, results['next_offset'])
+        self.assertEqual(0, index.retrieve_phrase(['kenya', 'bank', 'of'])['count'])
+        self.assertEqual(0, index.retrieve_phrase(['bank', 'of', 'france'])['count'])
+        self.assertEqual(0, index.retrieve_phrase([])['count'])
+
+    def test_query(self):
+        index = InvertedIndex()
+        index.add('doc1', [['Nairobi', 'in', 'Kenya'], ['Nairobi', 'river'], ['Mombasa', 'in', 'Kenya']], None)
+        index.add('doc2', [['to', 'Nairobi', 'in', 'Kenya', 'in', 'Africa']], None)
+        results = index.query('nairobi AND in')
+        self.assertEqual(2, results['count'])
+        self.assertEqual({'nairobi', 'in'}, results['terms'])
+        self.assertEqual([(0, 0, (0, 1)), (1, 0, (1, 2, 4))], results['refs'])
+        self.assertEqual([(0, 0), (1, 0)], [x[:2] for x in index.query('nairobi in')['refs']])
+        self.assertEqual([(0, 0), (0, 1)], [x[:2] for x in index.query('nairobi NOT doc:doc2')['refs']])
+        self.assertEqual([(0, 1)], [x[:2] for x in index.query('nairobi AND NOT kenya')['refs']])
+        self.assertEqual([(0, 0), (0, 1), (0, 2), (1, 0)], [x[:2] for x in index.query('nairobi OR mombasa')['refs']])
+        self.assertEqual([(0, 2)], [x[:2] for x in index.query('(mombasa OR river) AND kenya')['refs']])
+        self.assertEqual([(1, 0)], [x[:2] for x in index.query('"nairobi in" AND africa')['refs']])
+        self.assertEqual([(0, 0), (1, 0)], [x[:2] for x in index.query('nair* AND ken?a')['refs']])
+        results = index.query('in AND kenya', offset=1, limit=1)
+        self.assertEqual(3, results['count'])
+        self.assertEqual([(0, 2)], [x[:2] for x in results['refs']])
+        self.assertEqual(2, results['next_offset'])
+        self.assertEqual(4, index.query('in')['count'])
+        self.assertEqual({'nairobi'}, index.query('/AIR/')['terms'])
+        self.assertEqual({'nairobi'}, index.query('nairoby~1')['terms'])
+        self.assertEqual([(0, 0), (0, 2), (1, 0)], [x[:2] for x in index.query('kenia~ AND in')['refs']])
+        self.assertEqual([(0, 2)], [x[:2] for x in index.query('/^m.*a$/ AND kenya')['refs']])
+        with self.assertRaises(QuerySyntaxError):
+            index.query('NOT kenya')
+        with self.assertRaises(QuerySyntaxError):
+            index.query('(kenya river')
+        with self.assertRaises(QuerySyntaxError):
+            index.query('/(ke/')
+
+    def test_query_punctuation(self):
+        index = InvertedIndex()
+        index.add('doc1', [['Nairobi', '(', 'Kenya', ')'], ['"', 'Hello', '"']], None)
+        self.assertEqual([(0, 0, (1,))], index.query('(')['refs'])
+        self.assertEqual([(0, 1, (0,)), (0, 1, (2,))], index.query('"')['refs'])
+
+    def test_remove(self):
+        index = InvertedIndex()
+        index.add('doc1', [['hello', 'world'], ['goodbye', 'world']], None)
+        index.add('doc2', [['hello', 'nurse']], None)
+        index.remove('doc1')
+        self.assertEqual(1, index.num_documents)
+        self.assertEqual(1, index.get_doc_count('hello'))
+        self.assertEqual(0, index.get_doc_count('world'))
+        self.assertEqual({'doc2'}, set([x['doc'] for x in index.hydrate(index.retrieve('hello')['refs'])]))
+
+    def test_avg_sentence_length(self):
+        index = InvertedIndex()
+        index.add('doc1', [['a', 'b', 'c'], ['d']], None)
+        index.add('doc2', [['a']], None)
+        self.assertAlmostEqual(5 / 3, index._index.avg_sentence_length())
+        index.remove('doc1')
+        self.assertEqual(1, index._index.avg_sentence_length())
+        with tempfile.TemporaryDirectory() as test_dir:
+            filename = os.path.join(test_dir, 'index.dat')
+            index.add('doc3', [['a', 'b', 'c']], None)
+            index.save(filename)
+            mutable = InvertedIndex()
+            mutable.load(filename)
+            mutable.make_mutable()
+            self.assertEqual(2, mutable._index.avg_sentence_length())
+
+    def test_save_and_load_mapped(self):
+        index = InvertedIndex()
+        index.add('doc1', [['hello', 'world'], ['goodbye', 'world']], [['bonjour', 'monde'], ['au revoir', 'monde']])
+        index.add('doc2', [['hello', 'nurse']], None)
+        with tempfile.TemporaryDirectory() as test_dir:
+            filename = os.path.join(test_dir, 'index.dat')
+            index.save(filename)
+            mapped = InvertedIndex()
+            self.assertTrue(mapped.load(filename))
+            self.assertIsInstance(mapped._index, InvertedIndex.MappedData)
+            self.assertEqual(2, mapped.num_documents)
+            self.assertEqual(2, mapped.get_doc_count('HELLO'))
+            self.assertEqual(0, mapped.get_doc_count('france'))
+            self.assertEqual(index.retrieve('world'), mapped.retrieve('world'))
+            self.assertEqual(index.retrieve('hello'), mapped.retrieve('hello'))
+            refs = mapped.retrieve('world')['refs']
+            self.assertEqual(index.hydrate(refs), mapped.hydrate(refs))
+            self.assertEqual(['au revoir', 'monde'], mapped.hydrate(refs)[1]['trans'])
+            self.assertEqual(index.retrieve('*o*', True)['count'], mapped.retrieve('*o*', True)['count'])
+            self.assertEqual(index.retrieve_regex('ell|orl'), mapped.retrieve_regex('ell|orl'))
+            self.assertEqual(index.retrieve_fuzzy('wrold', 1), mapped.retrieve_fuzzy('wrold', 1))
+            self.assertEqual(index.retrieve_ranked('hello world'), mapped.retrieve_ranked('hello world'))
+            self.assertEqual(['goodbye'], mapped.vocabulary.match('*odb*'))
+            self.assertEqual(['goodbye'], mapped.vocabulary.search('odb'))
+            self.assertEqual(index.retrieve_phrase(['goodbye', 'world']), mapped.retrieve_phrase(['goodbye', 'world']))
+            self.assertEqual(index.query('hello OR world NOT doc:doc2'), mapped.query('hello OR world NOT doc:doc2'))
+            del mapped
+
+    def test_load_legacy_pickle(self):
+        with tempfile.TemporaryDirectory() as test_dir:
+            filename = os.path.join(test_dir, 'index.pkl')
+            with open(filename, 'wb') as fp:
+                pickle.dump(make_legacy_index_data('doc1', ['hello', 'world']), fp)
+            legacy = InvertedIndex()
+            self.assertTrue(legacy.load(filename))
+            self.assertEqual(1, legacy.retrieve('world')['count'])
+            self.assertEqual([{'doc': 'doc1', 'sent_id': 0, 'text': ['hello', 'world'], 'trans': None, 'positions': (1,)}],
+                             legacy.hydrate(legacy.retrieve('world')['refs']))
+
+
+class LocalSearchTest(unittest.TestCase):
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        self.md_dir = os.path.join(self.data_dir, '.dragonfly')
+        os.mkdir(self.md_dir)
+        self.write_doc('doc1.txt', 'TOKEN\tROMAN\nSalam\tsalam\ndunya\tdunya\n\nSalam\tsalam\n')
+        self.write_doc('doc2.txt', 'TOKEN\tROMAN\ndunya\tdunya\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.data_dir)
+
+    def write_doc(self, name, text):
+        with open(os.path.join(self.data_dir, name), 'w', encoding='utf8') as fp:
+            fp.write(text)
+
+    def test_build_and_retrieve(self):
+        search = LocalSearch(self.data_dir, self.md_dir)
+        search.build_index()
+        self.assertTrue(search.loaded)
+        results = search.retrieve('salam')
+        self.assertEqual(2, results['count'])
+        self.assertEqual(['Salam', 'dunya'], results['refs'][0]['text'])
+        self.assertEqual(['salam', 'dunya'], results['refs'][0]['trans'])
+
+    def test_retrieve_pages(self):
+        self.write_doc('doc3.txt', 'TOKEN\tROMAN\n' + 'Salam\tsalam\n\n' * 30)
+        search = LocalSearch(self.data_dir, self.md_dir)
+        search.build_index()
+        results = search.retrieve('salam')
+        self.assertEqual(32, results['count'])
+        self.assertEqual(LocalSearch.PAGE_SIZE, len(results['refs']))
+        results = search.retrieve('salam', offset=results['next_offset'])
+        self.assertEqual(32 - LocalSearch.PAGE_SIZE, len(results['refs']))
+        self.assertEqual('doc3.txt', results['refs'][-1]['doc'])
+        self.assertIsNone(results['next_offset'])
+
+    def test_parallel_build_matches_serial(self):
+        for i in range(6):
+            self.write_doc('doc{}0.txt'.format(i), 'TOKEN\tROMAN\n' + 'Salam\tsalam\ndunya\tdunya\n\n' * (i + 5))
+        filenames = LocalSearch(self.data_dir, self.md_dir)._get_filenames()
+        serial = InvertedIndex()
+        LocalSearch(self.data_dir, self.md_dir)._index_documents(serial, filenames)
+        parallel = InvertedIndex()
+        LocalSearch(self.data_dir, self.md_dir, workers=2)._index_documents(parallel, filenames)
+        self.assertEqual(serial.num_documents, parallel.num_documents)
+        self.assertEqual(serial._index.index, parallel._index.index)
+        self.assertEqual(serial._index.doc_words, parallel._index.doc_words)
+
+    def test_update_index(self):
+        search = LocalSearch(self.data_dir, self.md_dir)
+        search.load_index(build=True)
+        self.assertEqual(2, search.retrieve('dunya')['count'])
+        self.write_doc('doc2.txt', 'TOKEN\tROMAN\nSalam\tsalam\n')
+        self.write_doc('doc3.txt', 'TOKEN\tROMAN\ndunya\tdunya\ndunya\tdunya\n')
+        os.remove(os.path.join(self.data_dir, 'doc1.txt'))
+        search.update_index()
+        self.assertEqual(2, search.index.num_documents)
+        self.assertEqual(1, search.retrieve('salam')['count'])
+        self.assertEqual({'doc3.txt'}, set([x['doc'] for x in search.retrieve('dunya')['refs']]))
+        self.assertEqual(1, search.index.get_doc_count('dunya'))
+
+    def test_update_index_with_unreadable_index(self):
+        search = LocalSearch(self.data_dir, self.md_dir)
+        search.build_index()
+        self.write_doc('doc2.txt', 'TOKEN\tROMAN\nSalam\tsalam\n')
+        load = InvertedIndex.load
+        calls = []
+
+        def fail_second_load(index, filename):
+            calls.append(filename)
+            return False if len(calls) == 2 else load(index, filename)
+        with mock.patch.object(InvertedIndex, 'load', fail_second_load):
+            search.update_index()
+        # rebuilt from every document instead of only the changed one
+        self.assertEqual(2, search.index.num_documents)
+        self.assertEqual(3, search.retrieve('salam')['count'])
+
+    def test_update_index_without_changes(self):
+        search = LocalSearch(self.data_dir, self.md_dir)
+        search.build_index()
+        mtime = os.path.getmtime(os.path.join(self.md_dir, LocalSearch.INVERTED_INDEX))
+        search.update_index()
+        self.assertEqual(mtime, os.path.getmtime(os.path.join(self.md_dir, LocalSearch.INVERTED_INDEX)))
+
+    def test_migrate_legacy_index(self):
+        with open(os.path.join(self.md_dir, LocalSearch.LEGACY_INVERTED_INDEX), 'wb') as fp:
+            pickle.dump(make_legacy_index_data('doc1.txt', ['salam']), fp)
+        search = LocalSearch(self.data_dir, self.md_dir)
+        search.load_index()
+        self.assertTrue(search.loaded)
+        self.assertTrue(os.path.exists(os.path.join(self.md_dir, LocalSearch.INVERTED_INDEX)))
+        self.assertEqual(1, search.retrieve('salam')['count'])
 
 
 class DocumentStatsTest(unittest.TestCase):
@@ -71,3 +355,215 @@ class DocumentStatsTest(unittest.TestCase):
     def test_tfidf(self):
         stats = DocumentStats(self.doc1, self.index)
         self.assertAlmostEqual(0.8109302162, stats.get_tfidf('World'))
+
+
+class DictionarySearchTest(unittest.TestCase):
+    COMBODICT = 'salam\tUR_hello | peace\nsalama\tsafety\nsalam\tgreeting\nsalamat\tUR_health\n'
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.search = DictionarySearch(self.test_dir)
+        self.search.copy(self.COMBODICT)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_retrieve(self):
+        results = self.search.retrieve('Salam', DictionarySearch.IL)
+        self.assertEqual([['salam', 'UR_hello | peace'], ['salam', 'greeting']], results)
+        self.assertEqual([['salamat', 'UR_health']], self.search.retrieve('health', DictionarySearch.ENG))
+
+    def test_retrieve_miss_does_not_grow_index(self):
+        self.assertEqual([], self.search.retrieve('nothing', DictionarySearch.IL))
+        self.assertEqual(3, len(self.search.indexes[DictionarySearch.IL]))
+
+    def test_suggest(self):
+        self.assertEqual(['salam', 'salama', 'salamat'], self.search.suggest('sal', DictionarySearch.IL))
+        self.assertEqual(['salam', 'salama'], self.search.suggest('sal', DictionarySearch.IL, limit=2))
+        self.assertEqual(['salam'], self.search.suggest('sal', DictionarySearch.IL, 1, by_frequency=True))
+        self.assertEqual([], self.search.suggest('x', DictionarySearch.IL))
+
+    def test_gloss(self):
+        self.assertEqual({'salam': 'UR_hello | peace', 'salamat': 'UR_health'},
+                         self.search.gloss(['salam', 'salamat', 'nothing']))
+        self.assertEqual({}, DictionarySearch(os.path.join(self.test_dir, 'missing')).gloss(['salam']))
+
+    def test_cache(self):
+        self.search.retrieve('salam', DictionarySearch.IL)
+        self.assertTrue(os.path.exists(os.path.join(self.test_dir, DictionarySearch.CACHE_FILENAME)))
+        cached = DictionarySearch(self.test_dir)
+        cached._parse = None
+        self.assertEqual([['salamat', 'UR_health']], cached.retrieve('health', DictionarySearch.ENG))
+        self.assertEqual(['salam', 'salama'], cached.suggest('sal', DictionarySearch.IL, limit=2))
+        self.assertEqual([], cached.retrieve('nothing', DictionarySearch.IL))
+
+    def test_cache_is_rebuilt_after_copy(self):
+        self.search.retrieve('salam', DictionarySearch.IL)
+        self.search.copy('kabul\tUR_kabul\n')
+        self.assertEqual([['kabul', 'UR_kabul']], DictionarySearch(self.test_dir).retrieve('kabul', DictionarySearch.ENG))
+        self.assertEqual([], self.search.retrieve('salam', DictionarySearch.IL))
+
+
+class PhrasesSearchTest(unittest.TestCase):
+    PHRASES = {
+        'salam': [{'il': 'salam aleikum', 'eng': 'peace be upon you'}, {'il': 'salam', 'eng': 'hello'}],
+        'kabul': [{'il': 'kabul shahr', 'eng': 'kabul city \u00e9'}],
+        'x': [],
+    }
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.search = PhrasesSearch(self.test_dir)
+        self.search.CHUNK_SIZE = 8
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_copy(self):
+        self.assertFalse(self.search.available)
+        self.assertEqual([], self.search.retrieve('salam'))
+        self.search.copy(io.BytesIO(json.dumps(self.PHRASES, indent=1).encode('utf8')))
+        self.assertTrue(self.search.available)
+        self.assertEqual(self.PHRASES['salam'], self.search.retrieve('Salam'))
+        self.assertEqual(self.PHRASES['kabul'], PhrasesSearch(self.test_dir).retrieve('kabul'))
+        self.assertEqual([], self.search.retrieve('nothing'))
+        self.search.copy(io.BytesIO(b'{"herat": [1.5, 20]}'))
+        self.assertEqual([1.5, 20], self.search.retrieve('herat'))
+        self.assertEqual([], self.search.retrieve('salam'))
+
+    def test_json_file(self):
+        with open(os.path.join(self.test_dir, PhrasesSearch.FILENAME), 'w', encoding='utf8') as fp:
+            json.dump(self.PHRASES, fp, ensure_ascii=False)
+        self.assertEqual(self.PHRASES['kabul'], self.search.retrieve('kabul'))
+        self.assertTrue(os.path.exists(os.path.join(self.test_dir, PhrasesSearch.STORE_FILENAME)))
+
+    def test_bad_json(self):
+        for data in [b'', b'[]', b'{"a": [1]', b'{"a" [1]}', b'{1: 2}']:
+            with self.assertRaises(ValueError):
+                self.search.copy(io.BytesIO(data))
+        self.search.copy(io.BytesIO(b' { } '))
+        self.assertEqual([], self.search.retrieve('a'))
+
+
+class GeonamesHandler(http.server.BaseHTTPRequestHandler):
+    # stand-in for the geonames search api that records the requests
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        url = urllib.parse.urlparse(self.path)
+        if url.path != '/search':
+            self.send_error(404)
+            return
+        query = urllib.parse.parse_qs(url.query)
+        self.server.requests.append((self.client_address, query))
+        if query['username'] == ['bad']:
+            body = {'status': {'message': 'invalid user', 'value': 10}}
+        else:
+            body = {'totalResultsCount': 1, 'geonames': [{'name': query['q'][0]}]}
+        data = json.dumps(body).encode('utf8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class GeonamesSearchTest(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), GeonamesHandler)
+        self.server.requests = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = 'http://127.0.0.1:{}/search'.format(self.server.server_port)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.test_dir)
+
+    def test_retrieve(self):
+        search = GeonamesSearch('user', countries=['KE', 'SO'], url=self.url)
+        self.assertEqual([{'name': 'Nairobi'}], search.retrieve('Nairobi', 0.5)['geonames'])
+        search.retrieve('Mombasa')
+        (first, query), (second, _) = self.server.requests
+        self.assertEqual(['KE', 'SO'], query['country'])
+        self.assertEqual(['0.5'], query['fuzzy'])
+        # the connection is kept alive
+        self.assertEqual(first, second)
+
+    def test_errors(self):
+        self.assertIsNone(GeonamesSearch('bad', url=self.url).retrieve('Nairobi'))
+        self.assertIsNone(GeonamesSearch('user', url=self.url + '/missing').retrieve('Nairobi'))
+
+    def test_cache(self):
+        cache = GeonamesCache(self.test_dir)
+        search = GeonamesSearch('user', countries=['KE'], cache=cache, url=self.url)
+        search.retrieve('Nairobi')
+        self.assertEqual([{'name': 'Nairobi'}], search.retrieve('Nairobi')['geonames'])
+        other = GeonamesSearch('user', countries=['KE'], cache=GeonamesCache(self.test_dir), url=self.url)
+        other.retrieve('Nairobi')
+        self.assertEqual(1, len(self.server.requests))
+        search.retrieve('Nairobi', 0.5)
+        GeonamesSearch('user', cache=cache, url=self.url).retrieve('Nairobi')
+        self.assertEqual(3, len(self.server.requests))
+        GeonamesSearch('bad', cache=cache, url=self.url).retrieve('Mombasa')
+        GeonamesSearch('user', cache=cache, url=self.url).retrieve('Mombasa')
+        self.assertEqual(5, len(self.server.requests))
+
+    def test_cache_expiry(self):
+        cache = GeonamesCache(self.test_dir, ttl=60, max_entries=2)
+        with mock.patch('time.time', return_value=1000):
+            cache.put('a', 1)
+            cache.put('b', 2)
+        with mock.patch('time.time', return_value=1010):
+            self.assertEqual(1, cache.get('a'))
+            cache.put('c', 3)
+            self.assertIsNone(cache.get('b'))
+            self.assertEqual(1, cache.get('a'))
+        with mock.patch('time.time', return_value=1061):
+            self.assertIsNone(cache.get('a'))
+            self.assertEqual(3, cache.get('c'))
+
+
+class DictionaryMatcherTest(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.dictionary = DictionarySearch(self.test_dir)
+        self.dictionary.copy('salam\thello\nsalam aleikum\tpeace be upon you\nbank of kenya\tbank\n')
+        self.translations = TranslationDictManager(self.test_dir)
+        self.translations.add('swa', 'Bank', 'bank', '')
+        self.matcher = DictionaryMatcher(self.translations, self.dictionary, 'swa')
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_match(self):
+        matches = self.matcher.match('Salam aleikum bank of Kenya salam'.split())
+        self.assertEqual([(0, 2, ('peace be upon you', '', DictionaryMatcher.DICTIONARY)),
+                          (2, 5, ('bank', '', DictionaryMatcher.DICTIONARY))], matches)
+        self.assertEqual([(0, 1, ('bank', '', DictionaryMatcher.USER))], self.matcher.match(['bank', 'of']))
+
+    def test_rebuilt_when_changed(self):
+        automaton = self.matcher.automaton
+        self.assertIs(automaton, self.matcher.automaton)
+        self.translations.add('swa', 'benki kuu', 'central bank', 'ORG')
+        self.assertEqual([(0, 2, ('central bank', 'ORG', DictionaryMatcher.USER))],
+                         self.matcher.match(['benki', 'kuu']))
+
+    def test_user_phrases(self):
+        self.translations.add('swa', 'benki kuu', 'central bank', 'ORG')
+        sentence = Sentence(0)
+        sentence.add(SentenceRow(0, 'TOKEN', ['Benki', 'kuu', 'ya', 'bank', 'of', 'kenya']))
+        document = Document('doc.txt', [sentence], False)
+        self.assertEqual({'benki kuu'}, self.matcher.user_phrases(document))
+
+    def test_user_change_keeps_dictionary_entries(self):
+        self.matcher.match(['salam'])
+        with mock.patch.object(self.dictionary, 'entries') as entries:
+            self.translations.add('swa', 'benki kuu', 'central bank', 'ORG')
+            self.assertEqual([(0, 2, ('peace be upon you', '', DictionaryMatcher.DICTIONARY))],
+                             self.matcher.match(['salam', 'aleikum']))
+            entries.assert_not_called()
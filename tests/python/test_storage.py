@@ -0,0 +1,62 @@
+import array
+import os
+import tempfile
+import unittest
+from dragonfly.storage import SectionReader, SectionWriter, StringTable
+
+
+class SectionFileTest(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.test_dir.name, 'test.dat')
+
+    def tearDown(self):
+        self.test_dir.cleanup()
+
+    def test_round_trip(self):
+        writer = SectionWriter(b'TEST', 1)
+        writer.add(b'abc')
+        writer.add(array.array('Q', [1, 2, 3]))
+        writer.write(self.filename)
+        reader = SectionReader(self.filename, b'TEST', 1)
+        self.assertEqual(b'abc', reader.bytes(0).tobytes())
+        self.assertEqual([1, 2, 3], reader.array(1, 'Q').tolist())
+
+    def test_wrong_version(self):
+        SectionWriter(b'TEST', 1).write(self.filename)
+        with self.assertRaises(ValueError):
+            SectionReader(self.filename, b'TEST', 2)
+
+    def test_is_stale(self):
+        SectionWriter(b'TEST', 1).write(self.filename)
+        reader = SectionReader(self.filename, b'TEST', 1)
+        self.assertFalse(reader.is_stale())
+        writer = SectionWriter(b'TEST', 1)
+        writer.add(b'new data')
+        writer.write(self.filename)
+        self.assertTrue(reader.is_stale())
+
+    def test_failed_write(self):
+        SectionWriter(b'TEST', 1).write(self.filename)
+
+        class BrokenFile:
+            def read(self, size=-1):
+                raise IOError('disk error')
+
+            def seek(self, offset, whence=os.SEEK_SET):
+                return 10
+        writer = SectionWriter(b'TEST', 1)
+        writer.add(BrokenFile())
+        with self.assertRaises(IOError):
+            writer.write(self.filename)
+        self.assertEqual(['test.dat'], os.listdir(self.test_dir.name))
+        SectionReader(self.filename, b'TEST', 1)
+
+
+class StringTableTest(unittest.TestCase):
+    def test_find(self):
+        table = StringTable(*StringTable.build(['apple', 'banana', 'çay']))
+        self.assertEqual(3, len(table))
+        self.assertEqual('çay', table[2])
+        self.assertEqual(1, table.find('banana'))
+        self.assertIsNone(table.find('cherry'))
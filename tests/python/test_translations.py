@@ -0,0 +1,124 @@
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import unittest
+from dragonfly.translations import JournaledDict, TranslationDictManager
+
+
+def add_translations(base_dir, prefix, count):
+    manager = TranslationDictManager(base_dir)
+    for i in range(count):
+        manager.add('tst', '{}{}'.format(prefix, i), 'translation', 'per')
+
+
+class TranslationDictManagerTest(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_add_and_delete(self):
+        manager = TranslationDictManager(self.test_dir)
+        manager.add('TST', 'Hello', 'hi', 'per')
+        manager.add('tst', 'world', 'earth', '')
+        self.assertTrue(manager.delete('tst', 'world'))
+        self.assertFalse(manager.delete('tst', 'world'))
+        self.assertEqual({'hello': ['hi', 'PER']}, manager.get('tst'))
+        # a new manager replays the journal
+        self.assertEqual({'hello': ['hi', 'PER']}, TranslationDictManager(self.test_dir).get('tst'))
+
+    def test_journal_appends(self):
+        manager = TranslationDictManager(self.test_dir)
+        manager.save('tst', {'hello': ['hi', '']})
+        manager.add('tst', 'world', 'earth', '')
+        with open(manager.get_filename('tst'), 'r', encoding='utf8') as fp:
+            self.assertEqual({'hello': ['hi', '']}, json.load(fp))
+        with open(os.path.join(self.test_dir, 'tst.journal'), 'r', encoding='utf8') as fp:
+            self.assertEqual(['["world", ["earth", ""]]\n'], fp.readlines())
+
+    def test_partial_line(self):
+        manager = TranslationDictManager(self.test_dir)
+        manager.add('tst', 'hello', 'hi', '')
+        with open(os.path.join(self.test_dir, 'tst.journal'), 'a', encoding='utf8') as fp:
+            fp.write('["world", ["ea')
+        other = TranslationDictManager(self.test_dir)
+        self.assertEqual({'hello': ['hi', '']}, other.get('tst'))
+        # the partial line is replaced by the next change
+        other.add('tst', 'sun', 'star', '')
+        self.assertEqual({'hello': ['hi', ''], 'sun': ['star', '']}, TranslationDictManager(self.test_dir).get('tst'))
+
+    def test_compact(self):
+        manager = TranslationDictManager(self.test_dir)
+        manager.add('tst', 'hello', 'hi', '')
+        version = manager.version('tst')
+        manager.compact('tst')
+        self.assertNotEqual(version, manager.version('tst'))
+        self.assertEqual(0, os.path.getsize(os.path.join(self.test_dir, 'tst.journal')))
+        with open(manager.get_filename('tst'), 'r', encoding='utf8') as fp:
+            self.assertEqual({'hello': ['hi', '']}, json.load(fp))
+
+    def test_compact_after(self):
+        store = JournaledDict(os.path.join(self.test_dir, 'tst.json'))
+        store.COMPACT_AFTER = 3
+        for i in range(4):
+            store.update([(str(i), ['', ''])])
+        self.assertEqual(0, os.path.getsize(store.journal_filename))
+        self.assertEqual(4, len(JournaledDict(store.filename).copy()))
+
+    def test_version(self):
+        manager = TranslationDictManager(self.test_dir)
+        version = manager.version('tst')
+        self.assertEqual(version, manager.version('tst'))
+        # another process writing changes the version without this manager reading the files
+        TranslationDictManager(self.test_dir).add('tst', 'hello', 'hi', '')
+        self.assertNotEqual(version, manager.version('tst'))
+        version = manager.version('tst')
+        TranslationDictManager(self.test_dir).delete('tst', 'hello')
+        self.assertNotEqual(version, manager.version('tst'))
+
+    def test_sees_other_managers(self):
+        manager1 = TranslationDictManager(self.test_dir)
+        manager2 = TranslationDictManager(self.test_dir)
+        manager1.add('tst', 'hello', 'hi', '')
+        manager2.add('tst', 'world', 'earth', '')
+        self.assertEqual({'hello': ['hi', ''], 'world': ['earth', '']}, manager1.get('tst'))
+        manager2.compact('tst')
+        manager1.delete('tst', 'hello')
+        self.assertEqual({'world': ['earth', '']}, manager2.get('tst'))
+
+    def test_concurrent_processes(self):
+        processes = [multiprocessing.Process(target=add_translations, args=(self.test_dir, prefix, 50))
+                     for prefix in 'abc']
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        self.assertEqual(150, len(TranslationDictManager(self.test_dir).get('tst')))
+
+    def test_import_json(self):
+        manager = TranslationDictManager(self.test_dir)
+        manager.add('tst', 'hello', 'hi', '')
+        count = manager.import_json('tst', {'hello': ['hey', ''], 'world': ['earth', '']})
+        self.assertEqual(1, count)
+        self.assertEqual({'hello': ['hi', ''], 'world': ['earth', '']}, manager.get('tst'))
+
+    def test_import_tsv_repeated_phrase(self):
+        filename = os.path.join(self.test_dir, 'in.tsv')
+        with open(filename, 'w', encoding='utf8') as fp:
+            fp.write('hello\thi\nworld\tearth\tLOC\nhello\they\n')
+        manager = TranslationDictManager(self.test_dir)
+        self.assertEqual(2, manager.import_tsv('tst', filename))
+        self.assertEqual({'hello': ['hi', ''], 'world': ['earth', 'LOC']}, manager.get('tst'))
+        self.assertEqual(3, manager.import_tsv('tst', filename, force=True))
+        self.assertEqual(['hey', ''], manager.get('tst')['hello'])
+
+    def test_export(self):
+        manager = TranslationDictManager(self.test_dir)
+        manager.add('tst', 'hello', 'hi', 'per')
+        filename = os.path.join(self.test_dir, 'out.tsv')
+        self.assertEqual(1, manager.export('tst', filename))
+        with open(filename, 'r', encoding='utf8') as fp:
+            self.assertEqual('hello\thi\tPER\n', fp.read())
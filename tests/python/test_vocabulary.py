@@ -0,0 +1,117 @@
+import itertools
+import random
+import re
+import unittest
+from dragonfly.vocabulary import TrigramIndex, Vocabulary, deletes, edit_distance, glob_literals, regex_literals
+
+
+class VocabularyTest(unittest.TestCase):
+    TERMS = sorted(['kabul', 'kabula', 'kaul', 'islamabad', 'abad', 'hyderabad', 'bad', 'mary', 'maryland'])
+
+    def setUp(self):
+        self.vocab = Vocabulary(self.TERMS)
+
+    def test_with_prefix(self):
+        self.assertEqual(['kabul', 'kabula'], list(self.vocab.with_prefix('kab')))
+        self.assertEqual([], list(self.vocab.with_prefix('z')))
+
+    def test_with_suffix(self):
+        self.assertEqual({'abad', 'bad', 'hyderabad', 'islamabad'}, set(self.vocab.with_suffix('bad')))
+        self.assertEqual(['hyderabad'], list(self.vocab.with_suffix('rabad')))
+
+    def test_match_anchored(self):
+        self.assertEqual(['mary', 'maryland'], self.vocab.match('mary*'))
+        self.assertEqual({'hyderabad', 'islamabad'}, set(self.vocab.match('*?abad')))
+        self.assertEqual(['kabul', 'kabula'], self.vocab.match('ka?ul*'))
+        self.assertEqual(['kaul'], self.vocab.match('ka[u]l'))
+
+    def test_match_unanchored(self):
+        self.assertEqual(['kabul', 'kabula'], self.vocab.match('*bul*'))
+
+    def test_match_with_trigrams(self):
+        self.assertEqual(['hyderabad'], self.vocab.match('*r*abad'))
+        self.assertEqual(['islamabad'], self.vocab.match('*lam*bad'))
+        self.assertEqual([], self.vocab.match('*xyz*'))
+
+    def test_search(self):
+        self.assertEqual(['abad', 'hyderabad', 'islamabad'], self.vocab.search('aba'))
+        self.assertEqual(['kabul', 'kabula', 'kaul'], self.vocab.search('^KA.*L'))
+        self.assertEqual(['kabul', 'kabula', 'mary', 'maryland'], self.vocab.search('(bul|ary)'))
+
+
+class TrigramIndexTest(unittest.TestCase):
+    def test_candidates(self):
+        index = TrigramIndex.build(['abad', 'bad', 'hyderabad', 'islamabad'])
+        self.assertEqual([0, 2, 3], index.candidates(['abad']))
+        self.assertEqual([3], index.candidates(['lam', 'bad']))
+        self.assertEqual([], index.candidates(['zzz']))
+        self.assertIsNone(index.candidates(['ab']))
+        self.assertIsNone(index.candidates(['bad'], limit=4))
+
+    def test_glob_literals(self):
+        self.assertEqual(['stem'], glob_literals('*stem*'))
+        self.assertEqual(['ab', 'efg', 'hij'], glob_literals('ab[cd]efg?hij'))
+        self.assertEqual(['[abc'], glob_literals('[abc'))
+
+    def test_regex_literals(self):
+        self.assertEqual(['ab', 'cde'], regex_literals('ab+cde'))
+        self.assertEqual(['abc'], regex_literals('x{2,3}abc'))
+        self.assertEqual(['baz'], regex_literals('(foo|bar)baz'))
+        self.assertEqual([], regex_literals('foo|bar'))
+        self.assertEqual(['def.ghi'], regex_literals(r'[abc]def\.ghi'))
+        self.assertEqual(['colo', 'r'], regex_literals('colou?r'))
+        self.assertEqual(['bc'], regex_literals(r'\x61bc'))
+        self.assertEqual(['bc'], regex_literals(r'\u0061bc'))
+        self.assertEqual(['bc'], regex_literals(r'\N{LATIN SMALL LETTER A}bc'))
+        self.assertEqual(['bc'], regex_literals(r'\141bc'))
+        self.assertEqual([], regex_literals('(?x)a b c'))
+
+    def test_search_matches_scan(self):
+        random.seed(0)
+        terms = sorted({''.join(random.choice('abc .') for _ in range(random.randint(1, 8))) for _ in range(500)})
+        terms += ['abc', 'xabcx', 'a\\bc']
+        vocab = Vocabulary(sorted(terms))
+        patterns = [r'\x61bc', r'\u0061bc', r'\U00000061bc', r'\N{LATIN SMALL LETTER A}bc', r'\141bc', r'\0abc',
+                    r'(a)\1bc', r'\dabc', r'\babc', r'a\.bc', r'a\\bc', '(?x)a b c', 'ab+c', 'a{1,2}bc', 'ab?c',
+                    '[ab]bc', 'abc$', '^abc', 'a.c']
+        for pattern in patterns:
+            regex = re.compile(pattern, re.IGNORECASE)
+            expected = [term for term in vocab.terms if regex.search(term)]
+            self.assertEqual(expected, vocab.search(pattern), pattern)
+        verbose = re.compile('a b c', re.IGNORECASE | re.VERBOSE)
+        self.assertEqual([term for term in vocab.terms if verbose.search(term)], vocab.search(verbose))
+
+
+class DeletionIndexTest(unittest.TestCase):
+    TERMS = sorted(['muhammad', 'mohammed', 'mohamed', 'muhamad', 'mahmoud', 'ahmed', 'mohammadabad'])
+
+    def test_similar(self):
+        vocab = Vocabulary(self.TERMS)
+        self.assertEqual(['muhammad', 'muhamad'], vocab.similar('muhammad', 1))
+        self.assertEqual(['mohammed', 'mohamed', 'muhammad'], vocab.similar('mohammed', 2))
+        self.assertEqual(['ahmed'], vocab.similar('ahemd', 1))
+        self.assertEqual([], vocab.similar('xyz', 2))
+
+    def test_deletes(self):
+        self.assertEqual({'abc', 'bc', 'ac', 'ab'}, deletes('abc', 1))
+        self.assertEqual({'abc', 'bc', 'ac', 'ab', 'a', 'b', 'c'}, deletes('abc', 2))
+        self.assertEqual({'ab', 'a', 'b', ''}, deletes('ab', 2))
+
+    def test_similar_matches_scan(self):
+        random.seed(0)
+        words = {''.join(random.choice('abcd') for _ in range(random.randint(1, 9))) for _ in range(1000)}
+        words.update(''.join(chars) for length in (1, 2) for chars in itertools.product('abcd', repeat=length))
+        vocab = Vocabulary(sorted(words))
+        queries = sorted(words)[::25] + ['a', 'ed', 'x', 'abcdabcdab']
+        for word in queries:
+            for max_distance in (1, 2):
+                expected = {term for term in vocab.terms if edit_distance(word, term, max_distance) <= max_distance}
+                self.assertEqual(expected, set(vocab.similar(word, max_distance)), (word, max_distance))
+        self.assertIn('b', Vocabulary(['b', 'bcd']).similar('a', 1))
+        self.assertEqual(['a', 'ab'], Vocabulary(['a', 'ab', 'abc']).similar('ed', 2))
+
+    def test_edit_distance(self):
+        self.assertEqual(0, edit_distance('kabul', 'kabul', 2))
+        self.assertEqual(1, edit_distance('kabul', 'kaubl', 2))
+        self.assertEqual(2, edit_distance('kabul', 'kbual', 2))
+        self.assertEqual(3, edit_distance('kabul', 'islamabad', 2))